@@ -0,0 +1,220 @@
+"""Versioned JSON API (/api/v1).
+
+Read-only endpoints for the main tables, for integrations and the field app:
+
+    GET /api/v1/<resource>         One page of rows
+    GET /api/v1/<resource>/<id>    One row
+
+List parameters:
+    limit: Rows per page (default API_PAGE_SIZE, at most API_MAX_PAGE_SIZE)
+    after / before: Cursors from a previous page's next_cursor / prev_cursor
+    fields: Comma-separated columns to return (default all)
+    start_date / end_date: Inclusive ISO date range on the resource's date column
+    <column>=<value>: Equality filter on foreign key, enum and boolean columns,
+        e.g. /api/v1/timesheets?employee_id=3 or /api/v1/invoices?status=PAID
+
+Rows are read as plain Core rows of the selected columns, never as ORM
+objects, and pages use the same keyset pagination as the list pages. Every
+response carries an ETag of its body, so a client revalidating with
+If-None-Match gets an empty 304 when nothing changed.
+
+The API uses the web session login; requests without one get a 401.
+
+Configuration (app.config):
+    API_PAGE_SIZE: Default rows per page (default 50)
+    API_MAX_PAGE_SIZE: Largest page a client may ask for (default 500)
+"""
+import enum
+from datetime import date, datetime, time
+
+from flask import Blueprint, current_app, jsonify, request, session
+from werkzeug.exceptions import HTTPException
+
+from database import read_only_view
+from models import db, Employee, Project, Timesheet, Invoice, Expense, Material, PayrollPayment
+from pagination import keyset_paginate, sort_keys, InvalidCursor
+
+api_v1 = Blueprint('api_v1', __name__, url_prefix='/api/v1')
+
+
+class ApiError(Exception):
+    """Error returned to the client as {"error": message} with `status`."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+class ApiResource:
+    """One table exposed by the API.
+
+    Args:
+        model: Mapped class whose table columns are the resource fields
+        order_by: List ordering, ending with the primary key
+        date_column: Column start_date/end_date filter on
+    """
+
+    def __init__(self, model, order_by, date_column):
+        self.model = model
+        self.order_by = order_by
+        self.date_column = date_column
+        self.columns = {column.key: column for column in model.__table__.columns}
+        self.filters = {key: column for key, column in self.columns.items()
+                        if column.foreign_keys or isinstance(column.type, (db.Enum, db.Boolean))}
+
+    def select_columns(self, fields):
+        """Columns to select for the requested fields, plus the sort keys the
+        cursors are built from."""
+        columns = [self.columns[name] for name in fields]
+        for column, _ in sort_keys(self.order_by):
+            if column.key not in fields:
+                columns.append(self.columns[column.key])
+        return columns
+
+
+# Keyed by URL name
+API_RESOURCES = {
+    'employees': ApiResource(Employee, (Employee.name, Employee.id), Employee.hire_date),
+    'projects': ApiResource(Project, (Project.start_date.desc(), Project.id.desc()), Project.start_date),
+    'timesheets': ApiResource(Timesheet, (Timesheet.date.desc(), Timesheet.id.desc()), Timesheet.date),
+    'invoices': ApiResource(Invoice, (Invoice.invoice_date.desc(), Invoice.id.desc()), Invoice.invoice_date),
+    'expenses': ApiResource(Expense, (Expense.date.desc(), Expense.id.desc()), Expense.date),
+    'materials': ApiResource(Material, (Material.purchase_date.desc(), Material.id.desc()), Material.purchase_date),
+    'payroll_payments': ApiResource(PayrollPayment, (PayrollPayment.payment_date.desc(), PayrollPayment.id.desc()),
+                                    PayrollPayment.payment_date),
+}
+
+
+def init_api(app):
+    """Set the API defaults and register the blueprint on the Flask app."""
+    app.config.setdefault('API_PAGE_SIZE', 50)
+    app.config.setdefault('API_MAX_PAGE_SIZE', 500)
+    app.register_blueprint(api_v1)
+
+
+# --- Request parsing ---
+def _resource(name):
+    resource = API_RESOURCES.get(name)
+    if resource is None:
+        raise ApiError(f'Unknown resource: {name}', 404)
+    return resource
+
+
+def _fields(resource):
+    requested = request.args.get('fields')
+    if not requested:
+        return list(resource.columns)
+    fields = [name.strip() for name in requested.split(',') if name.strip()]
+    unknown = [name for name in fields if name not in resource.columns]
+    if unknown:
+        raise ApiError(f"Unknown field(s): {', '.join(unknown)}")
+    return fields
+
+
+def _parse_value(column, value):
+    """Filter value from the query string, as the column's Python type."""
+    try:
+        if isinstance(column.type, db.Enum):
+            # By name (PAID) or by label (Paid)
+            for member in column.type.enum_class:
+                if value.upper() == member.name or value == member.value:
+                    return member
+            raise ValueError(value)
+        if isinstance(column.type, db.Boolean):
+            return {'true': True, '1': True, 'false': False, '0': False}[value.lower()]
+        if isinstance(column.type, db.Date):
+            return date.fromisoformat(value)
+        return column.type.python_type(value)
+    except (KeyError, ValueError):
+        raise ApiError(f'Invalid value for {column.key}: {value}')
+
+
+def _filters(resource):
+    criteria = []
+    for name, column in resource.filters.items():
+        if name in request.args:
+            criteria.append(column == _parse_value(column, request.args[name]))
+    for name, compare in (('start_date', resource.date_column.__ge__), ('end_date', resource.date_column.__le__)):
+        if request.args.get(name):
+            criteria.append(compare(_parse_value(resource.date_column.expression, request.args[name])))
+    return criteria
+
+
+def _limit():
+    limit = request.args.get('limit', current_app.config['API_PAGE_SIZE'], type=int)
+    if limit is None or limit < 1:
+        raise ApiError('limit must be a positive integer')
+    return min(limit, current_app.config['API_MAX_PAGE_SIZE'])
+
+
+# --- Serialization ---
+def _json_value(value):
+    if isinstance(value, enum.Enum):
+        return value.value
+    if isinstance(value, (date, datetime, time)):
+        return value.isoformat()
+    return value
+
+
+def _serialize(row, fields):
+    mapping = row._mapping
+    return {name: _json_value(mapping[name]) for name in fields}
+
+
+def _json_response(payload):
+    """JSON response with an ETag of its body, answered with 304 when the
+    client already has it."""
+    response = jsonify(payload)
+    response.add_etag()
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
+
+
+# --- Views ---
+@api_v1.before_request
+def _require_login():
+    if 'user_id' not in session:
+        raise ApiError('Authentication required', 401)
+
+
+@api_v1.errorhandler(ApiError)
+def _api_error(error):
+    return jsonify(error=error.message), error.status
+
+
+@api_v1.errorhandler(HTTPException)
+def _http_error(error):
+    return jsonify(error=error.description), error.code
+
+
+@api_v1.route('/<resource_name>')
+@read_only_view
+def list_resource(resource_name):
+    """One page of a resource's rows."""
+    resource = _resource(resource_name)
+    fields = _fields(resource)
+    query = db.select(*resource.select_columns(fields)).where(*_filters(resource))
+    try:
+        page = keyset_paginate(query, resource.order_by, after=request.args.get('after'),
+                               before=request.args.get('before'), per_page=_limit())
+    except InvalidCursor:
+        raise ApiError('Invalid page cursor')
+    return _json_response({
+        'data': [_serialize(row, fields) for row in page],
+        'next_cursor': page.next_cursor,
+        'prev_cursor': page.prev_cursor,
+    })
+
+
+@api_v1.route('/<resource_name>/<int:id>')
+@read_only_view
+def get_resource(resource_name, id):
+    """One row of a resource."""
+    resource = _resource(resource_name)
+    fields = _fields(resource)
+    columns = [resource.columns[name] for name in fields]
+    row = db.session.execute(db.select(*columns).where(resource.columns['id'] == id)).first()
+    if row is None:
+        raise ApiError(f'{resource_name} {id} not found', 404)
+    return _json_response({'data': _serialize(row, fields)})
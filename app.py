@@ -1,5 +1,5 @@
 import os
-from flask import Flask, render_template, request, redirect, url_for, flash, session, abort, send_file, jsonify, after_this_request
+from flask import Flask, render_template, request, redirect, url_for, flash, session, abort, send_file, jsonify, after_this_request, Response, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_wtf import CSRFProtect
 from datetime import date, timedelta, datetime
@@ -7,15 +7,35 @@ from dotenv import load_dotenv
 from flask_bootstrap import Bootstrap5
 from functools import wraps
 import flask_excel as excel
-from fpdf import FPDF
 import tempfile
 import io
-import pandas as pd
+import csv
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
 import json
 import uuid
 import shutil
-
-from models import db, Employee, Project, Timesheet, Material, Expense, PayrollPayment, PayrollDeduction, Invoice, ProjectStatus, PaymentMethod, PaymentStatus, User, DeductionType, AccountsPayable, PaidAccount, MonthlyExpense, ExpenseCategory
+import zipfile
+import click
+
+from backups import (init_backups, backup_dir, online_backup, open_download_backup, gzip_chunks, gunzip_to, check_backup, replace_database,
+                     BackupError, backup_points, run_scheduled_backup, restore_backup_point)
+from dashboard import init_dashboard_cache, dashboard_context, register_dashboard_events
+from timeseries import time_series, last_buckets, period_range, totals_by, bucket_expr
+from pagination import init_pagination, paginate_request, group_summary
+from api import init_api
+from timesheet_import import import_timesheets, ImportFileError
+from crew_week import CrewWeek, cell_name
+from database import init_database, read_only_session, read_only_view
+from models import db, Employee, Project, Timesheet, Material, Expense, PayrollPayment, PayrollDeduction, Invoice, ProjectStatus, PaymentMethod, PaymentStatus, User, DeductionType, AccountsPayable, PaidAccount, MonthlyExpense, ExpenseCategory, ProjectFinancial, ReportJob
+from rollups import (project_rollups, project_rollup, employee_hours_query, refresh_project_financials,
+                     register_financials_events, init_project_financials)
+from loading import loading_options, init_query_budgets
+from profiling import init_profiling, summarize_profile_log
+from jobs import report_job, init_report_jobs, submit_job, map_in_pool, job_status, job_progress, fail_orphaned_jobs
+from pdf_render import ErpPDF, StaticLayout, write_table_report
+from invoice_cache import init_invoice_cache, cached_invoice_pdf, invoice_pdf_path
 from forms import EmployeeForm, ProjectForm, TimesheetForm, MaterialForm, ExpenseForm, PayrollPaymentForm, PayrollDeductionForm, InvoiceForm, LoginForm, AccountsPayableForm, PaidAccountForm, MonthlyExpenseForm
 
 load_dotenv()  # Load environment variables if needed
@@ -28,13 +48,26 @@ app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'a-default-hardcoded-sec
 instance_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance')
 if not os.path.exists(instance_path):
     os.makedirs(instance_path)
-app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{os.path.join(instance_path, "erp.db")}'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', f'sqlite:///{os.path.join(instance_path, "erp.db")}')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Per-request SQL profiling log (see profiling.py)
+app.config['SQL_PROFILE_LOG'] = os.environ.get('SQL_PROFILE_LOG', os.path.join(instance_path, 'logs', 'sql_profile.jsonl'))
 
 # --- Initialize Extensions ---
-db.init_app(app)
+init_database(app, db)  # SQLite pragmas and the read-only report engine
+register_financials_events(db.session)  # Keep project_financials in sync with every write
+register_dashboard_events(db.session)  # Drop the cached dashboard when its figures change
+init_project_financials(app)  # Create the summary table on databases that predate it
 csrf = CSRFProtect(app)
 bootstrap = Bootstrap5(app)  # Initialize Bootstrap5
+init_profiling(app)  # Server-Timing headers and JSONL query log per request
+init_query_budgets(app)  # Per-view query budgets (enforced in tests)
+init_report_jobs(app)  # Background PDF and export jobs
+init_invoice_cache(app)  # Rendered customer invoice PDFs, keyed by content
+init_backups(app)  # Online database backups
+init_dashboard_cache(app)  # Per-process dashboard context cache
+init_pagination(app)  # Keyset pagination of the list pages
+init_api(app)  # JSON API under /api/v1
 excel.init_excel(app)  # Initialize Excel export
 
 # --- Authentication utilities ---
@@ -62,230 +95,131 @@ def get_week_start_end(dt=None):
     return start, end
 
 # --- Export Helpers ---
+# Rows fetched per round trip when exports page through a query
+EXPORT_BATCH_SIZE = 1000
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+class ExportFilterError(ValueError):
+    """Raised for an export query-string filter that can't be parsed."""
+
+
+def _parse_enum(enum_class, value, label):
+    """Match an enum by name or value, case-insensitively ('IN_PROGRESS', 'in progress')."""
+    wanted = value.strip().lower()
+    for member in enum_class:
+        if wanted in (member.name.lower(), member.value.lower()):
+            return member
+    raise ExportFilterError(f'Invalid {label}: {value}')
+
+
+def get_export_filters(args=None):
+    """Read the optional export filters from the query string.
+    
+    Supported parameters: start_date and end_date (YYYY-MM-DD, inclusive),
+    project_id, employee_id, status and payment_method. Status is returned as
+    the raw string because its enum depends on the export.
+    
+    Args:
+        args: Mapping to read instead of request.args (background jobs)
+    Returns:
+        dict with one key per parameter, None when not given
+    Raises:
+        ExportFilterError: if a value is malformed
+    """
+    args = request.args if args is None else args
+    filters = {}
+    for key in ('start_date', 'end_date'):
+        value = args.get(key, '').strip()
+        try:
+            filters[key] = datetime.strptime(value, '%Y-%m-%d').date() if value else None
+        except ValueError:
+            raise ExportFilterError(f'Invalid {key.replace("_", " ")}: {value}. Use YYYY-MM-DD.')
+    for key in ('project_id', 'employee_id'):
+        value = args.get(key, '').strip()
+        if value and not value.isdigit():
+            raise ExportFilterError(f'Invalid {key.replace("_", " ")}: {value}')
+        filters[key] = int(value) if value else None
+    filters['status'] = args.get('status', '').strip() or None
+    payment_method = args.get('payment_method', '').strip()
+    filters['payment_method'] = _parse_enum(PaymentMethod, payment_method, 'payment method') if payment_method else None
+    return filters
+
+
+def filter_date_range(query, column, filters):
+    """Restrict `query` to the filters' start_date..end_date on `column`."""
+    if filters['start_date']:
+        query = query.filter(column >= filters['start_date'])
+    if filters['end_date']:
+        query = query.filter(column <= filters['end_date'])
+    return query
+
+def write_excel_report(data, output):
+    """Write row dicts to an .xlsx file (path or binary file object).
+    
+    Rows are written through openpyxl's write-only workbook, which spools them
+    to disk as they are appended, so `data` can be a generator over a query of
+    any size. The header comes from the first row's keys.
+    """
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Sheet1')
+    header_font = Font(bold=True)
+    
+    for count, row in enumerate(data):
+        if count == 0:
+            header = []
+            for key in row:
+                cell = WriteOnlyCell(sheet, value=key)
+                cell.font = header_font
+                header.append(cell)
+            sheet.append(header)
+        sheet.append(list(row.values()))
+    workbook.save(output)
+
 def export_to_excel(data, prefix):
     """Helper function to export data to Excel"""
-    df = pd.DataFrame(data)
-    excel_file = io.BytesIO()
-    df.to_excel(excel_file, index=False, engine='openpyxl')
+    # The finished .xlsx workbook goes to an anonymous temporary file, which
+    # the OS removes once it has been sent and closed
+    excel_file = tempfile.TemporaryFile()
+    write_excel_report(data, excel_file)
     excel_file.seek(0)
     
     return send_file(
         excel_file,
         as_attachment=True,
         download_name=f'{prefix}_report.xlsx',
-        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        mimetype=XLSX_MIMETYPE
     )
 
+# Project reports need specific column widths due to text-heavy columns like Location
+PROJECT_PDF_COLUMN_WIDTHS = {
+    'Project ID': 25,
+    'Name': 35,
+    'Client': 35,
+    'Location': 40,  # Location often has long addresses causing overlap
+    'Start Date': 22,
+    'End Date': 22,
+    'Status': 20,
+    'Contract Value': 25,
+    'Labor Cost': 22,
+    'Material Cost': 22,
+    'Other Expenses': 25,
+    'Total Cost': 22,
+    'Profit': 22,
+    'Profit Margin': 22
+}
+
+def write_pdf_report(data, title, pdf_path):
+    """Write row dicts to a PDF table with totals for numerical fields.
+    `data` is read once, so it can be a generator over a query."""
+    fixed_widths = PROJECT_PDF_COLUMN_WIDTHS if title == 'Projects' else None
+    write_table_report(data, title, pdf_path, fixed_widths=fixed_widths)
+
 def export_to_pdf(data, title, filename):
     """Helper function to export data to PDF with totals for numerical fields"""
-    # Initialize PDF with Unicode support
-    pdf = FPDF()
-    pdf.add_page('L')  # Landscape orientation for more columns
-    
-    # Add Unicode font support
-    pdf.add_font('DejaVu', '', '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf', uni=True)
-    pdf.add_font('DejaVu', 'B', '/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf', uni=True)
-    pdf.add_font('DejaVu', 'I', '/usr/share/fonts/truetype/dejavu/DejaVuSansMono-Oblique.ttf', uni=True)
-    
-    # Add title
-    pdf.set_font('DejaVu', 'B', 16)
-    pdf.cell(0, 10, f'{title} Report', 0, 1, 'C')
-    pdf.ln(5)
-    
-    # Add header
-    if data:
-        # Initialize totals dictionary for numerical columns
-        totals = {}
-        column_keys = list(data[0].keys())
-        
-        # Set PDF metrics
-        page_width = 275  # Landscape page width in mm
-        margin = 10  # Left and right margins
-        usable_width = page_width - (2 * margin)  # Usable width for columns
-        
-        # Configure custom column widths based on report type
-        if title == 'Projects':
-            # Project reports need specific column widths due to text-heavy columns like Location
-            col_widths = {
-                'Project ID': 25,
-                'Name': 35,
-                'Client': 35,
-                'Location': 40,  # Location often has long addresses causing overlap
-                'Start Date': 22,
-                'End Date': 22,
-                'Status': 20,
-                'Contract Value': 25,
-                'Labor Cost': 22,
-                'Material Cost': 22,
-                'Other Expenses': 25,
-                'Total Cost': 22,
-                'Profit': 22,
-                'Profit Margin': 22
-            }
-            
-            # Handle missing or additional columns
-            column_widths = []
-            remaining_width = usable_width
-            
-            # First calculate width for known columns
-            assigned_columns = 0
-            for key in column_keys:
-                if key in col_widths:
-                    column_widths.append(col_widths[key])
-                    remaining_width -= col_widths[key]
-                    assigned_columns += 1
-                else:
-                    column_widths.append(None)  # Placeholder
-            
-            # Distribute remaining width evenly for any unassigned columns
-            if assigned_columns < len(column_keys):
-                unassigned = len(column_keys) - assigned_columns
-                default_width = max(18, remaining_width / unassigned) if unassigned > 0 else 20
-                
-                # Replace placeholders with calculated width
-                for i, width in enumerate(column_widths):
-                    if width is None:
-                        column_widths[i] = default_width
-        else:
-            # For other reports, calculate widths more dynamically
-            
-            # Analyze content to determine optimal column widths
-            col_content_length = {}
-            for key in column_keys:
-                # Start with header length
-                col_content_length[key] = len(str(key))
-                
-                # Check data values length
-                for item in data:
-                    val_len = len(str(item.get(key, '')))
-                    if val_len > col_content_length[key]:
-                        col_content_length[key] = min(val_len, 30)  # Cap at 30 chars
-            
-            # Calculate width proportions
-            total_content_length = sum(col_content_length.values())
-            column_widths = []
-            
-            for key in column_keys:
-                # Calculate proportional width with minimum of 15mm
-                prop = col_content_length[key] / total_content_length if total_content_length > 0 else 1/len(column_keys)
-                width = max(15, prop * usable_width)
-                
-                # Cap at 45mm for very wide columns
-                width = min(width, 45)
-                column_widths.append(width)
-            
-            # Adjust if total exceeds available width
-            total_width = sum(column_widths)
-            if total_width > usable_width:
-                scale_factor = usable_width / total_width
-                column_widths = [w * scale_factor for w in column_widths]
-        
-        # Add header row
-        pdf.set_font('DejaVu', 'B', 8)
-        for i, key in enumerate(column_keys):
-            col_width = column_widths[i]
-            
-            # Truncate header text if necessary - allow longer text for wider columns
-            header_text = str(key)
-            max_chars = max(10, int(col_width / 2))  # Roughly 2mm per character
-            if len(header_text) > max_chars:
-                header_text = header_text[:max_chars-3] + '...'
-                
-            pdf.cell(col_width, 10, header_text, 1, 0, 'C')
-            # Initialize totals for columns that might contain numbers
-            totals[key] = 0
-        pdf.ln()
-        
-        # Add data rows and calculate totals for numerical fields
-        pdf.set_font('DejaVu', '', 8)
-        for item in data:
-            for i, key in enumerate(column_keys):
-                col_width = column_widths[i]
-                value = item.get(key, '')
-                
-                # Ensure all values are properly encoded as strings and truncate if too long
-                cell_value = str(value)
-                max_chars = max(10, int(col_width / 1.8))  # Allow slightly more chars in data cells
-                if len(cell_value) > max_chars:
-                    cell_value = cell_value[:max_chars-3] + '...'
-                
-                # Determine text alignment based on content
-                align = 'R' if any(c in str(value) for c in ['$', '%']) or isinstance(value, (int, float)) else 'L'
-                
-                pdf.cell(col_width, 10, cell_value, 1, 0, align)
-                
-                # Update total if the value is numerical (uses string checking since data might be pre-formatted)
-                string_value = str(value)
-                if string_value.replace('.', '', 1).replace(',', '', 1).replace('$', '', 1).replace('-', '', 1).isdigit():
-                    # Extract and clean the numerical value
-                    clean_value = string_value.replace('$', '').replace(',', '')
-                    try:
-                        # Try to convert to float and add to total
-                        totals[key] += float(clean_value)
-                    except ValueError:
-                        pass
-                elif string_value.startswith('$') and len(string_value) > 1 and string_value[1:].replace('.', '', 1).replace(',', '', 1).isdigit():
-                    # Handle currency values starting with $
-                    clean_value = string_value.replace('$', '').replace(',', '')
-                    try:
-                        totals[key] += float(clean_value)
-                    except ValueError:
-                        pass
-            pdf.ln()
-        
-        # Add a separating line
-        pdf.ln(5)
-        pdf.line(10, pdf.get_y(), 285, pdf.get_y())
-        pdf.ln(2)
-        
-        # Add totals row with bold formatting
-        pdf.set_font('DejaVu', 'B', 8)
-        pdf.set_fill_color(240, 240, 240)  # Light gray background
-        
-        # Add total values for each column
-        for i, key in enumerate(column_keys):
-            col_width = column_widths[i]
-            
-            # First column or non-numeric columns
-            if i == 0 or totals[key] == 0:
-                cell_text = 'TOTALS' if i == 0 else ''
-                pdf.cell(col_width, 10, cell_text, 1, 0, 'L' if i == 0 else 'C', True)
-                continue
-                
-            # Format the total based on the column content
-            if any('$' in str(item.get(key, '')) for item in data):
-                # Currency format
-                formatted_total = f'${totals[key]:,.2f}'
-            elif any('hours' in str(key).lower() for item in data) or any('hrs' in str(key).lower() for item in data):
-                # Hours format - 2 decimal places
-                formatted_total = f'{totals[key]:.2f}'
-            elif any('%' in str(item.get(key, '')) for item in data):
-                # Percentage format
-                formatted_total = f'{totals[key]:.2f}%'
-            elif isinstance(totals[key], float):
-                # Regular float format
-                formatted_total = f'{totals[key]:,.2f}'
-            else:
-                # Integer format
-                formatted_total = f'{int(totals[key]):,}'
-            
-            # Truncate total value if too long
-            max_chars = max(10, int(col_width / 2))
-            if len(formatted_total) > max_chars:
-                formatted_total = formatted_total[:max_chars-3] + '...'
-            
-            pdf.cell(col_width, 10, formatted_total, 1, 0, 'R', True)
-        pdf.ln()
-        
-        # Add note about totals
-        pdf.ln(5)
-        pdf.set_font('DejaVu', 'I', 8)
-        pdf.cell(0, 10, 'Note: Totals are calculated for numerical fields only.', 0, 1, 'L')
-    
     # Create temp file and write PDF to it
     with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp:
         pdf_path = tmp.name
-        pdf.output(pdf_path)
+    write_pdf_report(data, title, pdf_path)
         
     # Return the created PDF file
     return send_file(
@@ -296,60 +230,99 @@ def export_to_pdf(data, title, filename):
     )
 
 def export_to_csv(data, prefix):
-    """Helper function to export data to CSV"""
-    df = pd.DataFrame(data)
-    csv_file = io.StringIO()
-    df.to_csv(csv_file, index=False)
-    csv_file.seek(0)
+    """Helper function to stream data to CSV as the rows are produced.
     
-    return send_file(
-        csv_file,
-        as_attachment=True,
-        download_name=f'{prefix}_report.csv',
-        mimetype='text/csv'
+    `data` can be any iterable of dicts (typically a generator paging through
+    a query); the header comes from the first row's keys.
+    """
+    def generate():
+        buffer = io.StringIO()
+        writer = None
+        for count, row in enumerate(data, 1):
+            if writer is None:
+                writer = csv.DictWriter(buffer, fieldnames=list(row.keys()), lineterminator='\n')
+                writer.writeheader()
+            writer.writerow(row)
+            # Send the header with the first row, then one chunk per batch
+            if count == 1 or count % EXPORT_BATCH_SIZE == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/csv',
+        headers={'Content-Disposition': f'attachment; filename={prefix}_report.csv'}
     )
 
+def write_csv_report(data, path):
+    """Write row dicts to a CSV file, as export_to_csv streams them."""
+    with open(path, 'w', newline='') as f:
+        writer = None
+        for row in data:
+            if writer is None:
+                writer = csv.DictWriter(f, fieldnames=list(row.keys()), lineterminator='\n')
+                writer.writeheader()
+            writer.writerow(row)
+
 # --- PDF Generation Functions ---
-def generate_customer_invoice_pdf(invoice_id):
+def customer_invoice_filename(invoice, project):
+    """Download name of a customer invoice PDF."""
+    return f'invoice_{invoice.id:03d}_{project.name.replace(" ", "_")}.pdf'
+
+# Customer invoice colors - more muted professional palette
+INVOICE_PRIMARY_COLOR = (30, 55, 90)     # Darker blue
+INVOICE_ACCENT_COLOR = (180, 30, 30)     # Darker red
+INVOICE_HIGHLIGHT_COLOR = (60, 100, 160) # Lighter blue
+INVOICE_TEXT_COLOR = (70, 70, 70)        # Dark gray for text
+INVOICE_LIGHT_FILL = (248, 248, 248)     # Very light gray for fills
+
+def new_customer_invoice_document():
+    """Empty A4 document with the fonts used by customer invoices."""
+    pdf = ErpPDF(orientation='P', unit='mm', format='A4', fonts=('', 'B'))
+    # The invoice is a fixed one-page layout; a long description must not
+    # push the rest of it onto another page
+    pdf.set_auto_page_break(False)
+    return pdf
+
+def render_customer_invoice_pdf(invoice, project):
     """
-    Generate a professional PDF invoice for customers with a compact, information-focused design.
+    Render a professional PDF invoice for customers with a compact, information-focused design.
     
     Args:
-        invoice_id: The ID of the invoice to generate a PDF for
+        invoice: The Invoice to render
+        project: The invoice's Project
         
     Returns:
-        A Flask send_file response with the PDF
+        The PDF document as bytes
     """
-    from models import Invoice, Project
-    from flask import send_file, after_this_request
-    from fpdf import FPDF
-    import tempfile
-    import os
+    pdf = new_customer_invoice_document()
+    draw_customer_invoice(pdf, invoice, project)
+    return pdf.output(dest='S').encode('latin1')
+
+def _draw_customer_invoice_layout(pdf):
+    """Static part of the customer invoice: everything but the invoice's own values.
     
-    invoice = Invoice.query.get_or_404(invoice_id)
-    project = Project.query.get_or_404(invoice.project_id)
+    Each value is left as an empty cell (keeping its border) and its position
+    recorded, so draw_customer_invoice can fill it in.
     
-    # Create PDF object (A4 size)
-    pdf = FPDF(orientation='P', unit='mm', format='A4')
-    pdf.add_page()
+    Returns:
+        dict of value name -> (x, y, width, height)
+    """
+    slots = {}
     
-    # Add Unicode font support
-    pdf.add_font('DejaVu', '', '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf', uni=True)
-    pdf.add_font('DejaVu', 'B', '/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf', uni=True)
+    def slot(name, w, h, border=0, ln=0):
+        x, y = pdf.get_x(), pdf.get_y()
+        slots[name] = (x, y, w or pdf.w - pdf.r_margin - x, h)
+        pdf.cell(w, h, '', border, ln)
     
     # Set tighter margins for more space
     pdf.set_margins(10, 10, 10)
     
-    # Define colors - more muted professional palette
-    primary_color = (30, 55, 90)     # Darker blue
-    accent_color = (180, 30, 30)     # Darker red
-    highlight_color = (60, 100, 160) # Lighter blue
-    text_color = (70, 70, 70)        # Dark gray for text
-    light_fill = (248, 248, 248)     # Very light gray for fills
-    
     # Header with company info - compact design with horizontal layout
     # Create a header box
-    pdf.set_fill_color(primary_color[0], primary_color[1], primary_color[2])
+    pdf.set_fill_color(*INVOICE_PRIMARY_COLOR)
     pdf.rect(10, 10, 190, 14, 'F')
     
     # Company name in white on blue background
@@ -368,7 +341,7 @@ def generate_customer_invoice_pdf(invoice_id):
     # Company address below header
     pdf.set_xy(10, 26)
     pdf.set_font('DejaVu', '', 9)
-    pdf.set_text_color(text_color[0], text_color[1], text_color[2])
+    pdf.set_text_color(*INVOICE_TEXT_COLOR)
     pdf.cell(95, 4, '968 WPA RD, Sumrall Ms, 39482', 0, 0, 'L')
     
     # Invoice number and date on right
@@ -376,25 +349,25 @@ def generate_customer_invoice_pdf(invoice_id):
     pdf.set_xy(105, 26)
     pdf.cell(40, 4, 'INVOICE #:', 0, 0, 'R')
     pdf.set_font('DejaVu', '', 9)
-    pdf.set_text_color(highlight_color[0], highlight_color[1], highlight_color[2])
-    pdf.cell(55, 4, f'{invoice.id:03d}', 0, 1, 'L')
+    pdf.set_text_color(*INVOICE_HIGHLIGHT_COLOR)
+    slot('invoice_number', 55, 4, ln=1)
     
     pdf.set_xy(105, 30)
     pdf.set_font('DejaVu', 'B', 9)
-    pdf.set_text_color(text_color[0], text_color[1], text_color[2])
+    pdf.set_text_color(*INVOICE_TEXT_COLOR)
     pdf.cell(40, 4, 'DATE:', 0, 0, 'R')
     pdf.set_font('DejaVu', '', 9)
-    pdf.set_text_color(highlight_color[0], highlight_color[1], highlight_color[2])
-    pdf.cell(55, 4, invoice.invoice_date.strftime('%m/%d/%Y'), 0, 1, 'L')
+    pdf.set_text_color(*INVOICE_HIGHLIGHT_COLOR)
+    slot('invoice_date', 55, 4, ln=1)
     
     # Client information section - two column layout
     pdf.ln(5)
-    pdf.set_text_color(primary_color[0], primary_color[1], primary_color[2])
+    pdf.set_text_color(*INVOICE_PRIMARY_COLOR)
     pdf.set_font('DejaVu', 'B', 10)
     pdf.cell(0, 6, 'CLIENT INFORMATION', 0, 1, 'L')
     
     # Horizontal line under section title
-    pdf.set_draw_color(primary_color[0], primary_color[1], primary_color[2])
+    pdf.set_draw_color(*INVOICE_PRIMARY_COLOR)
     pdf.line(10, pdf.get_y(), 200, pdf.get_y())
     pdf.ln(1)
     
@@ -404,71 +377,71 @@ def generate_customer_invoice_pdf(invoice_id):
     
     # Set up client info box with light background
     client_box_y = pdf.get_y()
-    pdf.set_fill_color(light_fill[0], light_fill[1], light_fill[2])
+    pdf.set_fill_color(*INVOICE_LIGHT_FILL)
     pdf.rect(10, client_box_y, 190, 28, 'F')
     
     # First column
     pdf.set_xy(12, client_box_y + 2)
     pdf.set_font('DejaVu', 'B', 8)
-    pdf.set_text_color(text_color[0], text_color[1], text_color[2])
+    pdf.set_text_color(*INVOICE_TEXT_COLOR)
     pdf.cell(20, line_height, 'NAME:', 0, 0)
     pdf.set_font('DejaVu', '', 9)
-    pdf.set_text_color(highlight_color[0], highlight_color[1], highlight_color[2])
-    pdf.cell(75, line_height, project.client_name, 0, 0)
+    pdf.set_text_color(*INVOICE_HIGHLIGHT_COLOR)
+    slot('client_name', 75, line_height)
     
     # Second column
     pdf.set_xy(107, client_box_y + 2)
     pdf.set_font('DejaVu', 'B', 8)
-    pdf.set_text_color(text_color[0], text_color[1], text_color[2])
+    pdf.set_text_color(*INVOICE_TEXT_COLOR)
     pdf.cell(20, line_height, 'PHONE:', 0, 0)
     pdf.set_font('DejaVu', '', 9)
-    pdf.set_text_color(highlight_color[0], highlight_color[1], highlight_color[2])
-    pdf.cell(70, line_height, invoice.client_phone or '', 0, 1)
+    pdf.set_text_color(*INVOICE_HIGHLIGHT_COLOR)
+    slot('client_phone', 70, line_height, ln=1)
     
     # First column - second row
     pdf.set_xy(12, client_box_y + 2 + line_height + 2)
     pdf.set_font('DejaVu', 'B', 8)
     pdf.cell(20, line_height, 'STREET:', 0, 0)
     pdf.set_font('DejaVu', '', 9)
-    pdf.cell(75, line_height, project.location or '', 0, 0)
+    slot('location', 75, line_height)
     
     # Second column - second row
     pdf.set_xy(107, client_box_y + 2 + line_height + 2)
     pdf.set_font('DejaVu', 'B', 8)
     pdf.cell(20, line_height, 'NAME:', 0, 0)
     pdf.set_font('DejaVu', '', 9)
-    pdf.set_text_color(highlight_color[0], highlight_color[1], highlight_color[2])
-    pdf.cell(70, line_height, invoice.client_contact_name or '', 0, 1)
+    pdf.set_text_color(*INVOICE_HIGHLIGHT_COLOR)
+    slot('client_contact_name', 70, line_height, ln=1)
     
     # First column - third row
     pdf.set_xy(12, client_box_y + 2 + (line_height + 2) * 2)
     pdf.set_font('DejaVu', 'B', 8)
     pdf.cell(20, line_height, 'CITY/STATE:', 0, 0)
     pdf.set_font('DejaVu', '', 9)
-    pdf.set_text_color(highlight_color[0], highlight_color[1], highlight_color[2])
-    pdf.cell(75, line_height, invoice.client_city_state or '', 0, 0)
+    pdf.set_text_color(*INVOICE_HIGHLIGHT_COLOR)
+    slot('client_city_state', 75, line_height)
     
     # Second column - third row
     pdf.set_xy(107, client_box_y + 2 + (line_height + 2) * 2)
     pdf.set_font('DejaVu', 'B', 8)
     pdf.cell(20, line_height, 'LOCATION:', 0, 0)
     pdf.set_font('DejaVu', '', 9)
-    pdf.set_text_color(highlight_color[0], highlight_color[1], highlight_color[2])
-    pdf.cell(70, line_height, invoice.job_location or '', 0, 1)
+    pdf.set_text_color(*INVOICE_HIGHLIGHT_COLOR)
+    slot('job_location', 70, line_height, ln=1)
     
     # First column - fourth row
     pdf.set_xy(12, client_box_y + 2 + (line_height + 2) * 3)
     pdf.set_font('DejaVu', 'B', 8)
     pdf.cell(20, line_height, 'SUBDIVISION:', 0, 0)
     pdf.set_font('DejaVu', '', 9)
-    pdf.set_text_color(highlight_color[0], highlight_color[1], highlight_color[2])
+    pdf.set_text_color(*INVOICE_HIGHLIGHT_COLOR)
     pdf.cell(75, line_height, '', 0, 1)
     
     # Move cursor after client info box
     pdf.set_y(client_box_y + 30)
     
     # Proposal section
-    pdf.set_text_color(primary_color[0], primary_color[1], primary_color[2])
+    pdf.set_text_color(*INVOICE_PRIMARY_COLOR)
     pdf.set_font('DejaVu', 'B', 10)
     pdf.cell(0, 6, 'PROPOSAL', 0, 1, 'L')
     
@@ -478,7 +451,7 @@ def generate_customer_invoice_pdf(invoice_id):
     
     # Proposal text
     pdf.set_font('DejaVu', '', 8)
-    pdf.set_text_color(text_color[0], text_color[1], text_color[2])
+    pdf.set_text_color(*INVOICE_TEXT_COLOR)
     pdf.cell(0, 5, 'I propose to furnish all materials and perform all necessary labor to complete the following:', 0, 1, 'L')
     
     # Description box with light fill
@@ -486,31 +459,23 @@ def generate_customer_invoice_pdf(invoice_id):
     description_height = 50  # Shorter height for more compact design
     
     # Create description box with light background
-    pdf.set_fill_color(light_fill[0], light_fill[1], light_fill[2])
+    pdf.set_fill_color(*INVOICE_LIGHT_FILL)
     pdf.rect(10, description_y, 190, description_height, 'F')
     
     # Description header
     pdf.set_xy(12, description_y + 2)
     pdf.set_font('DejaVu', 'B', 9)
-    pdf.set_text_color(primary_color[0], primary_color[1], primary_color[2])
+    pdf.set_text_color(*INVOICE_PRIMARY_COLOR)
     pdf.cell(186, 5, 'DESCRIPTION & DIRECTIONS', 0, 1, 'L')
     
     # Description content
-    pdf.set_xy(12, description_y + 8)
-    pdf.set_font('DejaVu', '', 9)
-    pdf.set_text_color(text_color[0], text_color[1], text_color[2])
-    # Only show invoice description
-    if invoice.description and invoice.description.strip():
-        pdf.multi_cell(186, 5, invoice.description, 0, 'L')
-    else:
-        # If no invoice description is available, show empty space
-        pdf.ln(10)
+    slots['description'] = (12, description_y + 8, 186, 5)
     
     # Move cursor after description box
     pdf.set_y(description_y + description_height + 2)
     
     # Payment section
-    pdf.set_text_color(primary_color[0], primary_color[1], primary_color[2])
+    pdf.set_text_color(*INVOICE_PRIMARY_COLOR)
     pdf.set_font('DejaVu', 'B', 10)
     pdf.cell(0, 6, 'PAYMENT DETAILS', 0, 1, 'L')
     
@@ -520,51 +485,44 @@ def generate_customer_invoice_pdf(invoice_id):
     
     # Payment box with light background
     payment_y = pdf.get_y()
-    pdf.set_fill_color(light_fill[0], light_fill[1], light_fill[2])
+    pdf.set_fill_color(*INVOICE_LIGHT_FILL)
     pdf.rect(10, payment_y, 190, 25, 'F')
     
     # Payment text
     pdf.set_xy(12, payment_y + 2)
     pdf.set_font('DejaVu', '', 8)
-    pdf.set_text_color(text_color[0], text_color[1], text_color[2])
+    pdf.set_text_color(*INVOICE_TEXT_COLOR)
     pdf.cell(0, 5, 'All of the work to be completed in a substantial and workmanlike manner for the sum of:', 0, 1, 'L')
     
     # Price line with modern styling - more compact
     pdf.set_xy(12, payment_y + 8)
     pdf.cell(10, 6, '$', 0, 0)
     
-    # Calculate a default base amount (95% of total) and tax amount (5% of total)
-    # This is just for display purposes since we now store only the total amount
-    base_amount = invoice.base_amount or 0
-    tax_amount = invoice.tax_amount or 0
-    
-    # Display base amount
-    base_amount_str = f"{base_amount:,.2f}"
-    pdf.cell(25, 6, base_amount_str, 'B', 0)
+    # Base amount
+    slot('base_amount', 25, 6, 'B')
     pdf.cell(5, 6, '+', 0, 0, 'C')
     pdf.cell(10, 6, '$', 0, 0)
     
-    # Display tax amount
-    tax_amount_str = f"{tax_amount:,.2f}" 
-    pdf.cell(25, 6, tax_amount_str, 'B', 0)
+    # Tax amount
+    slot('tax_amount', 25, 6, 'B')
     pdf.cell(30, 6, '(tax) TOTAL:', 0, 0)
     
     # Total amount with highlight
     pdf.set_font('DejaVu', 'B', 12)
-    pdf.set_text_color(highlight_color[0], highlight_color[1], highlight_color[2])
-    pdf.cell(0, 6, f'${invoice.amount:.2f}', 0, 1)
+    pdf.set_text_color(*INVOICE_HIGHLIGHT_COLOR)
+    slot('amount', 0, 6, ln=1)
     
     # Terms in a more compact format
     pdf.set_xy(12, payment_y + 16)
     pdf.set_font('DejaVu', '', 7)
-    pdf.set_text_color(text_color[0], text_color[1], text_color[2])
+    pdf.set_text_color(*INVOICE_TEXT_COLOR)
     pdf.multi_cell(186, 3, 'The entire amount of the contract to be paid upon completion. Any alterations or deviation from the above specifications involving extra cost of material or labor will be executed upon written order for same and will become an extra charge over the sum mentioned in this contract. All agreements must be made in writing.', 0, 'L')
     
     # Move cursor after payment box
     pdf.set_y(payment_y + 27)
     
     # Acceptance and signature section
-    pdf.set_text_color(primary_color[0], primary_color[1], primary_color[2])
+    pdf.set_text_color(*INVOICE_PRIMARY_COLOR)
     pdf.set_font('DejaVu', 'B', 10)
     pdf.cell(0, 6, 'ACCEPTANCE & PAYMENT INFORMATION', 0, 1, 'L')
     
@@ -574,7 +532,7 @@ def generate_customer_invoice_pdf(invoice_id):
     
     # Acceptance text
     pdf.set_font('DejaVu', '', 7)
-    pdf.set_text_color(text_color[0], text_color[1], text_color[2])
+    pdf.set_text_color(*INVOICE_TEXT_COLOR)
     pdf.multi_cell(0, 3, 'I hereby authorize Mauricio PDQ Paint and Drywall LLC to furnish all materials and labor required to complete the work mentioned in the above proposal, and I agree to pay the amount mentioned in said proposal and according to the terms thereof.', 0, 'L')
     pdf.ln(1)
     
@@ -582,18 +540,18 @@ def generate_customer_invoice_pdf(invoice_id):
     signature_y = pdf.get_y()
     
     # Payment details on the left with light fill
-    pdf.set_fill_color(light_fill[0], light_fill[1], light_fill[2])
+    pdf.set_fill_color(*INVOICE_LIGHT_FILL)
     pdf.rect(10, signature_y, 90, 35, 'F')
     
     # Payment details header
     pdf.set_xy(12, signature_y + 2)
     pdf.set_font('DejaVu', 'B', 8)
-    pdf.set_text_color(primary_color[0], primary_color[1], primary_color[2])
+    pdf.set_text_color(*INVOICE_PRIMARY_COLOR)
     pdf.cell(86, 4, 'PAYMENT INFORMATION', 0, 1, 'L')
     
     # Payment form fields
     pdf.set_font('DejaVu', '', 8)
-    pdf.set_text_color(text_color[0], text_color[1], text_color[2])
+    pdf.set_text_color(*INVOICE_TEXT_COLOR)
     
     form_y = signature_y + 7
     pdf.set_xy(12, form_y)
@@ -619,24 +577,21 @@ def generate_customer_invoice_pdf(invoice_id):
     pdf.cell(63, 4, '_______________________', 0, 1)
     
     # Signature section on the right with light fill
-    pdf.set_fill_color(light_fill[0], light_fill[1], light_fill[2])
+    pdf.set_fill_color(*INVOICE_LIGHT_FILL)
     pdf.rect(110, signature_y, 90, 35, 'F')
     
     # Signature header
     pdf.set_xy(112, signature_y + 2)
     pdf.set_font('DejaVu', 'B', 8)
-    pdf.set_text_color(primary_color[0], primary_color[1], primary_color[2])
+    pdf.set_text_color(*INVOICE_PRIMARY_COLOR)
     pdf.cell(86, 4, 'SIGNATURES', 0, 1, 'L')
     
     # Date line
     pdf.set_xy(112, form_y)
     pdf.set_font('DejaVu', '', 8)
-    pdf.set_text_color(text_color[0], text_color[1], text_color[2])
+    pdf.set_text_color(*INVOICE_TEXT_COLOR)
     pdf.cell(20, 4, 'Date:', 0, 0)
-    if invoice.signature_date:
-        pdf.cell(68, 4, invoice.signature_date.strftime('%m/%d/%Y'), 0, 1)
-    else:
-        pdf.cell(68, 4, '_______________________', 0, 1)
+    slot('signature_date', 68, 4, ln=1)
     
     # Customer signature
     pdf.set_xy(112, form_y + 10)
@@ -649,34 +604,180 @@ def generate_customer_invoice_pdf(invoice_id):
     
     # Add the contractor name in red below the signature line
     pdf.set_xy(142, form_y + 20)
-    pdf.set_text_color(accent_color[0], accent_color[1], accent_color[2])
+    pdf.set_text_color(*INVOICE_ACCENT_COLOR)
     pdf.set_font('DejaVu', 'B', 9)
     pdf.cell(56, 4, 'MAURICIO SANTOS', 0, 1)
     
-    # Create a temporary file to store the PDF
-    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.pdf')
-    pdf_output = pdf.output(dest='S').encode('latin1')
-    temp_file.write(pdf_output)
-    temp_file.close()
+    return slots
+
+CUSTOMER_INVOICE_LAYOUT = StaticLayout(_draw_customer_invoice_layout, orientation='P', unit='mm', format='A4',
+                                       fonts=('', 'B'))
+
+def draw_customer_invoice(pdf, invoice, project):
+    """Add one customer invoice, starting on a new page, to a document from
+    new_customer_invoice_document()."""
+    pdf.add_page()
+    pdf.set_margins(10, 10, 10)
+    slots = CUSTOMER_INVOICE_LAYOUT.stamp(pdf)
+    
+    def fill(name, text, style='', size=9, color=INVOICE_HIGHLIGHT_COLOR):
+        x, y, w, h = slots[name]
+        pdf.set_xy(x, y)
+        pdf.set_font('DejaVu', style, size)
+        pdf.set_text_color(*color)
+        pdf.cell(w, h, text, 0, 0, 'L')
+    
+    fill('invoice_number', f'{invoice.id:03d}')
+    fill('invoice_date', invoice.invoice_date.strftime('%m/%d/%Y'))
+    fill('client_name', project.client_name or '')
+    fill('client_phone', invoice.client_phone or '')
+    fill('location', project.location or '')
+    fill('client_contact_name', invoice.client_contact_name or '')
+    fill('client_city_state', invoice.client_city_state or '')
+    fill('job_location', invoice.job_location or '')
+    
+    # Only show invoice description
+    if invoice.description and invoice.description.strip():
+        x, y, w, h = slots['description']
+        pdf.set_xy(x, y)
+        pdf.set_font('DejaVu', '', 9)
+        pdf.set_text_color(*INVOICE_TEXT_COLOR)
+        pdf.multi_cell(w, h, invoice.description, 0, 'L')
+    
+    fill('base_amount', f"{invoice.base_amount or 0:,.2f}", size=8, color=INVOICE_TEXT_COLOR)
+    fill('tax_amount', f"{invoice.tax_amount or 0:,.2f}", size=8, color=INVOICE_TEXT_COLOR)
+    fill('amount', f'${invoice.amount:.2f}', style='B', size=12)
+    signature_date = invoice.signature_date.strftime('%m/%d/%Y') if invoice.signature_date else '_______________________'
+    fill('signature_date', signature_date, size=8, color=INVOICE_TEXT_COLOR)
+
+def generate_customer_invoice_pdf(invoice_id):
+    """
+    Generate a professional PDF invoice for customers.
+    
+    Args:
+        invoice_id: The ID of the invoice to generate a PDF for
+        
+    Returns:
+        A Flask send_file response with the PDF
+    """
+    invoice = Invoice.query.get_or_404(invoice_id)
+    project = Project.query.get_or_404(invoice.project_id)
+    
+    # Repeat prints are served straight from the invoice PDF cache
+    pdf_path, cache_key = cached_invoice_pdf(invoice, project, render_customer_invoice_pdf)
     
     # Send the PDF file to the client
     return send_file(
-        temp_file.name,
+        pdf_path,
         mimetype='application/pdf',
         as_attachment=True,
-        download_name=f'invoice_{invoice.id:03d}_{project.name.replace(" ", "_")}.pdf'
+        download_name=customer_invoice_filename(invoice, project),
+        etag=cache_key,
+        conditional=True
     )
 
+@report_job('invoice_pdf')
+def render_invoice_pdf_job(params, output_path, progress):
+    """Background job: render one customer invoice PDF."""
+    invoice = db.session.get(Invoice, params['invoice_id'])
+    if invoice is None:
+        raise ValueError(f"Invoice {params['invoice_id']} not found")
+    project = db.session.get(Project, invoice.project_id)
+    pdf_path, _ = cached_invoice_pdf(invoice, project, render_customer_invoice_pdf)
+    shutil.copyfile(pdf_path, output_path)
+    progress(1, 1)
+    return customer_invoice_filename(invoice, project), 'application/pdf'
+
 @app.route('/invoice/print/<int:id>')
 @login_required
 def print_customer_invoice(id):
-    """Generate and download a customer-facing invoice PDF"""
+    """Generate and download a customer-facing invoice PDF.
+    With ?background=1 the PDF is rendered by the report job pool instead."""
     try:
+        if request.args.get('background'):
+            invoice = Invoice.query.get_or_404(id)
+            job = submit_job('invoice_pdf', {'invoice_id': invoice.id},
+                             description=f'Invoice {invoice.invoice_number or invoice.id} PDF')
+            return redirect(url_for('report_job_detail', job_id=job.id))
         return generate_customer_invoice_pdf(id)
     except Exception as e:
         flash(f'Error generating invoice PDF: {str(e)}', 'danger')
         return redirect(url_for('invoices'))
 
+# Invoices rendered per pool task in a batch print
+INVOICE_BATCH_CHUNK_SIZE = 8
+
+def cache_customer_invoice_pdf(invoice_id):
+    """Render one invoice into the PDF cache and return its path (runs in the report job pool)."""
+    invoice = db.session.get(Invoice, invoice_id)
+    project = db.session.get(Project, invoice.project_id)
+    pdf_path, _ = cached_invoice_pdf(invoice, project, render_customer_invoice_pdf)
+    return pdf_path
+
+def invoice_batch_query(filters, client=None):
+    """Invoices for a batch print. Filters: start_date/end_date (on the invoice
+    date), project_id, status, and client (the project's client name)"""
+    query = filter_date_range(Invoice.query.join(Project), Invoice.invoice_date, filters)
+    if filters['project_id']:
+        query = query.filter(Invoice.project_id == filters['project_id'])
+    if filters['status']:
+        query = query.filter(Invoice.status == _parse_enum(PaymentStatus, filters['status'], 'status'))
+    if client:
+        query = query.filter(db.func.lower(Project.client_name) == client.lower())
+    return query.options(*loading_options(Invoice, 'print_invoice_batch')).order_by(Invoice.invoice_date, Invoice.id)
+
+@app.route('/invoices/print', methods=['GET'])
+@login_required
+def print_invoice_batch():
+    """Print every invoice matching the filters, as a ZIP of PDFs (format=zip)
+    or one merged PDF (format=pdf)"""
+    format = request.args.get('format', 'zip')
+    if format not in ('zip', 'pdf'):
+        flash('Invalid batch print format', 'danger')
+        return redirect(url_for('invoices'))
+    try:
+        invoices = invoice_batch_query(get_export_filters(), request.args.get('client', '').strip()).all()
+    except ExportFilterError as e:
+        flash(str(e), 'danger')
+        return redirect(url_for('invoices'))
+    if not invoices:
+        flash('No invoices match the selected filters.', 'warning')
+        return redirect(url_for('invoices'))
+    
+    if format == 'pdf':
+        # One document, so the pages are drawn here in order, then written
+        # straight to the file that is sent
+        pdf = new_customer_invoice_document()
+        for invoice in invoices:
+            draw_customer_invoice(pdf, invoice, invoice.project)
+        # The file is deleted when it is closed, once it has been sent
+        pdf_file = tempfile.NamedTemporaryFile(suffix='.pdf')
+        try:
+            pdf.output(pdf_file.name, 'F')
+        except Exception:
+            pdf_file.close()
+            raise
+        return send_file(pdf_file, mimetype='application/pdf', as_attachment=True,
+                         download_name=f'invoices_{date.today():%Y%m%d}.pdf')
+    
+    # Render the invoices missing from the PDF cache across the pool, then zip the cached files
+    pdf_paths = {invoice.id: invoice_pdf_path(invoice, invoice.project)[0] for invoice in invoices}
+    missing = [invoice_id for invoice_id, pdf_path in pdf_paths.items() if not os.path.exists(pdf_path)]
+    pdf_paths.update(zip(missing, map_in_pool(cache_customer_invoice_pdf, missing, chunksize=INVOICE_BATCH_CHUNK_SIZE)))
+    
+    zip_file = tempfile.TemporaryFile()
+    with zipfile.ZipFile(zip_file, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for invoice in invoices:
+            filename = customer_invoice_filename(invoice, invoice.project)
+            try:
+                archive.write(pdf_paths[invoice.id], filename)
+            except FileNotFoundError:
+                # Evicted meanwhile (a batch can be larger than the whole cache)
+                archive.writestr(filename, render_customer_invoice_pdf(invoice, invoice.project))
+    zip_file.seek(0)
+    return send_file(zip_file, mimetype='application/zip', as_attachment=True,
+                     download_name=f'invoices_{date.today():%Y%m%d}.zip')
+
 # --- Auth Routes ---
 @app.route('/login', methods=['GET', 'POST'])
 def login():
@@ -715,28 +816,37 @@ def logout():
 @login_required
 def index():
     """Dashboard"""
+    return render_template('index.html', **dashboard_context(build_dashboard_context))
+
+def build_dashboard_context(today):
+    """Compute the dashboard figures. Only plain values are returned, so the
+    context can be cached across requests (see dashboard.py)."""
     # Total projects counter (instead of just active projects)
     total_projects = Project.query.count()
     active_projects = Project.query.filter(Project.status == ProjectStatus.IN_PROGRESS).count()
     
-    # Project financial metrics - include all projects
-    all_projects = Project.query.all()
-    
-    # Sort by profit margin (descending)
-    sorted_projects = sorted(
-        all_projects, 
-        key=lambda p: p.profit_margin if p.profit_margin is not None else -999, 
-        reverse=True
-    )
+    # Top projects by profit margin, straight from the materialized summary table
+    top_rows = db.session.query(Project, ProjectFinancial)\
+        .join(ProjectFinancial, ProjectFinancial.project_id == Project.id)\
+        .order_by(ProjectFinancial.profit_margin.desc())\
+        .limit(5).all()
     
     # Calculate progress bar widths for the top projects
-    top_projects = sorted_projects[:5]
-    for project in top_projects:
+    top_projects = []
+    financials = {}
+    for project, financial in top_rows:
         # Calculate a width between 0-100% for the progress bar
         # Add 40% to profit margin to make small profit margins visible
         # but cap at 100%
-        profit_margin = project.profit_margin or 0
-        project.progress_width = max(0, min(100, profit_margin + 40))
+        profit_margin = financial.profit_margin or 0
+        top_projects.append({
+            'id': project.id,
+            'name': project.name,
+            'client_name': project.client_name,
+            'contract_value': project.contract_value,
+            'progress_width': max(0, min(100, profit_margin + 40)),
+        })
+        financials[project.id] = {'profit_margin': financial.profit_margin}
     
     # Financial summary
     total_invoiced = db.session.query(db.func.sum(Invoice.amount)).scalar() or 0
@@ -745,67 +855,59 @@ def index():
     ).scalar() or 0
     
     # Calculate total net profit across all projects
-    total_net_profit = sum(project.actual_net_profit for project in all_projects)
+    total_net_profit = db.session.query(db.func.sum(ProjectFinancial.net_profit)).scalar() or 0
     
     # Timesheet summary for current week
-    start_of_week, end_of_week = get_week_start_end()
-    # Get timesheets directly instead of using the property in SQL
-    weekly_timesheets = Timesheet.query.filter(
+    start_of_week, end_of_week = get_week_start_end(today)
+    # Summed from the stored worked_hours column
+    weekly_hours = db.session.query(db.func.sum(Timesheet.worked_hours)).filter(
         Timesheet.date >= start_of_week,
         Timesheet.date <= end_of_week
-    ).all()
-    
-    # Calculate hours in Python logic instead of SQL
-    weekly_hours = sum(ts.calculated_hours for ts in weekly_timesheets)
+    ).scalar() or 0
     
-    # Project status distribution
-    project_status_counts = {}
-    for status in ProjectStatus:
-        project_status_counts[status.name] = Project.query.filter(Project.status == status).count()
+    # Project status distribution, in one grouped count
+    status_counts = dict(db.session.query(Project.status, db.func.count()).group_by(Project.status).all())
+    project_status_counts = {status.name: status_counts.get(status, 0) for status in ProjectStatus}
     
     # Recent expenses
-    recent_expenses = Expense.query.order_by(Expense.date.desc()).limit(5).all()
+    recent_expenses = [
+        {
+            'date': expense.date,
+            'description': expense.description,
+            'category': expense.category,
+            'amount': expense.amount,
+            'payment_status': expense.payment_status,
+        }
+        for expense in Expense.query.order_by(Expense.date.desc()).limit(5)
+    ]
     expenses_total = db.session.query(db.func.sum(Expense.amount)).scalar() or 0
     
-    # Monthly expense trend (last 5 months)
-    today = date.today()
-    monthly_expenses = []
-    monthly_labels = []
-    for i in range(4, -1, -1):
-        month_date = today.replace(day=1) - timedelta(days=i*30)  # Approximate
-        month_name = month_date.strftime('%b')
-        monthly_labels.append(month_name)
-        
-        next_month = month_date.replace(day=28) + timedelta(days=4)  # Move to next month
-        next_month = next_month.replace(day=1)  # First day of next month
-        
-        month_expenses = db.session.query(db.func.sum(Expense.amount)).filter(
-            Expense.date >= month_date,
-            Expense.date < next_month
-        ).scalar() or 0
-        
-        monthly_expenses.append(round(month_expenses, 2))
-    
-    return render_template('index.html',
-                          active_projects=active_projects,
-                          total_projects=total_projects,
-                          top_projects=top_projects,
-                          recent_expenses=recent_expenses,
-                          total_invoiced=total_invoiced,
-                          unpaid_invoices=unpaid_invoices,
-                          weekly_hours=weekly_hours,
-                          project_status_counts=project_status_counts,
-                          expenses_total=expenses_total,
-                          monthly_expenses=monthly_expenses,
-                          monthly_labels=monthly_labels,
-                          total_net_profit=total_net_profit)
+    # Monthly expense trend (last 5 calendar months)
+    start, end = last_buckets(5, 'month', today)
+    trend = time_series(Expense.date, start, end, 'month', value=Expense.amount)
+    monthly_labels = [month.strftime('%b') for month, _ in trend]
+    monthly_expenses = [round(total, 2) for _, total in trend]
+    
+    return dict(active_projects=active_projects,
+                total_projects=total_projects,
+                top_projects=top_projects,
+                financials=financials,
+                recent_expenses=recent_expenses,
+                total_invoiced=total_invoiced,
+                unpaid_invoices=unpaid_invoices,
+                weekly_hours=weekly_hours,
+                project_status_counts=project_status_counts,
+                expenses_total=expenses_total,
+                monthly_expenses=monthly_expenses,
+                monthly_labels=monthly_labels,
+                total_net_profit=total_net_profit)
 
 # --- Employee Routes ---
 @app.route('/employees')
 @login_required
 def employees():
-    all_employees = Employee.query.order_by(Employee.name).all()
-    return render_template('employees.html', employees=all_employees)
+    page = paginate_request(Employee.query, Employee.name, Employee.id)
+    return render_template('employees.html', employees=page)
 
 @app.route('/employee/add', methods=['GET', 'POST'])
 @login_required
@@ -878,8 +980,9 @@ def delete_employee(id):
 @app.route('/projects')
 @login_required
 def projects():
-    all_projects = Project.query.order_by(Project.start_date.desc()).all()
-    return render_template('projects.html', projects=all_projects)
+    page = paginate_request(Project.query, Project.start_date.desc(), Project.id.desc())
+    rollups = project_rollups(project.id for project in page)
+    return render_template('projects.html', projects=page, rollups=rollups)
 
 @app.route('/project/add', methods=['GET', 'POST'])
 @login_required
@@ -955,12 +1058,13 @@ def project_detail(id):
         flash('Project not found.', 'danger')
         return redirect(url_for('projects')), 404
         
-    # Calculate costs (using properties defined in model)
-    labor_cost = project.total_labor_cost
-    material_cost = project.total_material_cost
-    other_expenses = project.total_other_expenses
-    total_cost = project.total_cost
-    profit = project.profit
+    # Calculate costs (aggregated in SQL rather than walking every child row)
+    rollup = project_rollup(id)
+    labor_cost = rollup.total_labor_cost
+    material_cost = rollup.total_material_cost
+    other_expenses = rollup.total_other_expenses
+    total_cost = rollup.total_cost
+    profit = rollup.profit
 
     # Fetch related items
     timesheets = Timesheet.query.filter_by(project_id=id).order_by(Timesheet.date.desc()).all()
@@ -970,6 +1074,7 @@ def project_detail(id):
 
     return render_template('project_detail.html',
                            project=project,
+                           rollup=rollup,
                            labor_cost=labor_cost,
                            material_cost=material_cost,
                            other_expenses=other_expenses,
@@ -1002,11 +1107,68 @@ def delete_project(id):
 @login_required
 def timesheets():
     # Basic view - show all timesheets, maybe filter by week later
-    page = request.args.get('page', 1, type=int)
-    timesheet_list = Timesheet.query.join(Employee).outerjoin(Project)\
-                        .order_by(Timesheet.date.desc(), Employee.name)\
-                        .paginate(page=page, per_page=20)  # Add pagination
-    return render_template('timesheets.html', timesheets=timesheet_list)
+    query = Timesheet.query.join(Employee).outerjoin(Project).options(*loading_options(Timesheet))
+    page = paginate_request(query, Timesheet.date.desc(), Timesheet.id.desc())
+    return render_template('timesheets.html', timesheets=page)
+
+@app.route('/timesheets/import', methods=['GET', 'POST'])
+@login_required
+def import_timesheet_file():
+    """Import a CSV or Excel file of punches; valid rows are added in one
+    transaction and the rejected ones listed with the reason."""
+    result = None
+    dry_run = bool(request.form.get('dry_run'))
+    if request.method == 'POST':
+        upload = request.files.get('timesheet_file')
+        if upload is None or upload.filename == '':
+            flash('No file selected', 'danger')
+            return redirect(url_for('import_timesheet_file'))
+        try:
+            result = import_timesheets(upload.stream, upload.filename, dry_run=dry_run)
+        except ImportFileError as e:
+            flash(str(e), 'danger')
+            return redirect(url_for('import_timesheet_file'))
+        except Exception as e:
+            flash(f'Error importing timesheets: {str(e)}', 'danger')
+            return redirect(url_for('import_timesheet_file'))
+        if result.inserted:
+            flash(f'{result.inserted} timesheet entries imported.', 'success')
+    return render_template('timesheet_import.html', result=result, dry_run=dry_run)
+
+@app.route('/timesheets/week', methods=['GET', 'POST'])
+@login_required
+def crew_week():
+    """Enter or edit a whole crew's week for one project in one grid."""
+    projects = Project.query.filter(Project.status.in_([ProjectStatus.PENDING, ProjectStatus.IN_PROGRESS]))\
+                            .order_by(Project.name).all()
+    project_id = request.values.get('project_id', type=int)
+    project = db.session.get(Project, project_id) if project_id else None
+    week_day = date.today()
+    if request.values.get('week'):
+        try:
+            week_day = datetime.strptime(request.values['week'], '%Y-%m-%d').date()
+        except ValueError:
+            flash("Invalid date format. Showing the current week.", 'warning')
+    week_start, week_end = get_week_start_end(week_day)
+
+    week = CrewWeek(project, week_start) if project else None
+    errors = {}
+    if week and request.method == 'POST':
+        try:
+            errors, counts = week.save(request.form)
+        except Exception as e:
+            flash(f'Error saving timesheets: {str(e)}', 'danger')
+            return redirect(url_for('crew_week', project_id=project_id, week=week_start.isoformat()))
+        if errors:
+            flash(f'Nothing was saved: {len(errors)} invalid entr{"ies" if len(errors) != 1 else "y"}.', 'danger')
+        else:
+            flash(f"Week saved: {counts['added']} added, {counts['updated']} updated, "
+                  f"{counts['removed']} removed.", 'success')
+            return redirect(url_for('crew_week', project_id=project_id, week=week_start.isoformat()))
+
+    return render_template('timesheet_week.html', projects=projects, project=project, week=week,
+                           week_start=week_start, week_end=week_end, errors=errors, cell_name=cell_name,
+                           posted=request.form if errors else None, timedelta=timedelta)
 
 @app.route('/timesheet/add', methods=['GET', 'POST'])
 @login_required
@@ -1154,8 +1316,10 @@ def delete_timesheet(id):
 @app.route('/materials')
 @login_required
 def materials():
-    all_materials = Material.query.join(Project).order_by(Material.purchase_date.desc()).all()
-    return render_template('materials.html', materials=all_materials)
+    query = Material.query.join(Project).options(*loading_options(Material))
+    page = paginate_request(query, Material.purchase_date.desc(), Material.id.desc())
+    materials_total = db.session.query(db.func.sum(Material.cost)).scalar() or 0
+    return render_template('materials.html', materials=page, materials_total=materials_total)
 
 @app.route('/material/add', methods=['GET', 'POST'])
 @login_required
@@ -1186,8 +1350,12 @@ def add_material():
 @app.route('/expenses')
 @login_required
 def expenses():
-    all_expenses = Expense.query.order_by(Expense.date.desc()).all()
-    return render_template('expenses.html', expenses=all_expenses)
+    query = Expense.query.options(*loading_options(Expense))
+    page = paginate_request(query, Expense.date.desc(), Expense.id.desc())
+    category_totals = sorted(((category, total) for category, _, total in group_summary(Expense.category, Expense.amount)),
+                             key=lambda item: item[1], reverse=True)
+    return render_template('expenses.html', expenses=page, category_totals=category_totals,
+                           expenses_total=sum(total for _, total in category_totals))
 
 @app.route('/expense/add', methods=['GET', 'POST'])
 @login_required
@@ -1291,6 +1459,7 @@ def record_payroll_payment():
 
 @app.route('/payroll/report')
 @login_required
+@read_only_view
 def payroll_report():
     """Comprehensive report showing weekly hours and recorded payments with payment method breakdown"""
     target_date_str = request.args.get('date')
@@ -1308,41 +1477,39 @@ def payroll_report():
     all_employees = Employee.query.order_by(Employee.name).all()
 
     # 1. Calculate hours worked per employee for the selected week
+    # Hours and pay are summed in SQL, one grouped query for every employee
     # Filter employees by selected employee_id if provided
-    employee_query = Employee.query.filter_by(is_active=True)
+    hours_query = employee_hours_query(start_of_week, end_of_week).filter(Employee.is_active == True)
     if employee_id and employee_id.isdigit():
-        employee_query = employee_query.filter(Employee.id == int(employee_id))
-    employees = employee_query.all()
+        hours_query = hours_query.filter(Employee.id == int(employee_id))
+    
     weekly_hours_data = {}
-    for emp in employees:
-        timesheets_this_week = Timesheet.query.filter(
-            Timesheet.employee_id == emp.id,
-            Timesheet.date >= start_of_week,
-            Timesheet.date <= end_of_week
-        ).all()
-        total_hours = sum(ts.calculated_hours for ts in timesheets_this_week)
-        potential_pay = total_hours * emp.pay_rate
+    for emp, total_hours, potential_pay, _ in hours_query.order_by(Employee.id):
         weekly_hours_data[emp.id] = {
             'employee': emp,
             'total_hours': total_hours,
             'potential_pay': potential_pay,
-            'timesheets': timesheets_this_week
+            'timesheets': []
         }
+    employees = [data['employee'] for data in weekly_hours_data.values()]
+    
+    # The detail table still lists the week's entries: one query for all employees
+    if weekly_hours_data:
+        week_timesheets = Timesheet.query.options(*loading_options(Timesheet)).filter(
+            Timesheet.employee_id.in_(list(weekly_hours_data)),
+            Timesheet.date >= start_of_week,
+            Timesheet.date <= end_of_week
+        ).order_by(Timesheet.date, Timesheet.id).all()
+        for ts in week_timesheets:
+            weekly_hours_data[ts.employee_id]['timesheets'].append(ts)
 
     # 2. Get recorded payments for that period (or overlapping)
-    recorded_payments = PayrollPayment.query.filter(
+    # Deductions and employees are eager-loaded with the payments (see loading.py)
+    recorded_payments = PayrollPayment.query.options(*loading_options(PayrollPayment)).filter(
         # Simple overlap check, might need refinement
         PayrollPayment.pay_period_end >= start_of_week,
         PayrollPayment.pay_period_start <= end_of_week
     ).order_by(PayrollPayment.payment_date.desc()).all()
-    
-    # Fetch deductions for each payment
-    for payment in recorded_payments:
-        # Load deductions for the payment
-        payment.deductions = PayrollDeduction.query.filter_by(payroll_payment_id=payment.id).all()
-        
-        # We don't need to calculate total_deductions here as it's a property in the model
-        # that will be calculated automatically when accessed
 
     # Add payment info to the weekly data
     for payment in recorded_payments:
@@ -1397,12 +1564,12 @@ def payroll_report():
         # Get previous payments and hours for this employee across time periods
         search_results = {}
         for employee in employees:
-            emp_payments = PayrollPayment.query.filter_by(employee_id=employee.id).order_by(PayrollPayment.payment_date.desc()).limit(10).all()
-            emp_timesheets = Timesheet.query.filter_by(employee_id=employee.id).order_by(Timesheet.date.desc()).limit(20).all()
+            emp_payments = PayrollPayment.query.options(*loading_options(PayrollPayment)).filter_by(employee_id=employee.id).order_by(PayrollPayment.payment_date.desc()).limit(10).all()
+            emp_timesheets = Timesheet.query.options(*loading_options(Timesheet)).filter_by(employee_id=employee.id).order_by(Timesheet.date.desc()).limit(20).all()
             
             # Calculate total hours and payments
             total_paid = sum(payment.amount for payment in emp_payments)
-            total_hours_worked = sum(ts.calculated_hours for ts in emp_timesheets)
+            total_hours_worked = sum(ts.worked_hours for ts in emp_timesheets)
             
             search_results[employee.id] = {
                 'employee': employee,
@@ -1439,18 +1606,19 @@ def payroll_report():
 def invoices():
     try:
         # Use outerjoin instead of join to include invoices even if project relationship is broken
-        all_invoices = Invoice.query.outerjoin(Project).order_by(Invoice.invoice_date.desc()).all()
-        
-        # Debug info to help diagnose issues
-        invoice_count = len(all_invoices) if all_invoices else 0
-        flash(f'Found {invoice_count} invoices in the system.', 'info')
+        query = Invoice.query.outerjoin(Project).options(*loading_options(Invoice))
+        page = paginate_request(query, Invoice.invoice_date.desc(), Invoice.id.desc())
+        status_summary = group_summary(Invoice.status, Invoice.amount)
         
-        return render_template('invoices.html', invoices=all_invoices)
+        return render_template('invoices.html', invoices=page, payment_statuses=PaymentStatus,
+                               status_summary=status_summary,
+                               invoices_total=sum(total for _, _, total in status_summary))
     except Exception as e:
         # Log the error and show a user-friendly message
         print(f"Error in invoices route: {str(e)}")
         flash(f'Error loading invoices: {str(e)}', 'danger')
-        return render_template('invoices.html', invoices=[])
+        return render_template('invoices.html', invoices=[], payment_statuses=PaymentStatus,
+                               status_summary=[], invoices_total=0)
 
 @app.route('/invoice/add', methods=['GET', 'POST'])
 @login_required
@@ -1612,15 +1780,24 @@ def delete_invoice(id):
     return redirect(url_for('invoices'))
 
 # --- Export Routes ---
-@app.route('/export/projects/<format>')
-@login_required
-def export_projects(format):
-    """Export projects to Excel, PDF, or CSV"""
-    projects = Project.query.order_by(Project.start_date.desc()).all()
-    
-    projects_data = []
-    for project in projects:
-        projects_data.append({
+# Each export is a query builder (filters -> query) and a row generator that
+# pages through the query, so the CSV and Excel exports never hold the whole
+# table in memory, and background jobs can rebuild the same export.
+def project_export_query(filters):
+    """Projects for export. Filters: start_date/end_date (on the start date), project_id, status"""
+    query = filter_date_range(Project.query, Project.start_date, filters)
+    if filters['project_id']:
+        query = query.filter(Project.id == filters['project_id'])
+    if filters['status']:
+        query = query.filter(Project.status == _parse_enum(ProjectStatus, filters['status'], 'status'))
+    return query.order_by(Project.start_date.desc())
+
+def project_export_rows(query):
+    # Only roll up the exported projects
+    rollups = project_rollups(db.select(query.with_entities(Project.id).order_by(None).subquery().c.id))
+    for project in query.yield_per(EXPORT_BATCH_SIZE):
+        rollup = rollups[project.id]
+        yield {
             'Project ID': project.project_id_str or '',
             'Name': project.name,
             'Client': project.client_name or '',
@@ -1629,36 +1806,28 @@ def export_projects(format):
             'End Date': project.end_date.strftime('%Y-%m-%d') if project.end_date else '',
             'Status': project.status.value if project.status else '',
             'Contract Value': f"${project.contract_value:.2f}" if project.contract_value else '$0.00',
-            'Labor Cost': f"${project.total_labor_cost:.2f}",
-            'Material Cost': f"${project.total_material_cost:.2f}",
-            'Other Expenses': f"${project.total_other_expenses:.2f}",
-            'Total Cost': f"${project.total_cost:.2f}",
-            'Profit': f"${project.profit:.2f}",
-            'Profit Margin': f"{project.profit_margin:.2f}%"
-        })
-    
-    if format == 'excel':
-        return export_to_excel(projects_data, 'projects')
-    elif format == 'pdf':
-        return export_to_pdf(projects_data, 'Projects', 'projects.pdf')
-    elif format == 'csv':
-        return export_to_csv(projects_data, 'projects')
-    else:
-        flash('Invalid export format', 'error')
-        return redirect(url_for('projects'))
+            'Labor Cost': f"${rollup.total_labor_cost:.2f}",
+            'Material Cost': f"${rollup.total_material_cost:.2f}",
+            'Other Expenses': f"${rollup.total_other_expenses:.2f}",
+            'Total Cost': f"${rollup.total_cost:.2f}",
+            'Profit': f"${rollup.profit:.2f}",
+            'Profit Margin': f"{rollup.profit_margin:.2f}%"
+        }
 
-@app.route('/export/timesheets/<format>')
-@login_required
-def export_timesheets(format):
-    """Export timesheets to Excel, PDF, or CSV"""
-    timesheets = Timesheet.query.order_by(Timesheet.date.desc()).all()
-    
-    timesheets_data = []
-    for timesheet in timesheets:
-        employee = db.session.get(Employee, timesheet.employee_id)
-        project = db.session.get(Project, timesheet.project_id)
-        
-        timesheets_data.append({
+def timesheet_export_query(filters):
+    """Timesheets for export. Filters: start_date/end_date, project_id, employee_id"""
+    query = filter_date_range(Timesheet.query, Timesheet.date, filters)
+    if filters['project_id']:
+        query = query.filter(Timesheet.project_id == filters['project_id'])
+    if filters['employee_id']:
+        query = query.filter(Timesheet.employee_id == filters['employee_id'])
+    return query.options(*loading_options(Timesheet, 'export_timesheets')).order_by(Timesheet.date.desc())
+
+def timesheet_export_rows(query):
+    for timesheet in query.yield_per(EXPORT_BATCH_SIZE):
+        employee = timesheet.employee
+        project = timesheet.project
+        yield {
             'Date': timesheet.date.strftime('%Y-%m-%d'),
             'Employee': employee.name if employee else 'Unknown',
             'Project': project.name if project else 'Unknown',
@@ -1666,31 +1835,25 @@ def export_timesheets(format):
             'Exit Time': timesheet.exit_time.strftime('%H:%M'),
             'Lunch (mins)': timesheet.lunch_duration_minutes or 0,
             'Raw Hours': f"{timesheet.raw_hours:.2f}",
-            'Calculated Hours': f"{timesheet.calculated_hours:.2f}",
-            'Labor Cost': f"${timesheet.calculated_hours * (employee.pay_rate if employee else 0):.2f}"
-        })
-    
-    if format == 'excel':
-        return export_to_excel(timesheets_data, 'timesheets')
-    elif format == 'pdf':
-        return export_to_pdf(timesheets_data, 'Timesheets', 'timesheets.pdf')
-    elif format == 'csv':
-        return export_to_csv(timesheets_data, 'timesheets')
-    else:
-        flash('Invalid export format', 'error')
-        return redirect(url_for('timesheets'))
+            'Calculated Hours': f"{timesheet.worked_hours:.2f}",
+            'Labor Cost': f"${timesheet.worked_hours * (employee.pay_rate if employee else 0):.2f}"
+        }
 
-@app.route('/export/expenses/<format>')
-@login_required
-def export_expenses(format):
-    """Export expenses to Excel, PDF, or CSV"""
-    expenses = Expense.query.order_by(Expense.date.desc()).all()
-    
-    expenses_data = []
-    for expense in expenses:
-        project = db.session.get(Project, expense.project_id) if expense.project_id else None
-        
-        expenses_data.append({
+def expense_export_query(filters):
+    """Expenses for export. Filters: start_date/end_date, project_id, status (payment status), payment_method"""
+    query = filter_date_range(Expense.query, Expense.date, filters)
+    if filters['project_id']:
+        query = query.filter(Expense.project_id == filters['project_id'])
+    if filters['status']:
+        query = query.filter(Expense.payment_status == _parse_enum(PaymentStatus, filters['status'], 'status'))
+    if filters['payment_method']:
+        query = query.filter(Expense.payment_method == filters['payment_method'])
+    return query.options(*loading_options(Expense, 'export_expenses')).order_by(Expense.date.desc())
+
+def expense_export_rows(query):
+    for expense in query.yield_per(EXPORT_BATCH_SIZE):
+        project = expense.project
+        yield {
             'Date': expense.date.strftime('%Y-%m-%d'),
             'Description': expense.description,
             'Category': expense.category or '',
@@ -1699,27 +1862,20 @@ def export_expenses(format):
             'Project': project.name if project else 'N/A',
             'Payment Method': expense.payment_method.value if expense.payment_method else '',
             'Payment Status': expense.payment_status.value if expense.payment_status else ''
-        })
-    
-    if format == 'excel':
-        return export_to_excel(expenses_data, 'expenses')
-    elif format == 'pdf':
-        return export_to_pdf(expenses_data, 'Expenses', 'expenses.pdf')
-    elif format == 'csv':
-        return export_to_csv(expenses_data, 'expenses')
-    else:
-        flash('Invalid export format', 'error')
-        return redirect(url_for('expenses'))
+        }
 
-@app.route('/export/payroll/<format>')
-@login_required
-def export_payroll(format):
-    """Export payroll data to Excel, PDF, or CSV"""
-    payroll_payments = PayrollPayment.query.order_by(PayrollPayment.payment_date.desc()).all()
-    
-    payroll_data = []
-    for payment in payroll_payments:
-        employee = db.session.get(Employee, payment.employee_id)
+def payroll_export_query(filters):
+    """Payroll payments for export. Filters: start_date/end_date (on the payment date), employee_id, payment_method"""
+    query = filter_date_range(PayrollPayment.query, PayrollPayment.payment_date, filters)
+    if filters['employee_id']:
+        query = query.filter(PayrollPayment.employee_id == filters['employee_id'])
+    if filters['payment_method']:
+        query = query.filter(PayrollPayment.payment_method == filters['payment_method'])
+    return query.options(*loading_options(PayrollPayment, 'export_payroll')).order_by(PayrollPayment.payment_date.desc())
+
+def payroll_export_rows(query):
+    for payment in query.yield_per(EXPORT_BATCH_SIZE):
+        employee = payment.employee
         
         check_info = ""
         if payment.payment_method == PaymentMethod.CHECK:
@@ -1727,7 +1883,7 @@ def export_payroll(format):
             if payment.bank_name:
                 check_info += f", {payment.bank_name}"
         
-        payroll_data.append({
+        yield {
             'Employee': employee.name if employee else 'Unknown',
             'Pay Period Start': payment.pay_period_start.strftime('%Y-%m-%d'),
             'Pay Period End': payment.pay_period_end.strftime('%Y-%m-%d'),
@@ -1736,17 +1892,126 @@ def export_payroll(format):
             'Payment Method': payment.payment_method.value,
             'Check Details': check_info,
             'Notes': payment.notes or ''
-        })
+        }
+
+# Entity name -> title, list page to return to, query builder, row generator
+EXPORTS = {
+    'projects': ('Projects', 'projects', project_export_query, project_export_rows),
+    'timesheets': ('Timesheets', 'timesheets', timesheet_export_query, timesheet_export_rows),
+    'expenses': ('Expenses', 'expenses', expense_export_query, expense_export_rows),
+    'payroll': ('Payroll', 'payroll_report', payroll_export_query, payroll_export_rows),
+}
+
+def export_response(entity, format):
+    """Build the export of `entity` in `format` from the request's filters.
+    With ?background=1 the file is rendered by the report job pool instead."""
+    title, list_endpoint, build_query, build_rows = EXPORTS[entity]
+    if format not in ('excel', 'pdf', 'csv'):
+        flash('Invalid export format', 'error')
+        return redirect(url_for(list_endpoint))
+    try:
+        query = build_query(get_export_filters())
+    except ExportFilterError as e:
+        flash(str(e), 'error')
+        return redirect(url_for(list_endpoint))
+    
+    if request.args.get('background'):
+        args = {key: value for key, value in request.args.items() if key != 'background'}
+        job = submit_job('export', {'entity': entity, 'format': format, 'args': args},
+                         description=f'{title} {format.upper()} export')
+        return redirect(url_for('report_job_detail', job_id=job.id))
     
     if format == 'excel':
-        return export_to_excel(payroll_data, 'payroll')
+        return export_to_excel(build_rows(query), entity)
     elif format == 'pdf':
-        return export_to_pdf(payroll_data, 'Payroll', 'payroll.pdf')
-    elif format == 'csv':
-        return export_to_csv(payroll_data, 'payroll')
+        return export_to_pdf(build_rows(query), title, f'{entity}.pdf')
     else:
-        flash('Invalid export format', 'error')
-        return redirect(url_for('payroll_report'))
+        return export_to_csv(build_rows(query), entity)
+
+@report_job('export')
+def render_export_job(params, output_path, progress):
+    """Background job: write one export to a file, reporting progress per row."""
+    entity, format = params['entity'], params['format']
+    title, _, build_query, build_rows = EXPORTS[entity]
+    with read_only_session():
+        query = build_query(get_export_filters(params['args']))
+        total = query.order_by(None).count()
+        
+        def rows():
+            for count, row in enumerate(build_rows(query), 1):
+                progress(count, total)
+                yield row
+        
+        if format == 'excel':
+            write_excel_report(rows(), output_path)
+            return f'{entity}_report.xlsx', XLSX_MIMETYPE
+        elif format == 'pdf':
+            write_pdf_report(rows(), title, output_path)
+            return f'{entity}.pdf', 'application/pdf'
+        else:
+            write_csv_report(rows(), output_path)
+            return f'{entity}_report.csv', 'text/csv'
+
+@app.route('/export/projects/<format>')
+@login_required
+@read_only_view
+def export_projects(format):
+    """Export projects to Excel, PDF, or CSV"""
+    return export_response('projects', format)
+
+@app.route('/export/timesheets/<format>')
+@login_required
+@read_only_view
+def export_timesheets(format):
+    """Export timesheets to Excel, PDF, or CSV"""
+    return export_response('timesheets', format)
+
+@app.route('/export/expenses/<format>')
+@login_required
+@read_only_view
+def export_expenses(format):
+    """Export expenses to Excel, PDF, or CSV"""
+    return export_response('expenses', format)
+
+@app.route('/export/payroll/<format>')
+@login_required
+@read_only_view
+def export_payroll(format):
+    """Export payroll data to Excel, PDF, or CSV"""
+    return export_response('payroll', format)
+
+# --- Report Job Routes ---
+@app.route('/jobs')
+@login_required
+def report_jobs():
+    """Recent background report jobs"""
+    jobs = ReportJob.query.order_by(ReportJob.created_at.desc()).limit(50).all()
+    return render_template('report_jobs.html', jobs=jobs, job_progress=job_progress)
+
+@app.route('/jobs/<job_id>')
+@login_required
+def report_job_detail(job_id):
+    """Progress page of one report job; polls report_job_status until done"""
+    job = db.get_or_404(ReportJob, job_id)
+    return render_template('report_job.html', job=job, status=job_status(job))
+
+@app.route('/jobs/<job_id>/status')
+@login_required
+def report_job_status(job_id):
+    job = db.get_or_404(ReportJob, job_id)
+    status = job_status(job)
+    if job.status == ReportJob.DONE:
+        status['download_url'] = url_for('download_report_job', job_id=job.id)
+    return jsonify(status)
+
+@app.route('/jobs/<job_id>/download')
+@login_required
+def download_report_job(job_id):
+    job = db.get_or_404(ReportJob, job_id)
+    if job.status != ReportJob.DONE or not job.result_path or not os.path.exists(job.result_path):
+        flash('This report is not available for download.', 'warning')
+        return redirect(url_for('report_job_detail', job_id=job.id))
+    return send_file(job.result_path, as_attachment=True, download_name=job.download_name, mimetype=job.mimetype)
 
 # --- Future Enhancements Routes ---
 @app.route('/future-enhancements')
@@ -1889,8 +2154,11 @@ def submit_user_needs():
 @login_required
 def accounts_payable():
     """Display list of accounts payable."""
-    payables = AccountsPayable.query.order_by(AccountsPayable.due_date).all()
-    return render_template('accounts_payable/index.html', payables=payables)
+    query = AccountsPayable.query.options(*loading_options(AccountsPayable))
+    page = paginate_request(query, AccountsPayable.due_date, AccountsPayable.id)
+    status_totals = {status.name: total
+                     for status, _, total in group_summary(AccountsPayable.status, AccountsPayable.amount) if status}
+    return render_template('accounts_payable/index.html', payables=page, status_totals=status_totals)
 
 @app.route('/add_accounts_payable', methods=['GET', 'POST'])
 @login_required
@@ -1970,8 +2238,10 @@ def delete_accounts_payable(id):
 @login_required
 def paid_accounts():
     """Display list of paid accounts."""
-    accounts = PaidAccount.query.order_by(PaidAccount.payment_date.desc()).all()
-    return render_template('paid_accounts/index.html', accounts=accounts)
+    query = PaidAccount.query.options(*loading_options(PaidAccount))
+    page = paginate_request(query, PaidAccount.payment_date.desc(), PaidAccount.id.desc())
+    method_summary = group_summary(PaidAccount.payment_method, PaidAccount.amount)
+    return render_template('paid_accounts/index.html', accounts=page, method_summary=method_summary)
 
 @app.route('/add_paid_account', methods=['GET', 'POST'])
 @login_required
@@ -2102,12 +2372,22 @@ def delete_paid_account(id):
     return redirect(url_for('paid_accounts'))
 
 # Monthly Expenses Routes
+MONTHLY_SUMMARY_MONTHS = 12  # Months shown in the monthly totals of the list page
+
 @app.route('/monthly_expenses')
 @login_required
 def monthly_expenses():
     """Display list of monthly expenses."""
-    expenses = MonthlyExpense.query.order_by(MonthlyExpense.expense_date.desc()).all()
-    return render_template('monthly_expenses/index.html', expenses=expenses)
+    query = MonthlyExpense.query.options(*loading_options(MonthlyExpense))
+    page = paginate_request(query, MonthlyExpense.expense_date.desc(), MonthlyExpense.id.desc())
+    category_summary = group_summary(MonthlyExpense.category, MonthlyExpense.amount)
+    # The most recent months with expenses
+    month = bucket_expr(MonthlyExpense.expense_date, 'month')
+    month_summary = [(date.fromisoformat(start), count, total) for start, count, total in db.session.execute(
+        db.select(month, db.func.count(), db.func.sum(MonthlyExpense.amount))
+        .group_by(month).order_by(month.desc()).limit(MONTHLY_SUMMARY_MONTHS))]
+    return render_template('monthly_expenses/index.html', expenses=page, category_summary=category_summary,
+                           month_summary=month_summary)
 
 @app.route('/add_monthly_expense', methods=['GET', 'POST'])
 @login_required
@@ -2173,8 +2453,48 @@ def delete_monthly_expense(id):
     return redirect(url_for('monthly_expenses'))
 
 # Financial Reports
+# (column name, key column, date column, amount column, filters) of every
+# source in the spending breakdowns. Only unpaid payables are counted, since
+# paying one records a paid account.
+UNPAID_PAYABLES = ('Unpaid Payables', AccountsPayable.due_date, AccountsPayable.amount,
+                   (AccountsPayable.status != PaymentStatus.PAID,))
+SPENDING_BY_CATEGORY = (
+    ('Monthly Expenses', MonthlyExpense.category, MonthlyExpense.expense_date, MonthlyExpense.amount, ()),
+    ('Paid Accounts', PaidAccount.category, PaidAccount.payment_date, PaidAccount.amount, ()),
+    (UNPAID_PAYABLES[0], AccountsPayable.category, *UNPAID_PAYABLES[1:]),
+    ('Project Expenses', Expense.category, Expense.date, Expense.amount, ()),
+    ('Materials', Material.category, Material.purchase_date, Material.cost, ()),
+)
+SPENDING_BY_VENDOR = (
+    ('Paid Accounts', PaidAccount.vendor, PaidAccount.payment_date, PaidAccount.amount, ()),
+    (UNPAID_PAYABLES[0], AccountsPayable.vendor, *UNPAID_PAYABLES[1:]),
+    ('Project Expenses', Expense.supplier_vendor, Expense.date, Expense.amount, ()),
+    ('Materials', Material.supplier, Material.purchase_date, Material.cost, ()),
+)
+TOP_VENDORS = 15
+
+def spending_breakdown(sources, start, end, limit=None):
+    """Spending per category (or vendor) over start..end, one grouped query
+    per source.
+
+    Returns:
+        List of dicts with 'label', 'amounts' (one per source, in order) and
+        'total', largest total first
+    """
+    rows = {}
+    for index, (_, key, date_column, amount, filters) in enumerate(sources):
+        for label, total in totals_by(key, date_column, start, end, value=amount, filters=filters).items():
+            label = getattr(label, 'value', label)
+            label = label.strip() if label and label.strip() else 'Unspecified'
+            row = rows.setdefault(label, {'label': label, 'amounts': [0] * len(sources), 'total': 0})
+            row['amounts'][index] += total
+            row['total'] += total
+    ordered = sorted(rows.values(), key=lambda row: (-row['total'], row['label']))
+    return ordered[:limit] if limit else ordered
+
 @app.route('/financial_reports')
 @login_required
+@read_only_view
 def financial_reports():
     """Display financial reports."""
     # Get current date for calculations
@@ -2219,18 +2539,30 @@ def financial_reports():
         MonthlyExpense.expense_date <= month_end
     ).count()
     
+    # Period picked with the year/month filters (the whole current year by default)
+    selected_year = request.args.get('year', current_year, type=int)
+    if not 2000 <= selected_year <= current_year + 1:
+        selected_year = current_year
+    selected_month = request.args.get('month', 'all')
+    if selected_month not in [str(month) for month in range(1, 13)]:
+        selected_month = 'all'
+    period_start, period_end = period_range(
+        selected_year, None if selected_month == 'all' else int(selected_month))
+    
     # Get payment status data for the chart
     payment_status_labels = ['Paid', 'Pending', 'Overdue']
     
-    paid_amount = db.session.query(db.func.sum(PaidAccount.amount)).scalar() or 0
-    pending_amount = db.session.query(db.func.sum(AccountsPayable.amount)).filter(
-        AccountsPayable.status == PaymentStatus.PENDING
-    ).scalar() or 0
-    overdue_amount = db.session.query(db.func.sum(AccountsPayable.amount)).filter(
-        AccountsPayable.status == PaymentStatus.OVERDUE
+    paid_amount = db.session.query(db.func.sum(PaidAccount.amount)).filter(
+        PaidAccount.payment_date >= period_start,
+        PaidAccount.payment_date <= period_end
     ).scalar() or 0
+    unpaid_by_status = totals_by(AccountsPayable.status, AccountsPayable.due_date, period_start, period_end,
+                                 value=AccountsPayable.amount,
+                                 filters=(AccountsPayable.status != PaymentStatus.PAID,))
     
-    payment_status_data = [paid_amount, pending_amount, overdue_amount]
+    payment_status_data = [paid_amount,
+                           unpaid_by_status.get(PaymentStatus.PENDING, 0),
+                           unpaid_by_status.get(PaymentStatus.OVERDUE, 0)]
     
     # Get upcoming payments (due in next 30 days)
     upcoming_payments = []
@@ -2249,59 +2581,22 @@ def financial_reports():
         })
     
     # Get expense categories data for the chart
-    expense_categories = {}
-    for expense in MonthlyExpense.query.all():
-        category = expense.category.value
-        if category in expense_categories:
-            expense_categories[category] += expense.amount
-        else:
-            expense_categories[category] = expense.amount
+    expense_categories = totals_by(MonthlyExpense.category, MonthlyExpense.expense_date, period_start, period_end,
+                                   value=MonthlyExpense.amount)
+    expense_categories_labels = [category.value for category in expense_categories]
+    expense_categories_data = [round(total, 2) for total in expense_categories.values()]
     
-    expense_categories_labels = list(expense_categories.keys())
-    expense_categories_data = list(expense_categories.values())
+    # Spending breakdowns for the period
+    category_breakdown = spending_breakdown(SPENDING_BY_CATEGORY, period_start, period_end)
+    vendor_breakdown = spending_breakdown(SPENDING_BY_VENDOR, period_start, period_end, limit=TOP_VENDORS)
     
     # Calculate cash flow data (income vs expenses) for the past 6 months
-    cash_flow_labels = []
-    income_data = []
-    expense_data = []
-    
-    for i in range(6):
-        # Calculate month offset from current month
-        # Adjust for previous year if needed
-        if current_month - i <= 0:
-            target_month = 12 + current_month - i
-            target_year = current_year - 1
-        else:
-            target_month = current_month - i
-            target_year = current_year
-        
-        # Calculate start and end of month
-        start_date = date(target_year, target_month, 1)
-        if target_month == 12:
-            end_date = date(target_year, 12, 31)
-        else:
-            end_date = date(target_year, target_month + 1, 1) - timedelta(days=1)
-            
-        # Add month label (format: 'Jan', 'Feb', etc.)
-        cash_flow_labels.insert(0, start_date.strftime('%b'))
-        
-        # Calculate monthly income (from paid accounts)
-        monthly_income = db.session.query(db.func.sum(PaidAccount.amount)).filter(
-            PaidAccount.payment_date >= start_date,
-            PaidAccount.payment_date <= end_date
-        ).scalar() or 0
-        income_data.insert(0, round(monthly_income, 2))
-        
-        # Calculate monthly expenses
-        monthly_expense = db.session.query(db.func.sum(MonthlyExpense.amount)).filter(
-            MonthlyExpense.expense_date >= start_date,
-            MonthlyExpense.expense_date <= end_date
-        ).scalar() or 0
-        expense_data.insert(0, round(monthly_expense, 2))
-    
-    # Prepare data for the template
-    selected_year = current_year
-    selected_month = 'all'  # Default to show all months
+    start, end = last_buckets(6, 'month', today)
+    income = time_series(PaidAccount.payment_date, start, end, 'month', value=PaidAccount.amount)
+    expenses = time_series(MonthlyExpense.expense_date, start, end, 'month', value=MonthlyExpense.amount)
+    cash_flow_labels = [month.strftime('%b') for month, _ in income]
+    income_data = [round(total, 2) for _, total in income]
+    expense_data = [round(total, 2) for _, total in expenses]
     
     return render_template('financial_reports/index.html',
                           # Summary cards data
@@ -2321,8 +2616,17 @@ def financial_reports():
                           income_data=income_data,
                           expense_data=expense_data,
                           
+                          # Breakdowns
+                          category_sources=[source[0] for source in SPENDING_BY_CATEGORY],
+                          category_breakdown=category_breakdown,
+                          vendor_sources=[source[0] for source in SPENDING_BY_VENDOR],
+                          vendor_breakdown=vendor_breakdown,
+                          top_vendors=TOP_VENDORS,
+                          
                           # Other data
                           upcoming_payments=upcoming_payments,
+                          period_start=period_start,
+                          period_end=period_end,
                           current_year=current_year,
                           selected_year=selected_year,
                           selected_month=selected_month)
@@ -2331,77 +2635,51 @@ def financial_reports():
 @app.route('/backup_database')
 @login_required
 def backup_database():
-    """Create a backup of the current database and send it as a download.
-    Improved version that includes validation, metadata, and better error handling.
+    """Download a gzip-compressed online backup of the database.
+    With ?verify=1 the copy is integrity-checked by a background job afterwards.
     """
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    backup_path = os.path.join(backup_dir(), f"erp_backup_{timestamp}_{uuid.uuid4().hex[:8]}.db")
+    verify = bool(request.args.get('verify'))
     try:
-        # Close database connection to ensure all writes are flushed
-        db.session.close()
-        
-        # Get the path to the current database file
-        db_path = app.config['SQLALCHEMY_DATABASE_URI'].replace('sqlite:///', '')
-        
-        # Create a timestamp for the backup filename
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        backup_dir = os.path.join(os.path.dirname(db_path), 'backups')
-        os.makedirs(backup_dir, exist_ok=True)
-        
-        # Create a temporary copy to avoid backing up a file that's in use
-        temp_backup_path = os.path.join(backup_dir, f"erp_backup_{timestamp}.db")
-        
-        # Copy the database to our backup location
-        import shutil
-        shutil.copy2(db_path, temp_backup_path)
-        
-        # Validate the backup by ensuring it's a valid SQLite database
-        import sqlite3
-        try:
-            conn = sqlite3.connect(temp_backup_path)
-            # Try to get the database version to verify it's a valid SQLite file
-            cursor = conn.cursor()
-            cursor.execute("PRAGMA integrity_check;")
-            integrity_result = cursor.fetchone()[0]
-            if integrity_result != "ok":
-                raise Exception(f"Database integrity check failed: {integrity_result}")
-                
-            # Add metadata about the backup to track version and date
-            try:
-                cursor.execute("CREATE TABLE IF NOT EXISTS backup_metadata (key TEXT PRIMARY KEY, value TEXT);")
-                cursor.execute("INSERT OR REPLACE INTO backup_metadata VALUES (?, ?)", 
-                              ("backup_date", datetime.now().isoformat()))
-                cursor.execute("INSERT OR REPLACE INTO backup_metadata VALUES (?, ?)", 
-                              ("backup_version", "2.0"))
-                cursor.execute("INSERT OR REPLACE INTO backup_metadata VALUES (?, ?)", 
-                              ("system_version", "Mauricio PDQ ERP 2025.4.30"))
-                conn.commit()
-            except Exception as metadata_error:
-                # Non-fatal error - just log it
-                print(f"Error adding metadata to backup: {str(metadata_error)}")
-                
-            cursor.close()
-            conn.close()
-        except Exception as validation_error:
-            # Clean up the invalid backup file
-            os.remove(temp_backup_path)
-            raise Exception(f"Invalid database backup: {str(validation_error)}")
-            
-        # Backup successfully validated, now send it to the user
-        return send_file(
-            temp_backup_path,
-            as_attachment=True,
-            download_name=f"erp_backup_{timestamp}.db",
-            mimetype='application/octet-stream'
-        )
+        if verify:
+            # The verification job reads the copy from disk
+            online_backup(backup_path)
+            backup_file = open(backup_path, 'rb')
+        else:
+            backup_file, _ = open_download_backup(backup_path)
     except Exception as e:
+        if os.path.exists(backup_path):
+            os.remove(backup_path)
         flash(f'Error creating database backup: {str(e)}', 'danger')
         return redirect(url_for('index'))
+    
+    response = Response(
+        gzip_chunks(backup_file),
+        mimetype='application/gzip',
+        headers={'Content-Disposition': f'attachment; filename=erp_backup_{timestamp}.db.gz'}
+    )
+    if verify:
+        # The verification job removes the copy when it is done
+        submit_job('backup_verify', {'path': backup_path}, description=f'Verify backup {timestamp}')
+        flash('Backup verification started; see Report Jobs for the result.', 'info')
+    else:
+        response.call_on_close(lambda: os.path.exists(backup_path) and os.remove(backup_path))
+    return response
+
+@report_job('backup_verify')
+def verify_backup_job(params, output_path, progress):
+    """Background job: integrity-check a backup copy, then remove it."""
+    try:
+        problems = check_backup(params['path'])
     finally:
-        # Clean up temporary files if they exist
-        if 'temp_backup_path' in locals() and os.path.exists(temp_backup_path):
-            try:
-                os.remove(temp_backup_path)
-            except:
-                pass  # Ignore cleanup errors
+        if os.path.exists(params['path']):
+            os.remove(params['path'])
+    if problems:
+        raise ValueError('Backup verification failed: ' + '; '.join(problems[:10]))
+    with open(output_path, 'w') as f:
+        f.write('Backup verified: integrity check ok\n')
+    return 'backup_verification.txt', 'text/plain'
 
 @app.route('/restore_database', methods=['POST'])
 @login_required
@@ -2434,13 +2712,21 @@ def restore_database():
             return redirect(url_for('index'))
             
         # Validate file extension
-        if not backup_file.filename.lower().endswith('.db'):
-            flash('Invalid backup file format. Only .db files are supported.', 'danger')
+        filename = backup_file.filename.lower()
+        if not filename.endswith(('.db', '.db.gz')):
+            flash('Invalid backup file format. Only .db and .db.gz files are supported.', 'danger')
             return redirect(url_for('index'))
         
         # Save uploaded file to temporary location for validation
         temp_file_path = os.path.join(temp_dir, 'uploaded_backup.db')
-        backup_file.save(temp_file_path)
+        if filename.endswith('.gz'):
+            try:
+                gunzip_to(backup_file.stream, temp_file_path)
+            except (OSError, EOFError) as e:
+                flash(f'Invalid backup file: {str(e)}', 'danger')
+                return redirect(url_for('index'))
+        else:
+            backup_file.save(temp_file_path)
         
         # Validate that this is a proper SQLite database
         try:
@@ -2478,36 +2764,10 @@ def restore_database():
             flash(f'Invalid backup file: {str(validation_error)}', 'danger')
             return redirect(url_for('index'))
         
-        # Get the path to the current database file
-        db_path = app.config['SQLALCHEMY_DATABASE_URI'].replace('sqlite:///', '')
-        
-        # Close all database connections
-        db.session.close()
-        db.engine.dispose()
-        
-        # Create a backup of the current database before restoring in case something goes wrong
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        backup_dir = os.path.join(os.path.dirname(db_path), 'backups')
-        os.makedirs(backup_dir, exist_ok=True)
-        pre_restore_backup = os.path.join(backup_dir, f"pre_restore_{timestamp}.db")
-        shutil.copy2(db_path, pre_restore_backup)
-        
-        # Save the validated backup file to the database path
-        shutil.copy2(temp_file_path, db_path)
-        
-        # Reinitialize the database connection
-        db.engine.dispose()
-        
-        # Try to connect to the new database to verify it worked
         try:
-            with app.app_context():
-                db.session.execute("SELECT 1")
-                db.session.commit()
-        except Exception as verify_error:
-            # If new database doesn't work, revert to backup
-            shutil.copy2(pre_restore_backup, db_path)
-            db.engine.dispose()
-            flash(f'Error verifying restored database, reverted to previous state: {str(verify_error)}', 'danger')
+            replace_database(temp_file_path)
+        except BackupError as e:
+            flash(str(e), 'danger')
             return redirect(url_for('index'))
         
         flash('Database successfully restored from backup. The page will refresh to show the restored data.', 'success')
@@ -2523,6 +2783,36 @@ def restore_database():
             except:
                 pass  # Ignore cleanup errors
 
+@app.route('/backups')
+@login_required
+def backups():
+    """Catalog of scheduled backup points"""
+    return render_template('backups.html', points=backup_points())
+
+@app.route('/backups/run', methods=['POST'])
+@login_required
+def run_backup():
+    """Record a backup point now (full with full=1)"""
+    try:
+        point = run_scheduled_backup(full=bool(request.form.get('full')))
+    except BackupError as e:
+        flash(str(e), 'danger')
+    else:
+        flash(f"Backup point {point['id']} recorded ({point['kind']}, {point['changed_pages']} pages stored).", 'success')
+    return redirect(url_for('backups'))
+
+@app.route('/backups/<int:point_id>/restore', methods=['POST'])
+@login_required
+def restore_backup(point_id):
+    """Replace the database with a catalog point"""
+    try:
+        restore_backup_point(point_id)
+    except BackupError as e:
+        flash(str(e), 'danger')
+        return redirect(url_for('backups'))
+    flash(f'Database restored to backup point {point_id}.', 'success')
+    return redirect(url_for('index'))
+
 # --- Create DB tables ---
 @app.cli.command('init-db')
 def init_db_command():
@@ -2531,6 +2821,60 @@ def init_db_command():
         db.create_all()
     print('Initialized the database.')
 
+@app.cli.command('rebuild-financials')
+def rebuild_financials_command():
+    """Recomputes the project_financials summary table for every project."""
+    with app.app_context():
+        count = refresh_project_financials()
+        db.session.commit()
+    print(f'Rebuilt financial summaries for {count} projects.')
+
+@app.cli.command('sql-profile-report')
+def sql_profile_report_command():
+    """Summarizes the SQL profile log by endpoint, heaviest first."""
+    summary = summarize_profile_log(app.config['SQL_PROFILE_LOG'])
+    if not summary:
+        print('No profiled requests found.')
+        return
+    print(f"{'Endpoint':<32} {'Requests':>8} {'Avg Q':>7} {'Max Q':>6} {'Avg DB ms':>10} {'Avg ms':>9} {'Total DB ms':>12}")
+    for row in summary:
+        print(f"{str(row['endpoint']):<32} {row['requests']:>8} {row['avg_queries']:>7.1f} {row['max_queries']:>6} "
+              f"{row['avg_db_ms']:>10.2f} {row['avg_duration_ms']:>9.2f} {row['total_db_ms']:>12.2f}")
+
+@app.cli.command('fail-orphaned-jobs')
+def fail_orphaned_jobs_command():
+    """Marks report jobs failed whose web worker has gone away (run from cron)."""
+    with app.app_context():
+        count = fail_orphaned_jobs()
+    print(f'{count} orphaned report jobs marked failed.')
+
+@app.cli.command('backup')
+@click.option('--full', is_flag=True, help='Start a new chain with a full base.')
+def backup_command(full):
+    """Records a scheduled backup point and applies the retention policy (run from cron)."""
+    with app.app_context():
+        point = run_scheduled_backup(full=full)
+    print(f"Backup point {point['id']}: {point['kind']}, {point['changed_pages']} of {point['page_count']} pages, "
+          f"{point['size']} bytes.")
+
+@app.cli.command('list-backups')
+def list_backups_command():
+    """Lists the backup catalog, newest first."""
+    with app.app_context():
+        points = backup_points()
+    print(f"{'ID':>5} {'Created':<20} {'Kind':<12} {'Base':>5} {'Pages':>8} {'Changed':>8} {'Bytes':>12}")
+    for point in points:
+        print(f"{point['id']:>5} {point['created_at']:<20} {point['kind']:<12} {point['base_id']:>5} "
+              f"{point['page_count']:>8} {point['changed_pages']:>8} {point['size']:>12}")
+
+@app.cli.command('restore-backup')
+@click.argument('point_id', type=int)
+def restore_backup_command(point_id):
+    """Replaces the database with the given backup point."""
+    with app.app_context():
+        restore_backup_point(point_id)
+    print(f'Restored backup point {point_id}.')
+
 # --- Main execution ---
 if __name__ == '__main__':
     with app.app_context():
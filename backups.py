@@ -0,0 +1,456 @@
+"""Online database backups.
+
+Backups are taken with SQLite's online backup API from a separate read-only
+connection, a few pages per step, so writers only ever wait for one step
+rather than for a copy of the whole file. The backup API can only write into
+another database, not into a stream, so a download is first copied into an
+in-memory database and streamed to the browser gzip-compressed from there,
+with nothing written to disk. Databases larger than BACKUP_IN_MEMORY_MAX_MB,
+and downloads that are verified afterwards, are copied to a file in the
+backup directory instead, which is removed once it has been sent (or
+checked). Verifying the copy (PRAGMA integrity_check) is optional and runs as
+a background report job, which removes the file once it is done.
+
+Scheduled backups (run_scheduled_backup, the `flask backup` command) keep a
+catalog of restorable points instead of full copies. A point is the set of
+database pages that changed since the previous point, found by comparing a
+hash of every page against the previous point's page manifest; every
+BACKUP_FULL_INTERVAL_HOURS (or BACKUP_MAX_CHAIN points) a full base is taken
+and a new chain starts. Rebuilding a point applies its chain newest first and
+writes each page once, then checks the result against the point's checksum.
+The catalog is its own SQLite file in the backup directory, so restoring the
+application database never rewinds it.
+
+Configuration (app.config):
+    BACKUP_DIR: Where backup copies are written (default instance/backups)
+    BACKUP_PAGES_PER_STEP: Pages copied per backup step (default 1024)
+    BACKUP_STEP_SLEEP: Seconds between steps, so writers get a turn (default 0.005)
+    BACKUP_IN_MEMORY_MAX_MB: Largest database a download is copied into memory for (default 64)
+    BACKUP_FULL_INTERVAL_HOURS: Age of a chain's full base before a new one is taken (default 168)
+    BACKUP_MAX_CHAIN: Most points in one chain, base included (default 200)
+    BACKUP_KEEP_CHAINS: Chains kept by the retention policy (default 4)
+    BACKUP_KEEP_PRE_RESTORE: pre_restore_* copies kept (default 3)
+"""
+import fcntl
+import glob
+import gzip
+import hashlib
+import io
+import os
+import shutil
+import sqlite3
+import struct
+import uuid
+import zlib
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from database import dispose_engines
+from models import db
+
+# Bytes read from the backup copy per compressed chunk
+BACKUP_CHUNK_SIZE = 1024 * 1024
+# Tables a file must have to be taken for an ERP database
+ESSENTIAL_TABLES = ('employee', 'project', 'timesheet', 'invoice')
+SYSTEM_VERSION = 'Mauricio PDQ ERP 2025.4.30'
+# Bytes of page hash stored per page in a point's manifest
+PAGE_HASH_SIZE = 16
+FULL, INCREMENTAL = 'full', 'incremental'
+
+
+class BackupError(Exception):
+    """Raised when a backup point can't be taken or rebuilt."""
+
+
+def init_backups(app):
+    """Set the backup configuration defaults on the Flask app."""
+    app.config.setdefault('BACKUP_DIR', os.path.join(app.instance_path, 'backups'))
+    app.config.setdefault('BACKUP_PAGES_PER_STEP', 1024)
+    app.config.setdefault('BACKUP_STEP_SLEEP', 0.005)
+    app.config.setdefault('BACKUP_IN_MEMORY_MAX_MB', 64)
+    app.config.setdefault('BACKUP_FULL_INTERVAL_HOURS', 7 * 24)
+    app.config.setdefault('BACKUP_MAX_CHAIN', 200)
+    app.config.setdefault('BACKUP_KEEP_CHAINS', 4)
+    app.config.setdefault('BACKUP_KEEP_PRE_RESTORE', 3)
+
+
+def database_path():
+    """Path of the application's SQLite database file."""
+    return db.engine.url.database
+
+
+def backup_dir():
+    path = current_app.config['BACKUP_DIR']
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def online_backup(dest_path, progress=None, metadata=True):
+    """Copy the live database to dest_path with the online backup API.
+
+    Each step copies BACKUP_PAGES_PER_STEP pages inside its own short read
+    transaction. Unless metadata is False, the copy gets a backup_metadata
+    table recording when and from which version it was taken.
+
+    Args:
+        progress: Optional progress(done, total) callback, in pages
+    """
+    dest = sqlite3.connect(dest_path)
+    try:
+        _backup_into(dest, progress, metadata)
+        # A rollback journal keeps the copy a single self-contained file
+        dest.execute('PRAGMA journal_mode = DELETE')
+    finally:
+        dest.close()
+
+
+def _backup_into(dest, progress=None, metadata=True):
+    """Copy the live database into an open sqlite3 connection (see online_backup)."""
+    source = sqlite3.connect(f'file:{database_path()}?mode=ro', uri=True)
+    try:
+        source.backup(dest, pages=current_app.config['BACKUP_PAGES_PER_STEP'],
+                      sleep=current_app.config['BACKUP_STEP_SLEEP'],
+                      progress=(lambda status, remaining, total: progress(total - remaining, total))
+                      if progress else None)
+    finally:
+        source.close()
+    if metadata:
+        with dest:
+            dest.execute("CREATE TABLE IF NOT EXISTS backup_metadata (key TEXT PRIMARY KEY, value TEXT)")
+            dest.executemany("INSERT OR REPLACE INTO backup_metadata VALUES (?, ?)", [
+                ('backup_date', datetime.now().isoformat()),
+                ('backup_version', '3.0'),
+                ('system_version', SYSTEM_VERSION),
+            ])
+
+
+def open_download_backup(spill_path):
+    """Take an online backup for download and return it as an open binary file.
+
+    Databases up to BACKUP_IN_MEMORY_MAX_MB are copied into memory, so
+    nothing is written to disk; larger ones are copied to spill_path.
+
+    Returns:
+        (file, path): path is spill_path when the copy was written there
+        (the caller removes it), None for an in-memory copy
+    """
+    limit = current_app.config['BACKUP_IN_MEMORY_MAX_MB'] * 1024 * 1024
+    if os.path.getsize(database_path()) > limit:
+        online_backup(spill_path)
+        return open(spill_path, 'rb'), spill_path
+    dest = sqlite3.connect(':memory:')
+    try:
+        _backup_into(dest)
+        image = bytearray(dest.serialize())
+    finally:
+        dest.close()
+    # The copy keeps the source's WAL flags in its header; mark it as a
+    # rollback journal database, as online_backup does for files
+    image[18:20] = b'\x01\x01'
+    return io.BytesIO(image), None
+
+
+def gzip_chunks(file, chunk_size=BACKUP_CHUNK_SIZE):
+    """Yield the gzip-compressed content of an open binary file, chunk by chunk."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31 = gzip container
+    with file:
+        while True:
+            data = file.read(chunk_size)
+            if not data:
+                break
+            chunk = compressor.compress(data)
+            if chunk:
+                yield chunk
+    yield compressor.flush()
+
+
+def gunzip_to(source, dest_path):
+    """Decompress an uploaded gzip backup (a file-like object) to dest_path."""
+    with gzip.open(source) as compressed, open(dest_path, 'wb') as f:
+        shutil.copyfileobj(compressed, f, BACKUP_CHUNK_SIZE)
+
+
+def check_backup(path):
+    """Integrity check of a backup copy.
+
+    Returns:
+        List of problems found, empty when the copy is sound
+    """
+    conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    try:
+        problems = [row[0] for row in conn.execute('PRAGMA integrity_check')]
+        if problems == ['ok']:
+            problems = []
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        problems += [f"Missing '{table}' table" for table in ESSENTIAL_TABLES if table not in tables]
+        return problems
+    finally:
+        conn.close()
+
+
+def replace_database(source_path):
+    """Install the SQLite file at source_path as the application database.
+
+    The current database is first copied to a pre_restore_* backup; if the
+    installed file can't be opened, that copy is put back and BackupError is
+    raised.
+    """
+    db_path = database_path()
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    pre_restore_backup = os.path.join(backup_dir(), f"pre_restore_{timestamp}.db")
+    online_backup(pre_restore_backup)
+
+    # Empty the WAL file so none of its pages get applied to the restored
+    # file, then close all database connections
+    db.session.execute(db.text('PRAGMA wal_checkpoint(TRUNCATE)'))
+    db.session.close()
+    dispose_engines(db)
+    shutil.copy2(source_path, db_path)
+    dispose_engines(db)
+
+    try:
+        db.session.execute(db.text('SELECT 1'))
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        shutil.copy2(pre_restore_backup, db_path)
+        dispose_engines(db)
+        raise BackupError(f'Error verifying restored database, reverted to previous state: {e}') from e
+    finally:
+        prune_pre_restore_backups()
+
+
+def prune_pre_restore_backups():
+    """Keep only the newest BACKUP_KEEP_PRE_RESTORE pre-restore copies."""
+    paths = sorted(glob.glob(os.path.join(backup_dir(), 'pre_restore_*.db')), reverse=True)
+    for path in paths[current_app.config['BACKUP_KEEP_PRE_RESTORE']:]:
+        os.remove(path)
+
+
+# --- Scheduled incremental backups ---
+def _points_dir():
+    path = os.path.join(backup_dir(), 'points')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+@contextmanager
+def backup_catalog():
+    """Connection to the backup catalog, committed when the block exits."""
+    conn = sqlite3.connect(os.path.join(backup_dir(), 'catalog.db'))
+    conn.row_factory = sqlite3.Row
+    try:
+        conn.execute("""CREATE TABLE IF NOT EXISTS backup_point (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            base_id INTEGER,
+            created_at TEXT NOT NULL,
+            page_size INTEGER NOT NULL,
+            page_count INTEGER NOT NULL,
+            changed_pages INTEGER NOT NULL,
+            size INTEGER NOT NULL,
+            checksum TEXT NOT NULL,
+            stem TEXT NOT NULL
+        )""")
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+def backup_points():
+    """All catalog points, newest first."""
+    with backup_catalog() as catalog:
+        return [dict(row) for row in catalog.execute('SELECT * FROM backup_point ORDER BY id DESC')]
+
+
+@contextmanager
+def _backup_lock():
+    with open(os.path.join(backup_dir(), 'backup.lock'), 'w') as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise BackupError('Another backup is already running')
+        yield
+
+
+def _page_size(path):
+    with open(path, 'rb') as f:
+        header = f.read(18)
+    if len(header) < 18 or not header.startswith(b'SQLite format 3\0'):
+        raise BackupError(f'{path} is not an SQLite database')
+    size = struct.unpack('>H', header[16:18])[0]
+    return 65536 if size == 1 else size
+
+
+def _point_files(stem):
+    return os.path.join(_points_dir(), f'{stem}.pages.gz'), os.path.join(_points_dir(), f'{stem}.manifest')
+
+
+def _needs_full(latest, page_size, now):
+    if latest is None or latest['page_size'] != page_size:
+        return True
+    config = current_app.config
+    with backup_catalog() as catalog:
+        base = catalog.execute('SELECT * FROM backup_point WHERE id = ?', (latest['base_id'],)).fetchone()
+        chain_length = catalog.execute('SELECT count(*) FROM backup_point WHERE base_id = ?',
+                                       (latest['base_id'],)).fetchone()[0]
+    if base is None or chain_length >= config['BACKUP_MAX_CHAIN']:
+        return True
+    return now - datetime.fromisoformat(base['created_at']) >= timedelta(hours=config['BACKUP_FULL_INTERVAL_HOURS'])
+
+
+def run_scheduled_backup(full=False, now=None):
+    """Record a new catalog point, then apply the retention policy.
+
+    The point is a full base when `full` is set or one is due, otherwise the
+    pages changed since the latest point.
+
+    Returns:
+        The new point as a dict of its catalog columns
+    """
+    now = now or datetime.now()
+    with _backup_lock():
+        points = backup_points()
+        latest = points[0] if points else None
+        snapshot_path = os.path.join(backup_dir(), f'snapshot_{uuid.uuid4().hex}.db')
+        try:
+            online_backup(snapshot_path, metadata=False)
+            page_size = _page_size(snapshot_path)
+            kind = FULL if full or _needs_full(latest, page_size, now) else INCREMENTAL
+            previous = b''
+            if kind == INCREMENTAL:
+                with open(_point_files(latest['stem'])[1], 'rb') as f:
+                    previous = f.read()
+            stem = f"{now.strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}"
+            page_count, changed_pages, checksum = _write_point(snapshot_path, page_size, previous, stem)
+        finally:
+            if os.path.exists(snapshot_path):
+                os.remove(snapshot_path)
+
+        size = sum(os.path.getsize(path) for path in _point_files(stem))
+        with backup_catalog() as catalog:
+            cursor = catalog.execute(
+                'INSERT INTO backup_point (kind, base_id, created_at, page_size, page_count, changed_pages, size, '
+                'checksum, stem) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (kind, None if kind == FULL else latest['base_id'], now.isoformat(timespec='seconds'), page_size,
+                 page_count, changed_pages, size, checksum, stem))
+            point_id = cursor.lastrowid
+            if kind == FULL:
+                catalog.execute('UPDATE backup_point SET base_id = id WHERE id = ?', (point_id,))
+        apply_backup_retention()
+        return next(point for point in backup_points() if point['id'] == point_id)
+
+
+def _write_point(snapshot_path, page_size, previous, stem):
+    """Write the pages of the snapshot whose hash differs from `previous`
+    (the previous point's manifest; empty for a full base).
+
+    Returns:
+        (page_count, changed_pages, sha256 of the snapshot)
+    """
+    pages_path, manifest_path = _point_files(stem)
+    checksum = hashlib.sha256()
+    page_count = changed_pages = 0
+    with open(snapshot_path, 'rb') as snapshot, gzip.open(f'{pages_path}.tmp', 'wb', compresslevel=6) as pages, \
+            open(f'{manifest_path}.tmp', 'wb') as manifest:
+        while True:
+            page = snapshot.read(page_size)
+            if not page:
+                break
+            page_count += 1
+            checksum.update(page)
+            digest = hashlib.blake2b(page, digest_size=PAGE_HASH_SIZE).digest()
+            manifest.write(digest)
+            offset = (page_count - 1) * PAGE_HASH_SIZE
+            if previous[offset:offset + PAGE_HASH_SIZE] != digest:
+                pages.write(struct.pack('>I', page_count))
+                pages.write(page)
+                changed_pages += 1
+    os.replace(f'{pages_path}.tmp', pages_path)
+    os.replace(f'{manifest_path}.tmp', manifest_path)
+    return page_count, changed_pages, checksum.hexdigest()
+
+
+def _read_pages(stem, page_size):
+    """(page number, page bytes) pairs stored for a point."""
+    with gzip.open(_point_files(stem)[0], 'rb') as pages:
+        while True:
+            header = pages.read(4)
+            if not header:
+                return
+            yield struct.unpack('>I', header)[0], pages.read(page_size)
+
+
+def rebuild_backup_point(point_id, dest_path):
+    """Rebuild the database as it was at a catalog point into dest_path.
+
+    Raises:
+        BackupError: if the point doesn't exist or the result doesn't match
+            its checksum
+    """
+    with backup_catalog() as catalog:
+        point = catalog.execute('SELECT * FROM backup_point WHERE id = ?', (point_id,)).fetchone()
+        if point is None:
+            raise BackupError(f'No backup point {point_id}')
+        chain = catalog.execute('SELECT * FROM backup_point WHERE base_id = ? AND id <= ? ORDER BY id DESC',
+                                (point['base_id'], point_id)).fetchall()
+
+    page_size, page_count = point['page_size'], point['page_count']
+    written = bytearray(page_count + 1)
+    remaining = page_count
+    with open(dest_path, 'wb') as dest:
+        dest.truncate(page_count * page_size)
+        # Newest first, so every page is written once, from the latest point that has it
+        for chain_point in chain:
+            for page_number, page in _read_pages(chain_point['stem'], page_size):
+                if page_number <= page_count and not written[page_number]:
+                    dest.seek((page_number - 1) * page_size)
+                    dest.write(page)
+                    written[page_number] = 1
+                    remaining -= 1
+            if not remaining:
+                break
+
+    checksum = hashlib.sha256()
+    with open(dest_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(BACKUP_CHUNK_SIZE), b''):
+            checksum.update(chunk)
+    if remaining or checksum.hexdigest() != point['checksum']:
+        os.remove(dest_path)
+        raise BackupError(f'Backup point {point_id} could not be rebuilt: checksum mismatch')
+
+
+def restore_backup_point(point_id):
+    """Replace the application database with a rebuilt catalog point."""
+    rebuilt_path = os.path.join(backup_dir(), f'rebuild_{uuid.uuid4().hex}.db')
+    try:
+        rebuild_backup_point(point_id, rebuilt_path)
+        replace_database(rebuilt_path)
+    finally:
+        if os.path.exists(rebuilt_path):
+            os.remove(rebuilt_path)
+
+
+def apply_backup_retention():
+    """Delete every chain but the newest BACKUP_KEEP_CHAINS, and their files.
+
+    Returns:
+        Number of points deleted
+    """
+    keep = max(1, current_app.config['BACKUP_KEEP_CHAINS'])
+    with backup_catalog() as catalog:
+        bases = [row['id'] for row in catalog.execute(
+            "SELECT id FROM backup_point WHERE kind = ? ORDER BY id DESC", (FULL,))]
+        if len(bases) <= keep:
+            return 0
+        oldest_kept = bases[keep - 1]
+        expired = catalog.execute('SELECT id, stem FROM backup_point WHERE base_id < ?', (oldest_kept,)).fetchall()
+        catalog.execute('DELETE FROM backup_point WHERE base_id < ?', (oldest_kept,))
+    for point in expired:
+        for path in _point_files(point['stem']):
+            if os.path.exists(path):
+                os.remove(path)
+    return len(expired)
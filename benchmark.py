@@ -0,0 +1,494 @@
+"""Benchmark harness for the heavy pages and exports.
+
+Builds a synthetic dataset of a chosen size in a separate SQLite database using
+bulk (executemany) inserts, then times the key routes through the Flask test
+client and writes the results as JSON, so runs from two commits can be
+compared.
+
+Usage:
+    python benchmark.py --employees 500 --projects 5000 --timesheets 2000000 --invoices 200000
+    python benchmark.py --reuse --compare instance/benchmarks/abc1234.json
+
+The benchmark database defaults to instance/benchmark.db and never touches
+instance/erp.db. Pass --reuse to time an existing benchmark database without
+regenerating it.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+from datetime import date, datetime, time, timedelta
+from time import perf_counter
+
+from models import (db, User, Employee, Project, Timesheet, Material, Expense, Invoice, PayrollPayment,
+                    PayrollDeduction, AccountsPayable, PaidAccount, MonthlyExpense, ProjectStatus, PaymentMethod,
+                    PaymentStatus, DeductionType, ExpenseCategory)
+from profiling import current_profile
+from rollups import refresh_project_financials, refresh_timesheet_totals
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DB_PATH = os.path.join(BASE_DIR, 'instance', 'benchmark.db')
+DEFAULT_RESULTS_DIR = os.path.join(BASE_DIR, 'instance', 'benchmarks')
+
+BENCH_USERNAME = 'benchmark'
+BENCH_PASSWORD = 'benchmark'
+
+# Rows per executemany batch
+CHUNK_SIZE = 20000
+
+DEFAULT_SIZES = {
+    'employees': 50,
+    'projects': 500,
+    'timesheets': 100000,
+    'invoices': 10000,
+    'materials': 2000,
+    'expenses': 1000,
+    'payroll_weeks': 26,
+    'accounts_payable': 500,
+    'monthly_expenses': 500,
+}
+
+PAGE_ROUTES = [
+    ('index', '/'),
+    ('projects', '/projects'),
+    ('timesheets', '/timesheets'),
+    ('payroll_report', '/payroll/report'),
+    ('financial_reports', '/financial_reports'),
+]
+EXPORT_ENTITIES = ['projects', 'timesheets', 'expenses', 'payroll']
+EXPORT_FORMATS = ['excel', 'csv', 'pdf']
+
+
+def benchmark_routes(include_exports=True):
+    """(name, url) pairs timed by the benchmark."""
+    routes = list(PAGE_ROUTES)
+    if include_exports:
+        for entity in EXPORT_ENTITIES:
+            for fmt in EXPORT_FORMATS:
+                routes.append((f'export_{entity}_{fmt}', f'/export/{entity}/{fmt}'))
+    return routes
+
+
+# --- Dataset generation ---
+def _bulk_insert(model, rows):
+    """Insert an iterable of row dicts with executemany, CHUNK_SIZE rows at a time."""
+    table = model.__table__
+    count = 0
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= CHUNK_SIZE:
+            db.session.execute(table.insert(), chunk)
+            count += len(chunk)
+            chunk = []
+    if chunk:
+        db.session.execute(table.insert(), chunk)
+        count += len(chunk)
+    return count
+
+
+def _next_id(model):
+    return (db.session.query(db.func.max(model.id)).scalar() or 0) + 1
+
+
+def _random_date(rng, start, days):
+    return start + timedelta(days=rng.randrange(days))
+
+
+def generate_dataset(sizes=None, seed=42, today=None):
+    """Bulk-insert a synthetic dataset into the current database.
+
+    Args:
+        sizes: Row counts keyed like DEFAULT_SIZES; missing keys use the defaults.
+        seed: Seed for the random generator, so a given size and seed always
+            produce the same data.
+        today: Reference date; data spans the two years before it.
+
+    Returns:
+        Dict of table name to number of rows inserted.
+    """
+    sizes = dict(DEFAULT_SIZES, **(sizes or {}))
+    rng = random.Random(seed)
+    today = today or date.today()
+    span_start = today - timedelta(days=730)
+    span_days = 730
+    inserted = {}
+
+    # Explicit ids let child rows reference parents without reading them back
+    first_employee = _next_id(Employee)
+    employee_ids = list(range(first_employee, first_employee + sizes['employees']))
+    pay_rates = {}
+
+    def employees():
+        for n, employee_id in enumerate(employee_ids):
+            pay_rates[employee_id] = round(rng.uniform(16.0, 38.0), 2)
+            yield {
+                'id': employee_id,
+                'name': f'Bench Employee {n}',
+                'employee_id_str': f'BENCH-E{employee_id:06d}',
+                'pay_rate': pay_rates[employee_id],
+                'payment_method_preference': rng.choice([PaymentMethod.CASH, PaymentMethod.CHECK]),
+                'is_active': rng.random() < 0.9,
+                'hire_date': _random_date(rng, span_start - timedelta(days=365), 365),
+            }
+    inserted['employee'] = _bulk_insert(Employee, employees())
+
+    first_project = _next_id(Project)
+    project_ids = list(range(first_project, first_project + sizes['projects']))
+    statuses = list(ProjectStatus)
+
+    def projects():
+        for n, project_id in enumerate(project_ids):
+            start = _random_date(rng, span_start, span_days)
+            yield {
+                'id': project_id,
+                'name': f'Bench Project {n}',
+                'project_id_str': f'BENCH-P{project_id:06d}',
+                'client_name': f'Client {rng.randrange(max(1, sizes["projects"] // 5))}',
+                'location': f'{rng.randrange(1, 9999)} Main St',
+                'start_date': start,
+                'end_date': start + timedelta(days=rng.randrange(7, 180)),
+                'contract_value': round(rng.uniform(2000, 250000), 2),
+                'status': rng.choice(statuses),
+            }
+    inserted['project'] = _bulk_insert(Project, projects())
+
+    def timesheets():
+        for _ in range(sizes['timesheets']):
+            entry = time(rng.randrange(6, 10), rng.choice([0, 15, 30, 45]))
+            exit_hour = min(entry.hour + rng.randrange(4, 11), 23)
+            yield {
+                'employee_id': rng.choice(employee_ids),
+                'project_id': rng.choice(project_ids),
+                'date': _random_date(rng, span_start, span_days),
+                'entry_time': entry,
+                'exit_time': time(exit_hour, rng.choice([0, 15, 30, 45])),
+                'lunch_duration_minutes': rng.choice([0, 15, 30, 45, 60]),
+            }
+    inserted['timesheet'] = _bulk_insert(Timesheet, timesheets())
+    # Core inserts skip the mapper events that fill the stored totals
+    refresh_timesheet_totals()
+
+    def materials():
+        for n in range(sizes['materials']):
+            yield {
+                'project_id': rng.choice(project_ids),
+                'description': f'Material {n}',
+                'supplier': f'Supplier {rng.randrange(50)}',
+                'cost': round(rng.uniform(20, 5000), 2),
+                'purchase_date': _random_date(rng, span_start, span_days),
+                'category': rng.choice(['Paint', 'Drywall', 'Tools', 'Lumber']),
+            }
+    inserted['material'] = _bulk_insert(Material, materials())
+
+    def expenses():
+        for n in range(sizes['expenses']):
+            yield {
+                'project_id': rng.choice(project_ids),
+                'description': f'Expense {n}',
+                'category': rng.choice(['Fuel', 'Permits', 'Rental', 'Meals']),
+                'amount': round(rng.uniform(10, 2000), 2),
+                'date': _random_date(rng, span_start, span_days),
+                'supplier_vendor': f'Vendor {rng.randrange(50)}',
+                'payment_method': rng.choice(list(PaymentMethod)),
+                'payment_status': rng.choice(list(PaymentStatus)),
+            }
+    inserted['expense'] = _bulk_insert(Expense, expenses())
+
+    first_invoice = _next_id(Invoice)
+
+    def invoices():
+        for n in range(sizes['invoices']):
+            invoice_date = _random_date(rng, span_start, span_days)
+            status = rng.choice(list(PaymentStatus))
+            amount = round(rng.uniform(500, 50000), 2)
+            yield {
+                'project_id': rng.choice(project_ids),
+                'invoice_number': f'BENCH-{first_invoice + n:08d}',
+                'invoice_date': invoice_date,
+                'due_date': invoice_date + timedelta(days=30),
+                'base_amount': amount,
+                'tax_amount': 0.0,
+                'amount': amount,
+                'status': status,
+                'payment_received_date': (invoice_date + timedelta(days=rng.randrange(1, 60))
+                                          if status == PaymentStatus.PAID else None),
+            }
+    inserted['invoice'] = _bulk_insert(Invoice, invoices())
+
+    # One payment per employee per week, a third of them with a deduction
+    first_payment = _next_id(PayrollPayment)
+    deductions = []
+
+    def payroll_payments():
+        payment_id = first_payment
+        week_end = today - timedelta(days=(today.weekday() - 3) % 7)  # Last Thursday
+        for week in range(sizes['payroll_weeks']):
+            period_end = week_end - timedelta(weeks=week)
+            for employee_id in employee_ids:
+                gross = round(pay_rates[employee_id] * rng.uniform(20, 45), 2)
+                deduction = round(rng.uniform(20, 150), 2) if rng.random() < 0.33 else 0.0
+                if deduction:
+                    deductions.append({
+                        'payroll_payment_id': payment_id,
+                        'description': 'Advance',
+                        'amount': deduction,
+                        'deduction_type': rng.choice(list(DeductionType)),
+                    })
+                method = rng.choice([PaymentMethod.CASH, PaymentMethod.CHECK])
+                yield {
+                    'id': payment_id,
+                    'employee_id': employee_id,
+                    'pay_period_start': period_end - timedelta(days=6),
+                    'pay_period_end': period_end,
+                    'gross_amount': gross,
+                    'amount': gross - deduction,
+                    'payment_date': period_end + timedelta(days=1),
+                    'payment_method': method,
+                    'check_number': f'{payment_id}' if method == PaymentMethod.CHECK else None,
+                }
+                payment_id += 1
+    inserted['payroll_payment'] = _bulk_insert(PayrollPayment, payroll_payments())
+    inserted['payroll_deduction'] = _bulk_insert(PayrollDeduction, deductions)
+
+    first_payable = _next_id(AccountsPayable)
+    paid_accounts = []
+
+    def accounts_payable():
+        for n in range(sizes['accounts_payable']):
+            payable_id = first_payable + n
+            issue_date = _random_date(rng, span_start, span_days)
+            status = rng.choice(list(PaymentStatus))
+            row = {
+                'id': payable_id,
+                'vendor': f'Vendor {rng.randrange(50)}',
+                'description': f'Order {n}',
+                'amount': round(rng.uniform(100, 10000), 2),
+                'issue_date': issue_date,
+                'due_date': issue_date + timedelta(days=30),
+                'category': rng.choice(list(ExpenseCategory)),
+                'status': status,
+                'project_id': rng.choice(project_ids),
+            }
+            if status == PaymentStatus.PAID:
+                paid_accounts.append({
+                    'vendor': row['vendor'],
+                    'amount': row['amount'],
+                    'payment_date': issue_date + timedelta(days=rng.randrange(1, 30)),
+                    'payment_method': rng.choice(list(PaymentMethod)),
+                    'category': row['category'],
+                    'accounts_payable_id': payable_id,
+                    'project_id': row['project_id'],
+                })
+            yield row
+    inserted['accounts_payable'] = _bulk_insert(AccountsPayable, accounts_payable())
+    inserted['paid_account'] = _bulk_insert(PaidAccount, paid_accounts)
+
+    def monthly_expenses():
+        for n in range(sizes['monthly_expenses']):
+            yield {
+                'description': f'Overhead {n}',
+                'amount': round(rng.uniform(50, 5000), 2),
+                'expense_date': _random_date(rng, span_start, span_days),
+                'category': rng.choice(list(ExpenseCategory)),
+                'payment_method': rng.choice(list(PaymentMethod)),
+                'project_id': rng.choice(project_ids) if rng.random() < 0.3 else None,
+            }
+    inserted['monthly_expense'] = _bulk_insert(MonthlyExpense, monthly_expenses())
+
+    # Bulk inserts bypass the ORM flush hooks, so rebuild the summaries once
+    refresh_project_financials(project_ids)
+
+    if not User.query.filter_by(username=BENCH_USERNAME).first():
+        user = User(username=BENCH_USERNAME)
+        user.set_password(BENCH_PASSWORD)
+        db.session.add(user)
+    db.session.commit()
+    return inserted
+
+
+# --- Timing ---
+def time_route(client, url, repeat=3, warmup=1):
+    """Request `url` warmup + repeat times and return timing statistics."""
+    for _ in range(warmup):
+        client.get(url).close()
+
+    durations = []
+    response = None
+    for _ in range(repeat):
+        start = perf_counter()
+        response = client.get(url)
+        body = response.get_data()
+        durations.append((perf_counter() - start) * 1000)
+        response.close()
+
+    result = {
+        'url': url,
+        'status': response.status_code,
+        'bytes': len(body),
+        'runs': repeat,
+        'min_ms': round(min(durations), 3),
+        'median_ms': round(statistics.median(durations), 3),
+        'mean_ms': round(statistics.mean(durations), 3),
+        'max_ms': round(max(durations), 3),
+    }
+    # The client keeps the last request's context, so its SQL profile is still
+    # readable; it is finished on close, so streamed exports count the
+    # queries run while their body was sent
+    profile = current_profile()
+    if profile is not None:
+        result['queries'] = profile.query_count
+        result['db_ms'] = round(profile.db_time * 1000, 3)
+    return result
+
+
+def run_benchmarks(app, routes=None, repeat=3, warmup=1, log=None):
+    """Log in as the benchmark user and time each route.
+
+    Returns:
+        Dict of route name to the time_route() statistics. A route that raises
+        is recorded with its error instead of aborting the run.
+    """
+    routes = routes or benchmark_routes()
+    client = app.test_client()
+    client.post('/login', data={'username': BENCH_USERNAME, 'password': BENCH_PASSWORD})
+
+    results = {}
+    with client:
+        for name, url in routes:
+            try:
+                results[name] = time_route(client, url, repeat=repeat, warmup=warmup)
+            except Exception as e:
+                results[name] = {'url': url, 'error': f'{type(e).__name__}: {e}'}
+            if log:
+                log(_format_result(name, results[name]))
+    return results
+
+
+def _format_result(name, result):
+    if 'error' in result:
+        return f"{name:<28} ERROR {result['error']}"
+    return (f"{name:<28} {result['status']:>4} {result['median_ms']:>10.1f} ms "
+            f"{result.get('queries', '-'):>5} q {result['bytes']:>12} B")
+
+
+def compare_results(previous, current, threshold=0.10):
+    """Compare median timings of two result files.
+
+    Returns:
+        List of (name, previous_ms, current_ms, change) for routes present in
+        both runs, and the subset whose median grew by more than `threshold`.
+    """
+    rows = []
+    regressions = []
+    for name, result in current['results'].items():
+        before = previous['results'].get(name)
+        if not before or 'median_ms' not in before or 'median_ms' not in result:
+            continue
+        change = (result['median_ms'] - before['median_ms']) / before['median_ms'] if before['median_ms'] else 0.0
+        row = (name, before['median_ms'], result['median_ms'], change)
+        rows.append(row)
+        if change > threshold:
+            regressions.append(row)
+    return rows, regressions
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=BASE_DIR,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _row_counts():
+    models = [Employee, Project, Timesheet, Material, Expense, Invoice, PayrollPayment, PayrollDeduction,
+              AccountsPayable, PaidAccount, MonthlyExpense]
+    return {model.__tablename__: db.session.query(db.func.count(model.id)).scalar() for model in models}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the ERP pages and exports on a synthetic dataset.')
+    for key, default in DEFAULT_SIZES.items():
+        parser.add_argument(f"--{key.replace('_', '-')}", type=int, default=default, dest=key)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--db', default=DEFAULT_DB_PATH, help='Benchmark database path')
+    parser.add_argument('--reuse', action='store_true', help='Time an existing benchmark database as is')
+    parser.add_argument('--repeat', type=int, default=3, help='Timed requests per route')
+    parser.add_argument('--warmup', type=int, default=1, help='Untimed requests per route')
+    parser.add_argument('--no-exports', action='store_true', help='Skip the /export/* routes')
+    parser.add_argument('--output', help='Results file (default instance/benchmarks/<commit>.json)')
+    parser.add_argument('--compare', help='Previous results file to compare against')
+    parser.add_argument('--threshold', type=float, default=0.10, help='Regression threshold for --compare')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    db_path = os.path.abspath(args.db)
+    if not args.reuse and os.path.exists(db_path):
+        os.remove(db_path)
+    os.makedirs(os.path.dirname(db_path), exist_ok=True)
+
+    # The engine is created when app.py is imported, so point it at the
+    # benchmark database first
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    os.environ['SQL_PROFILE_LOG'] = ''
+    from app import app
+    app.config.update({'WTF_CSRF_ENABLED': False, 'QUERY_BUDGETS_ENFORCED': False})
+    app.logger.disabled = True  # Failing routes are recorded in the results instead
+
+    sizes = {key: getattr(args, key) for key in DEFAULT_SIZES}
+    with app.app_context():
+        db.create_all()
+        if not args.reuse:
+            print(f'Generating dataset in {db_path} ...')
+            start = perf_counter()
+            generate_dataset(sizes, seed=args.seed)
+            print(f'Generated in {perf_counter() - start:.1f}s')
+        row_counts = _row_counts()
+
+    print(f"{'Route':<28} {'Code':>4} {'Median':>13} {'Queries':>7} {'Size':>14}")
+    results = run_benchmarks(app, benchmark_routes(not args.no_exports), repeat=args.repeat, warmup=args.warmup,
+                             log=print)
+
+    commit = _git_commit()
+    report = {
+        'meta': {
+            'commit': commit,
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'seed': args.seed,
+            'sizes': sizes if not args.reuse else None,
+            'row_counts': row_counts,
+            'repeat': args.repeat,
+        },
+        'results': results,
+    }
+    output = args.output or os.path.join(DEFAULT_RESULTS_DIR, f"{commit or 'results'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'Results written to {output}')
+
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+        rows, regressions = compare_results(previous, report, args.threshold)
+        print(f"\n{'Route':<28} {'Before ms':>10} {'After ms':>10} {'Change':>8}")
+        for name, before, after, change in rows:
+            print(f'{name:<28} {before:>10.1f} {after:>10.1f} {change:>+8.1%}')
+        if regressions:
+            print(f'{len(regressions)} route(s) slower by more than {args.threshold:.0%}')
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
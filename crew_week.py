@@ -0,0 +1,166 @@
+"""Weekly crew timesheet grid.
+
+One project's timesheets for a Friday-Thursday work week, as a grid of
+employees by days. The whole grid is posted at once: every filled cell is
+checked with the bulk timesheet rules (timesheet_import.validate_punches)
+against the employee and project rows loaded to draw the grid, and the
+changes are written with one executemany per kind (insert, update, delete) in
+a single transaction. Nothing is saved while any cell is invalid.
+
+A cell holds one timesheet. When an employee has several entries for the
+project on the same day, the grid edits the first one and leaves the others
+alone.
+
+Each cell also posts the row it was drawn from (see CrewWeek.shown), so a
+grid loaded before someone else's save never deletes or overwrites a row its
+user didn't see: an edited cell whose row changed meanwhile is reported
+instead of saved, and an untouched cell is left alone whatever its row holds
+now.
+"""
+from datetime import timedelta
+
+import pandas as pd
+from sqlalchemy import bindparam
+
+from models import db, Employee, Timesheet
+from rollups import refresh_project_financials
+from timesheet_import import validate_punches, lookup_frame
+
+CELL_FIELDS = ('entry', 'exit', 'lunch')
+SHOWN_FIELD = 'shown'  # Hidden input with the row a cell was drawn from
+EMPLOYEE_COLUMNS = (Employee.id, Employee.name, Employee.employee_id_str, Employee.is_active, Employee.pay_rate)
+
+
+def cell_name(employee_id, day, field):
+    """Form field name of one input of a grid cell."""
+    return f'{employee_id}-{day.isoformat()}-{field}'
+
+
+class CrewWeek:
+    """Timesheets of one project for the week starting on `week_start`.
+
+    Attributes:
+        days: The seven dates of the week
+        employees: Active employees, plus any inactive one with an entry this
+            week, by name
+        cells: Dict of (employee id, date) -> existing timesheet row
+    """
+
+    def __init__(self, project, week_start):
+        self.project = project
+        self.changed = set()  # Edited cells whose row changed after the grid was drawn (see save)
+        self.days = [week_start + timedelta(days=offset) for offset in range(7)]
+        table = Timesheet.__table__
+        existing = db.session.execute(
+            db.select(table.c.id, table.c.employee_id, table.c.date, table.c.entry_time, table.c.exit_time,
+                      table.c.lunch_duration_minutes)
+            .where(table.c.project_id == project.id, table.c.date.between(self.days[0], self.days[-1]))
+            .order_by(table.c.id)
+        ).all()
+        self.cells = {}
+        for row in existing:
+            self.cells.setdefault((row.employee_id, row.date), row)
+        worked = {employee_id for employee_id, _ in self.cells}
+        self.employees = db.session.execute(
+            db.select(*EMPLOYEE_COLUMNS)
+            .where(db.or_(Employee.is_active.is_(True), Employee.id.in_(worked)))
+            .order_by(Employee.name, Employee.id)
+        ).all()
+
+    def values(self, employee_id, day):
+        """(entry, exit, lunch) to show in a cell, as form text."""
+        row = self.cells.get((employee_id, day))
+        if row is None:
+            return '', '', ''
+        lunch = row.lunch_duration_minutes
+        return row.entry_time.strftime('%H:%M'), row.exit_time.strftime('%H:%M'), '' if not lunch else str(lunch)
+
+    def shown(self, employee_id, day):
+        """Hidden form value of a cell: the id and values of the row it shows,
+        or '' for an empty cell."""
+        row = self.cells.get((employee_id, day))
+        return '' if row is None else '|'.join((str(row.id), *self.values(employee_id, day)))
+
+    def shown_input(self, employee_id, day, posted=None):
+        """Hidden form value to draw for a cell. A rejected form is redrawn
+        with the posted value, so a cell that still has the values it was
+        loaded with is still compared with the row its user saw; cells
+        reported as changed get the current row, so saving again overwrites
+        it knowingly."""
+        if posted is None or (employee_id, day) in self.changed:
+            return self.shown(employee_id, day)
+        return posted.get(cell_name(employee_id, day, SHOWN_FIELD), '')
+
+    def _conflict(self, employee_id, day):
+        """Error of an edited cell whose row changed after the grid was drawn."""
+        entry, exit_, lunch = self.values(employee_id, day)
+        if not entry:
+            return 'Someone else removed this entry after the week was loaded.'
+        lunch = f', {lunch} min lunch' if lunch else ''
+        return f'Someone else saved {entry}-{exit_}{lunch} here after the week was loaded.'
+
+    def save(self, form):
+        """Validate the posted grid and write its changes.
+
+        Returns:
+            (errors, counts): `errors` maps (employee id, date) to the message
+            of each invalid cell and of each edited cell whose row changed
+            since the grid was drawn, and nothing is written when there is
+            one; `counts` has the number of entries 'added', 'updated' and
+            'removed'
+        """
+        keys, punches, removed, errors = [], [], [], {}
+        for employee in self.employees:
+            for day in self.days:
+                posted = tuple(form.get(cell_name(employee.id, day, field), '').strip() for field in CELL_FIELDS)
+                seen = form.get(cell_name(employee.id, day, SHOWN_FIELD), '')
+                if posted == (tuple(seen.split('|')[1:]) if seen else ('', '', '')):
+                    continue  # Not edited, whatever the row holds now
+                if seen != self.shown(employee.id, day):
+                    self.changed.add((employee.id, day))
+                    errors[(employee.id, day)] = self._conflict(employee.id, day)
+                    continue
+                entry, exit_, lunch = posted
+                if not (entry or exit_ or lunch):
+                    removed.append(self.cells[(employee.id, day)].id)
+                    continue
+                keys.append((employee.id, day))
+                punches.append({'employee': str(employee.id), 'project': str(self.project.id),
+                                'date': day.isoformat(), 'entry_time': entry, 'exit_time': exit_,
+                                'lunch_duration_minutes': lunch})
+
+        counts = {'added': 0, 'updated': 0, 'removed': len(removed)}
+        if punches:
+            frame = pd.DataFrame(punches, columns=['employee', 'project', 'date', 'entry_time', 'exit_time',
+                                                   'lunch_duration_minutes'])
+            employees = lookup_frame(self.employees, [column.key for column in EMPLOYEE_COLUMNS])
+            projects = lookup_frame([(self.project.id, self.project.status)], ['id', 'status'])
+            rows, rejected = validate_punches(frame, employees, projects)
+            errors.update((keys[position], message) for position, message in rejected.items())
+        if errors:
+            return errors, dict.fromkeys(counts, 0)
+        if punches:
+            rows['id'] = [getattr(self.cells.get(keys[position]), 'id', None) for position in rows.index]
+            inserts = rows[rows['id'].isna()].drop(columns='id').to_dict('records')
+            updates = rows[rows['id'].notna()].rename(columns={'id': 'timesheet_id'}).to_dict('records')
+            counts.update(added=len(inserts), updated=len(updates))
+        else:
+            inserts = updates = []
+
+        if not (inserts or updates or removed):
+            return {}, counts
+        table = Timesheet.__table__
+        try:
+            if inserts:
+                db.session.execute(table.insert(), inserts)
+            if updates:
+                # The other keys of each row become the SET clause
+                db.session.execute(table.update().where(table.c.id == bindparam('timesheet_id')), updates)
+            if removed:
+                db.session.execute(table.delete().where(table.c.id.in_(removed)))
+            refresh_project_financials([self.project.id])
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        return {}, counts
@@ -0,0 +1,107 @@
+"""Dashboard context with a per-process cache.
+
+The dashboard is the landing page after every login, and building it takes a
+couple dozen queries. The figures it shows only change when projects,
+invoices, timesheets, expenses, materials or pay rates do, so the computed context is
+kept in memory for DASHBOARD_CACHE_TTL seconds and dropped as soon as this
+process commits a change to one of those tables. Other processes pick the
+change up when their copy expires.
+
+Only plain values (dicts, numbers, enums) are cached, never ORM instances,
+which would be detached from their session on the next request.
+
+Configuration (app.config):
+    DASHBOARD_CACHE_TTL: Seconds a computed context is reused; 0 disables the cache (default 60)
+"""
+import threading
+from datetime import date
+from time import monotonic
+
+from flask import current_app
+from sqlalchemy import event
+
+from models import Employee, Project, ProjectFinancial
+from rollups import FINANCIAL_SOURCES
+
+# Writes to these invalidate the cached context: everything that feeds
+# project_financials (pay rates reprice projects) and the table itself
+DASHBOARD_SOURCES = (Project, Employee, ProjectFinancial) + FINANCIAL_SOURCES
+_SOURCE_TABLES = frozenset(model.__table__ for model in DASHBOARD_SOURCES)
+
+_cache = {}  # 'key', 'expires' and 'context' of the cached dashboard
+_generation = [0]  # Bumped by every invalidation
+_lock = threading.Lock()
+
+
+def init_dashboard_cache(app):
+    """Set the dashboard cache defaults on the Flask app."""
+    app.config.setdefault('DASHBOARD_CACHE_TTL', 60)
+
+
+def invalidate_dashboard():
+    """Drop the cached dashboard context of this process."""
+    with _lock:
+        _cache.clear()
+        _generation[0] += 1
+
+
+def dashboard_context(build, today=None):
+    """Template context of the dashboard for `today`, cached per process.
+
+    Args:
+        build: build(today) computes the context on a cache miss
+    """
+    today = today or date.today()
+    ttl = current_app.config['DASHBOARD_CACHE_TTL']
+    with _lock:
+        # The weekly and monthly figures depend on the date
+        if ttl and _cache.get('key') == today and _cache['expires'] > monotonic():
+            return _cache['context']
+        generation = _generation[0]
+
+    context = build(today)
+    with _lock:
+        # Don't store figures read before a commit that invalidated them
+        if ttl and generation == _generation[0]:
+            _cache.update(key=today, expires=monotonic() + ttl, context=context)
+    return context
+
+
+# --- Invalidation ---
+_TOUCHED = 'dashboard_sources_touched'
+
+
+def _after_flush(session, flush_context):
+    if any(isinstance(obj, DASHBOARD_SOURCES)
+           for obj in list(session.new) + list(session.dirty) + list(session.deleted)):
+        session.info[_TOUCHED] = True
+
+
+def _on_bulk_write(orm_execute_state):
+    """Statement-level writes bypass the flush: query-level UPDATE/DELETE (e.g.
+    delete_timesheet), Core inserts (timesheet import) and the
+    project_financials upsert, which runs on the table rather than the model."""
+    if not (orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    mapper = orm_execute_state.bind_mapper
+    table = mapper.local_table if mapper is not None else getattr(orm_execute_state.statement, 'table', None)
+    if table in _SOURCE_TABLES:
+        orm_execute_state.session.info[_TOUCHED] = True
+
+
+def _after_commit(session):
+    if session.info.pop(_TOUCHED, False):
+        invalidate_dashboard()
+
+
+def _after_rollback(session):
+    session.info.pop(_TOUCHED, None)
+
+
+def register_dashboard_events(session):
+    """Invalidate the dashboard cache when a session commits changes to its sources."""
+    if not event.contains(session, 'after_commit', _after_commit):
+        event.listen(session, 'after_flush', _after_flush)
+        event.listen(session, 'do_orm_execute', _on_bulk_write)
+        event.listen(session, 'after_commit', _after_commit)
+        event.listen(session, 'after_rollback', _after_rollback)
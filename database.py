@@ -0,0 +1,163 @@
+"""SQLite engine setup.
+
+Every connection gets the pragmas below when it is opened: WAL journaling lets
+readers and writers work at the same time, synchronous=NORMAL is safe with WAL
+and avoids an fsync per commit, and busy_timeout makes a writer wait for the
+lock instead of failing straight away with "database is locked".
+
+Reports and exports also get a second, read-only engine on the same file.
+Inside read_only_session() or a @read_only_view, SELECTs run on that engine in
+one explicit transaction, so the whole report reads a single consistent
+snapshot of the database; under WAL that snapshot never blocks the timesheet
+entry going on meanwhile. Flushes and other statements still go to the main
+engine.
+
+Configuration (app.config):
+    SQLITE_JOURNAL_MODE: Journal mode (default WAL)
+    SQLITE_SYNCHRONOUS: Synchronous setting (default NORMAL)
+    SQLITE_BUSY_TIMEOUT_MS: How long to wait for a lock (default 5000)
+    SQLITE_MMAP_SIZE: Bytes of the file to memory-map (default 256 MB)
+    SQLITE_CACHE_SIZE_KB: Page cache per connection (default 64 MB)
+    SQLITE_READ_ONLY_ENGINE: Create the read-only engine (default True)
+    SQLITE_READ_POOL_SIZE: Connections kept by the read-only engine (default 4)
+"""
+from contextlib import contextmanager
+from functools import wraps
+
+import sqlalchemy as sa
+from flask import current_app
+from flask_sqlalchemy.session import Session
+
+# SQLALCHEMY_BINDS key of the read-only engine
+READ_ONLY_BIND = 'read_only'
+# Session.info flag that routes SELECTs to the read-only engine
+_READ_ONLY = 'read_only'
+
+
+class ErpSession(Session):
+    """Session that sends SELECTs to the read-only engine while read-only
+    mode is on (see read_only_session)."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self.info.get(_READ_ONLY) and getattr(clause, 'is_select', False):
+            engine = self._db.engines.get(READ_ONLY_BIND)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def init_database(app, db):
+    """Set the engine configuration defaults, create the engines and install
+    the connection pragmas. Replaces db.init_app(app)."""
+    app.config.setdefault('SQLITE_JOURNAL_MODE', 'WAL')
+    app.config.setdefault('SQLITE_SYNCHRONOUS', 'NORMAL')
+    app.config.setdefault('SQLITE_BUSY_TIMEOUT_MS', 5000)
+    app.config.setdefault('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)
+    app.config.setdefault('SQLITE_CACHE_SIZE_KB', 64 * 1024)
+    app.config.setdefault('SQLITE_READ_ONLY_ENGINE', True)
+    app.config.setdefault('SQLITE_READ_POOL_SIZE', 4)
+
+    read_only_url = _read_only_url(app.config['SQLALCHEMY_DATABASE_URI'])
+    if app.config['SQLITE_READ_ONLY_ENGINE'] and read_only_url is not None:
+        app.config.setdefault('SQLALCHEMY_BINDS', {})[READ_ONLY_BIND] = {
+            'url': read_only_url,
+            'poolclass': sa.pool.QueuePool,
+            'pool_size': app.config['SQLITE_READ_POOL_SIZE'],
+            'connect_args': {'check_same_thread': False},
+        }
+
+    db.init_app(app)
+
+    with app.app_context():
+        engines = db.engines
+    if engines[None].dialect.name == 'sqlite':
+        sa.event.listen(engines[None], 'connect', _pragma_listener(app.config, read_only=False))
+    if READ_ONLY_BIND in engines:
+        sa.event.listen(engines[READ_ONLY_BIND], 'connect', _pragma_listener(app.config, read_only=True))
+        sa.event.listen(engines[READ_ONLY_BIND], 'begin', _begin_snapshot)
+
+    @app.teardown_request
+    def _end_read_only(exc):
+        # A test client request can share its app context (and session) with
+        # the test, so don't leave the snapshot open after the request
+        if db.session.info.pop(_READ_ONLY, False):
+            db.session.rollback()
+
+
+def _read_only_url(uri):
+    """URL of a read-only connection to the same SQLite file, or None when
+    the database isn't an SQLite file."""
+    url = sa.engine.make_url(uri)
+    if not url.drivername.startswith('sqlite') or url.database in (None, '', ':memory:'):
+        return None
+    database = url.database if url.query.get('uri') else f'file:{url.database}'
+    return url.set(database=database, query={**url.query, 'mode': 'ro', 'uri': 'true'})
+
+
+def _pragma_listener(config, read_only):
+    pragmas = [
+        f"PRAGMA busy_timeout = {int(config['SQLITE_BUSY_TIMEOUT_MS'])}",
+        f"PRAGMA mmap_size = {int(config['SQLITE_MMAP_SIZE'])}",
+        f"PRAGMA cache_size = -{int(config['SQLITE_CACHE_SIZE_KB'])}",
+    ]
+    if read_only:
+        pragmas.append('PRAGMA query_only = ON')
+    else:
+        # The journal mode is stored in the database file, so only the
+        # writing engine sets it
+        pragmas[:0] = [
+            f"PRAGMA journal_mode = {config['SQLITE_JOURNAL_MODE']}",
+            f"PRAGMA synchronous = {config['SQLITE_SYNCHRONOUS']}",
+        ]
+
+    def set_pragmas(dbapi_connection, connection_record):
+        if read_only:
+            # Let _begin_snapshot issue BEGIN itself; pysqlite only begins
+            # transactions before writes
+            dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+    return set_pragmas
+
+
+def _begin_snapshot(connection):
+    # Under WAL the snapshot is taken by the first read after BEGIN and kept
+    # until the transaction ends
+    connection.exec_driver_sql('BEGIN')
+
+
+@contextmanager
+def read_only_session(session=None):
+    """Run the block's SELECTs against one read-only snapshot of the database.
+
+    The snapshot (and the session's transaction) is ended when the block exits.
+    """
+    if session is None:
+        session = current_app.extensions['sqlalchemy'].session
+    previous = session.info.get(_READ_ONLY, False)
+    session.info[_READ_ONLY] = True
+    try:
+        yield session
+    finally:
+        session.info[_READ_ONLY] = previous
+        session.rollback()
+
+
+def read_only_view(view):
+    """Route a view's SELECTs to the read-only snapshot for the rest of the
+    request, including a response streamed after the view returns."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        current_app.extensions['sqlalchemy'].session.info[_READ_ONLY] = True
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def dispose_engines(db):
+    """Close the pooled connections of every engine (e.g. before the database
+    file is replaced)."""
+    for engine in db.engines.values():
+        engine.dispose()
@@ -0,0 +1,158 @@
+"""On-disk cache of rendered customer invoice PDFs.
+
+A customer invoice only depends on a handful of Invoice and Project fields, and
+most prints are repeat copies of an invoice that hasn't changed. Rendered PDFs
+are stored as <invoice id>-<key>.pdf, where the key is a hash of exactly those
+fields (and INVOICE_PDF_VERSION), so a cached file can never be served for an
+invoice whose printed content has changed. Updating an invoice, or the client
+details of its project, also deletes the invoice's stale files right away
+instead of leaving them to age out.
+
+The cache is bounded by size: every hit refreshes the file's mtime, and once
+the directory grows past the limit the least recently used files go first.
+
+Configuration (app.config):
+    INVOICE_PDF_CACHE_DIR: Where PDFs are kept (default instance/invoice_pdfs)
+    INVOICE_PDF_CACHE_MAX_BYTES: Size limit of the directory (default 50 MB)
+"""
+import glob
+import hashlib
+import json
+import os
+import uuid
+
+from flask import current_app, has_app_context
+from sqlalchemy import event
+
+from models import db, Invoice, Project
+
+# Bump when the invoice layout changes so existing files stop matching
+INVOICE_PDF_VERSION = 2
+
+# Fields printed on the customer invoice
+INVOICE_PDF_FIELDS = ('id', 'invoice_date', 'base_amount', 'tax_amount', 'amount', 'description', 'client_phone',
+                      'client_city_state', 'client_contact_name', 'job_location', 'signature_date', 'project_id')
+PROJECT_PDF_FIELDS = ('client_name', 'location')
+
+
+def init_invoice_cache(app):
+    """Set the invoice PDF cache defaults on the Flask app."""
+    app.config.setdefault('INVOICE_PDF_CACHE_DIR', os.path.join(app.instance_path, 'invoice_pdfs'))
+    app.config.setdefault('INVOICE_PDF_CACHE_MAX_BYTES', 50 * 1024 * 1024)
+
+
+def invoice_cache_key(invoice, project):
+    """Hash of everything the rendered PDF depends on."""
+    content = {
+        'version': INVOICE_PDF_VERSION,
+        'invoice': {field: getattr(invoice, field) for field in INVOICE_PDF_FIELDS},
+        'project': {field: getattr(project, field) for field in PROJECT_PDF_FIELDS},
+    }
+    return hashlib.sha256(json.dumps(content, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _cache_dir():
+    path = current_app.config['INVOICE_PDF_CACHE_DIR']
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def invoice_pdf_path(invoice, project):
+    """Cache path of the invoice's current PDF, whether or not it exists yet.
+
+    Returns:
+        (path, key) where key is the content hash, usable as an ETag
+    """
+    key = invoice_cache_key(invoice, project)
+    return os.path.join(_cache_dir(), f'{invoice.id}-{key}.pdf'), key
+
+
+def cached_invoice_pdf(invoice, project, render):
+    """Path of the invoice's PDF, rendering it with render(invoice, project)
+    (which returns the PDF bytes) on a cache miss.
+
+    Returns:
+        (path, key) as from invoice_pdf_path
+    """
+    path, key = invoice_pdf_path(invoice, project)
+    try:
+        os.utime(path)  # Mark as recently used
+        return path, key
+    except FileNotFoundError:
+        pass
+
+    tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(render(invoice, project))
+    os.replace(tmp_path, path)
+    evict_invoice_pdfs()
+    return path, key
+
+
+def evict_invoice_pdfs(max_bytes=None):
+    """Delete the least recently used PDFs until the cache fits in max_bytes.
+
+    Returns:
+        Number of files deleted
+    """
+    if max_bytes is None:
+        max_bytes = current_app.config['INVOICE_PDF_CACHE_MAX_BYTES']
+    entries = []
+    for path in glob.glob(os.path.join(_cache_dir(), '*.pdf')):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        removed += 1
+    return removed
+
+
+def invalidate_invoice_pdfs(invoice_ids):
+    """Delete every cached PDF of the given invoices."""
+    if not has_app_context():
+        return
+    cache_dir = current_app.config.get('INVOICE_PDF_CACHE_DIR')
+    if not cache_dir or not os.path.isdir(cache_dir):
+        return
+    for invoice_id in invoice_ids:
+        for path in glob.glob(os.path.join(cache_dir, f'{invoice_id}-*.pdf')):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def _changed(target, fields):
+    state = db.inspect(target)
+    return any(state.attrs[name].history.has_changes() for name in fields)
+
+
+@event.listens_for(Invoice, 'after_update')
+def _invoice_updated(mapper, connection, target):
+    if _changed(target, INVOICE_PDF_FIELDS):
+        invalidate_invoice_pdfs([target.id])
+
+
+@event.listens_for(Invoice, 'after_delete')
+def _invoice_deleted(mapper, connection, target):
+    invalidate_invoice_pdfs([target.id])
+
+
+@event.listens_for(Project, 'after_update')
+def _project_updated(mapper, connection, target):
+    """The client name and street printed on an invoice come from its project."""
+    if _changed(target, PROJECT_PDF_FIELDS):
+        invoice_ids = connection.scalars(db.select(Invoice.id).where(Invoice.project_id == target.id)).all()
+        invalidate_invoice_pdfs(invoice_ids)
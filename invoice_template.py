@@ -10,21 +10,17 @@ def generate_customer_invoice_pdf(invoice_id):
     """
     from models import Invoice, Project
     from flask import send_file, after_this_request
-    from fpdf import FPDF
+    from pdf_render import ErpPDF
     import tempfile
     import os
     
     invoice = Invoice.query.get_or_404(invoice_id)
     project = Project.query.get_or_404(invoice.project_id)
     
-    # Create PDF object (A4 size)
-    pdf = FPDF(orientation='P', unit='mm', format='A4')
+    # Create PDF object (A4 size) with the shared Unicode fonts
+    pdf = ErpPDF(orientation='P', unit='mm', format='A4', fonts=('', 'B'))
     pdf.add_page()
     
-    # Add Unicode font support
-    pdf.add_font('DejaVu', '', '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf', uni=True)
-    pdf.add_font('DejaVu', 'B', '/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf', uni=True)
-    
     # Set default margins
     pdf.set_margins(15, 15, 15)
     
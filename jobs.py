@@ -0,0 +1,378 @@
+"""Background report jobs.
+
+PDF and export rendering can take long enough to tie up a web worker, so
+those requests can be handed to a small process pool instead. Each job is a
+ReportJob row: the request creates it and returns its id right away, a pool
+process renders the file into the report job directory, and the browser polls
+the job's status until the file can be downloaded.
+
+Renderers register under a job kind with @report_job(kind) and are called as
+renderer(params, output_path, progress) in the pool process, inside an app
+context. They write their file to output_path and return
+(download_name, mimetype). progress(done, total) may be called as often as
+convenient; it only writes when the percentage changes.
+
+Progress is kept in a small file next to the output rather than in the job
+row: a renderer paging through a query holds a read transaction open, and a
+second SQLite connection couldn't commit progress updates meanwhile.
+
+The report_job table is a status record, not a durable queue: queued work
+lives only in the pool of the web process that submitted it. Each job records
+that owner (its pid and a per-process boot id), and the owner holds a lock file
+in REPORT_JOB_DIR/owners for as long as it runs. A job whose pool process dies
+is marked failed straight away; the jobs of an owner that is gone (restarted
+or recycled web worker) are marked failed by fail_orphaned_jobs(), which runs
+on every submit and from `flask fail-orphaned-jobs`. A job merely waiting
+behind long renders in a live pool is left alone. Nothing is retried; the user
+starts the report again.
+
+Configuration (app.config):
+    REPORT_JOB_DIR: Where finished files are written (default instance/reports)
+    REPORT_JOB_WORKERS: Size of the process pool (default 2)
+    REPORT_JOBS_INLINE: Run jobs synchronously in the request (tests)
+    REPORT_JOB_RETENTION_HOURS: Finished jobs and files older than this are purged
+"""
+import importlib
+import itertools
+import json
+import logging
+import os
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from functools import partial
+
+from flask import current_app
+
+from models import db, ReportJob
+
+try:
+    import fcntl
+except ImportError:  # Windows: owners can't be checked, so no job is ever orphaned
+    fcntl = None
+
+logger = logging.getLogger('erp.jobs')
+
+ORPHANED_JOB_ERROR = 'The report was interrupted (the server restarted). Please run it again.'
+CRASHED_JOB_ERROR = 'The report worker stopped unexpectedly. Please run it again.'
+
+# Job kind -> renderer, filled by @report_job
+JOB_RENDERERS = {}
+
+_executor = None
+_worker_app = None  # The app inside a pool process
+_owner = None  # (pid, boot_id, lock file) of this web process, see current_owner
+
+
+def report_job(kind):
+    """Register the decorated function as the renderer for a job kind."""
+    def decorator(renderer):
+        JOB_RENDERERS[kind] = renderer
+        return renderer
+    return decorator
+
+
+def init_report_jobs(app):
+    """Set the job configuration defaults on the Flask app."""
+    app.config.setdefault('REPORT_JOB_DIR', os.path.join(app.instance_path, 'reports'))
+    app.config.setdefault('REPORT_JOB_WORKERS', 2)
+    app.config.setdefault('REPORT_JOBS_INLINE', False)
+    app.config.setdefault('REPORT_JOB_RETENTION_HOURS', 48)
+
+
+def get_executor():
+    """The process pool shared by the report jobs of this web process."""
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=current_app.config['REPORT_JOB_WORKERS'],
+            initializer=_init_worker,
+            initargs=(current_app.import_name,),
+        )
+    return _executor
+
+
+def _init_worker(import_name):
+    """Pool process setup: load the app (and with it the renderers) and drop
+    any database connections inherited from the parent process."""
+    global _worker_app
+    _worker_app = importlib.import_module(import_name).app
+    with _worker_app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+
+
+def map_in_pool(func, items, chunksize=1):
+    """Run func(item) for every item on the report job pool and return the
+    results in order. func must be a module-level function; it runs inside
+    the pool process's app context. With REPORT_JOBS_INLINE the calls run
+    here, one after another."""
+    items = list(items)
+    if current_app.config['REPORT_JOBS_INLINE']:
+        return [func(item) for item in items]
+    return list(get_executor().map(_call_in_worker, itertools.repeat(func), items, chunksize=chunksize))
+
+
+def _call_in_worker(func, item):
+    with _worker_app.app_context():
+        try:
+            return func(item)
+        finally:
+            db.session.remove()
+
+
+def _job_dir():
+    path = current_app.config['REPORT_JOB_DIR']
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _progress_path(job_id):
+    return os.path.join(_job_dir(), f'{job_id}.progress')
+
+
+def submit_job(kind, params=None, description=None):
+    """Create a ReportJob and queue it on the pool (or run it inline).
+
+    Returns:
+        The ReportJob; with REPORT_JOBS_INLINE it is already finished.
+    """
+    if kind not in JOB_RENDERERS:
+        raise ValueError(f'Unknown report job kind: {kind}')
+    purge_old_jobs()
+    fail_orphaned_jobs()
+
+    owner_pid, owner_boot_id = current_owner()
+    job = ReportJob(id=uuid.uuid4().hex, kind=kind, params=json.dumps(params or {}), description=description,
+                    owner_pid=owner_pid, owner_boot_id=owner_boot_id)
+    db.session.add(job)
+    db.session.commit()
+
+    if current_app.config['REPORT_JOBS_INLINE']:
+        _run_job(job.id)
+        db.session.refresh(job)
+    else:
+        try:
+            future = get_executor().submit(run_job, job.id)
+        except BrokenProcessPool:
+            _discard_executor()
+            future = get_executor().submit(run_job, job.id)
+        future.add_done_callback(partial(_job_finished, current_app._get_current_object(), job.id))
+    return job
+
+
+def _owner_lock_path(pid, boot_id):
+    path = os.path.join(_job_dir(), 'owners')
+    os.makedirs(path, exist_ok=True)
+    return os.path.join(path, f'{pid}-{boot_id}.lock')
+
+
+def current_owner():
+    """(pid, boot_id) of this process, recorded on the jobs it submits.
+
+    The first call takes an exclusive lock on the owner's lock file and keeps
+    it until the process exits, when the OS releases it. The boot id tells a
+    process apart from an earlier one that had the same pid.
+    """
+    global _owner
+    pid = os.getpid()
+    if _owner is None or _owner[0] != pid:  # Also after a fork (gunicorn --preload)
+        boot_id = uuid.uuid4().hex
+        lock_file = open(_owner_lock_path(pid, boot_id), 'w')
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        _owner = (pid, boot_id, lock_file)
+    return _owner[:2]
+
+
+def _owner_alive(pid, boot_id):
+    """Whether the process that submitted a job still holds its owner lock."""
+    if pid is None or boot_id is None:
+        return False  # Submitted before owners were recorded
+    if _owner is not None and _owner[:2] == (pid, boot_id) and pid == os.getpid():
+        return True
+    if fcntl is None:
+        return True
+    path = _owner_lock_path(pid, boot_id)
+    try:
+        lock_file = open(path, 'a')
+    except OSError:
+        return False
+    with lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return True
+    # The owner is gone; its lock file is no longer needed
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    return False
+
+
+def _discard_executor():
+    """Drop a broken pool; the next job starts a new one."""
+    global _executor
+    executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=False)
+
+
+def _job_finished(app, job_id, future):
+    """Done callback of a pooled job. run_job records renderer errors itself,
+    so an exception here means the pool process died (or the job's own
+    bookkeeping failed); the job would otherwise stay running forever."""
+    if future.cancelled() or future.exception() is None:
+        return
+    if isinstance(future.exception(), BrokenProcessPool):
+        _discard_executor()
+    logger.error('Report job %s was lost: %r', job_id, future.exception())
+    with app.app_context():
+        try:
+            _fail_unfinished([job_id], CRASHED_JOB_ERROR)
+        finally:
+            db.session.remove()
+
+
+def run_job(job_id):
+    """Pool entry point: render one job inside the worker's app context."""
+    with _worker_app.app_context():
+        try:
+            _run_job(job_id)
+        finally:
+            db.session.remove()
+
+
+def _run_job(job_id):
+    job = db.session.get(ReportJob, job_id)
+    if job is None or job.status != ReportJob.QUEUED:
+        return
+    job.status = ReportJob.RUNNING
+    job.started_at = datetime.utcnow()
+    db.session.commit()
+
+    output_path = os.path.join(_job_dir(), job_id)
+    progress = _ProgressWriter(_progress_path(job_id))
+    try:
+        download_name, mimetype = JOB_RENDERERS[job.kind](json.loads(job.params), output_path, progress)
+    except Exception as e:
+        logger.exception('Report job %s (%s) failed', job_id, job.kind)
+        db.session.rollback()
+        job = db.session.get(ReportJob, job_id)
+        job.status = ReportJob.FAILED
+        job.error = str(e)
+        if os.path.exists(output_path):
+            os.remove(output_path)
+    else:
+        db.session.rollback()  # End the renderer's read transaction
+        job = db.session.get(ReportJob, job_id)
+        job.status = ReportJob.DONE
+        job.result_path = output_path
+        job.download_name = download_name
+        job.mimetype = mimetype
+    finally:
+        progress.clear()
+    job.finished_at = datetime.utcnow()
+    db.session.commit()
+
+
+class _ProgressWriter:
+    """progress(done, total) callback that records the percentage in a file."""
+
+    def __init__(self, path):
+        self.path = path
+        self.percent = None
+
+    def __call__(self, done, total):
+        percent = min(100, int(done * 100 / total)) if total else 0
+        if percent == self.percent:
+            return
+        self.percent = percent
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'percent': percent, 'done': done, 'total': total}, f)
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def job_progress(job):
+    """Percentage complete of a job (0 while queued, 100 once finished)."""
+    if job.is_finished:
+        return 100
+    if job.status == ReportJob.RUNNING:
+        try:
+            with open(_progress_path(job.id)) as f:
+                return json.load(f)['percent']
+        except (OSError, ValueError, KeyError):
+            pass
+    return 0
+
+
+def job_status(job):
+    """JSON-ready status of a job for polling."""
+    return {
+        'id': job.id,
+        'kind': job.kind,
+        'description': job.description,
+        'status': job.status,
+        'progress': job_progress(job),
+        'error': job.error,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+def purge_old_jobs():
+    """Delete finished jobs, and their files, past the retention period."""
+    cutoff = datetime.utcnow() - timedelta(hours=current_app.config['REPORT_JOB_RETENTION_HOURS'])
+    old_jobs = ReportJob.query.filter(
+        ReportJob.status.in_([ReportJob.DONE, ReportJob.FAILED]),
+        ReportJob.finished_at < cutoff,
+    ).all()
+    for job in old_jobs:
+        if job.result_path and os.path.exists(job.result_path):
+            os.remove(job.result_path)
+        db.session.delete(job)
+    if old_jobs:
+        db.session.commit()
+    return len(old_jobs)
+
+
+def _fail_unfinished(job_ids, error):
+    """Mark the given jobs failed unless they finished meanwhile."""
+    if not job_ids:
+        return 0
+    ReportJob.query.filter(
+        ReportJob.id.in_(job_ids),
+        ReportJob.status.in_([ReportJob.QUEUED, ReportJob.RUNNING]),
+    ).update({'status': ReportJob.FAILED, 'error': error, 'finished_at': datetime.utcnow()},
+             synchronize_session=False)
+    db.session.commit()
+    # Partial files of the jobs failed here (not of any that finished meanwhile)
+    failed = [job_id for (job_id,) in db.session.query(ReportJob.id).filter(
+        ReportJob.id.in_(job_ids), ReportJob.status == ReportJob.FAILED, ReportJob.error == error)]
+    for job_id in failed:
+        for path in (os.path.join(_job_dir(), job_id), _progress_path(job_id)):
+            if os.path.exists(path):
+                os.remove(path)
+    return len(failed)
+
+
+def fail_orphaned_jobs():
+    """Mark queued and running jobs failed whose owning web process is gone.
+    Jobs of a live owner are left alone, however long they have waited."""
+    unfinished = db.session.query(ReportJob.id, ReportJob.owner_pid, ReportJob.owner_boot_id).filter(
+        ReportJob.status.in_([ReportJob.QUEUED, ReportJob.RUNNING])).all()
+    alive = {}
+    orphaned = []
+    for job_id, pid, boot_id in unfinished:
+        if (pid, boot_id) not in alive:
+            alive[(pid, boot_id)] = _owner_alive(pid, boot_id)
+        if not alive[(pid, boot_id)]:
+            orphaned.append(job_id)
+    return _fail_unfinished(orphaned, ORPHANED_JOB_ERROR)
@@ -0,0 +1,131 @@
+"""Per-view loading profiles.
+
+List templates walk relationships row by row (timesheet.employee,
+invoice.project, payment.deductions, ...), which lazy-loads one query per row.
+Each list view declares here which relationships it eager-loads, and how many
+queries a page render is allowed to cost. With QUERY_BUDGETS_ENFORCED set (the
+test suite does), a page that goes over its budget raises instead of quietly
+regressing into N+1 queries.
+"""
+from functools import partial
+
+from flask import request
+from sqlalchemy.orm import configure_mappers, contains_eager, joinedload, selectinload
+
+from models import Timesheet, Invoice, Material, Expense, PayrollPayment, AccountsPayable, PaidAccount, MonthlyExpense
+from profiling import current_profile
+
+# Backref attributes (PayrollPayment.deductions, AccountsPayable.paid_account)
+# only exist once the mappers are configured
+configure_mappers()
+
+
+class QueryBudgetExceeded(Exception):
+    """Raised when a view runs more queries than its loading profile allows."""
+
+
+class LoadingProfile:
+    """Eager-loading options and query budget for one view.
+
+    Args:
+        query_budget: Maximum number of SQL statements one request may run.
+            It must not depend on the number of rows shown.
+        options: Mapping of model class to the loader options applied to
+            queries for that model in this view.
+    """
+
+    def __init__(self, query_budget, options=None):
+        self.query_budget = query_budget
+        self.options = options or {}
+
+    def options_for(self, model):
+        return self.options.get(model, ())
+
+
+# Keyed by view endpoint name. List pages show one keyset page of rows plus
+# whole-table summary queries (see pagination.group_summary)
+LOADING_PROFILES = {
+    # Net profit comes from rollups.project_rollups, no relationships are touched
+    'projects': LoadingProfile(query_budget=8),
+    # The list query already joins employee and project for ordering
+    'timesheets': LoadingProfile(query_budget=4, options={
+        Timesheet: (contains_eager(Timesheet.employee), contains_eager(Timesheet.project)),
+    }),
+    'invoices': LoadingProfile(query_budget=4, options={
+        Invoice: (contains_eager(Invoice.project),),
+    }),
+    # Batch print joins the project for the client filter
+    'print_invoice_batch': LoadingProfile(query_budget=3, options={
+        Invoice: (contains_eager(Invoice.project),),
+    }),
+    'materials': LoadingProfile(query_budget=4, options={
+        Material: (contains_eager(Material.project),),
+    }),
+    'expenses': LoadingProfile(query_budget=4, options={
+        Expense: (joinedload(Expense.project),),
+    }),
+    'payroll_report': LoadingProfile(query_budget=12, options={
+        Timesheet: (joinedload(Timesheet.employee), joinedload(Timesheet.project)),
+        PayrollPayment: (joinedload(PayrollPayment.employee), selectinload(PayrollPayment.deductions)),
+    }),
+    'accounts_payable': LoadingProfile(query_budget=4, options={
+        AccountsPayable: (joinedload(AccountsPayable.project), joinedload(AccountsPayable.paid_account)),
+    }),
+    'paid_accounts': LoadingProfile(query_budget=4, options={
+        PaidAccount: (joinedload(PaidAccount.project), joinedload(PaidAccount.accounts_payable)),
+    }),
+    'monthly_expenses': LoadingProfile(query_budget=5, options={
+        MonthlyExpense: (joinedload(MonthlyExpense.project),),
+    }),
+    # The JSON API selects plain columns, one query per request
+    'api_v1.list_resource': LoadingProfile(query_budget=2),
+    'api_v1.get_resource': LoadingProfile(query_budget=2),
+    # The crew week grid reads plain columns (4 queries); a save adds one
+    # statement per kind of change and the project's rollup refresh
+    'crew_week': LoadingProfile(query_budget=14),
+    # Exports page through their query with yield_per, so only many-to-one
+    # relationships are joined in
+    'export_projects': LoadingProfile(query_budget=8),
+    'export_timesheets': LoadingProfile(query_budget=4, options={
+        Timesheet: (joinedload(Timesheet.employee), joinedload(Timesheet.project)),
+    }),
+    'export_expenses': LoadingProfile(query_budget=4, options={
+        Expense: (joinedload(Expense.project),),
+    }),
+    'export_payroll': LoadingProfile(query_budget=4, options={
+        PayrollPayment: (joinedload(PayrollPayment.employee),),
+    }),
+}
+
+
+def loading_options(model, view=None):
+    """Loader options for `model` in the given view (defaults to the current endpoint)."""
+    profile = LOADING_PROFILES.get(view or request.endpoint)
+    return profile.options_for(model) if profile else ()
+
+
+# --- Query budget enforcement ---
+def init_query_budgets(app):
+    """Enforce LOADING_PROFILES budgets when app.config['QUERY_BUDGETS_ENFORCED']
+    is set. Queries are counted by the request profile from profiling.py,
+    including those a streamed response runs while its body is sent."""
+    app.config.setdefault('QUERY_BUDGETS_ENFORCED', False)
+
+    @app.after_request
+    def _check_query_budget(response):
+        if not app.config['QUERY_BUDGETS_ENFORCED']:
+            return response
+        budget = LOADING_PROFILES.get(request.endpoint)
+        profile = current_profile()
+        if budget and profile:
+            # Streamed exports are only checked once their body has been sent
+            profile.call_on_finish(partial(_check_budget, request.endpoint, budget))
+        return response
+
+
+def _check_budget(endpoint, budget, profile):
+    if profile.query_count > budget.query_budget:
+        raise QueryBudgetExceeded(
+            f'{endpoint} ran {profile.query_count} queries '
+            f'(budget {budget.query_budget})'
+        )
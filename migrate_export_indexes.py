@@ -0,0 +1,25 @@
+"""
+Add the date indexes used by the filtered exports.
+"""
+from app import app, db
+from models import Timesheet, Expense, PayrollPayment
+
+EXPORT_INDEXES = {
+    'idx_timesheet_date': Timesheet,
+    'idx_expense_item_date': Expense,
+    'idx_payroll_payment_date': PayrollPayment,
+}
+
+def migrate_export_indexes():
+    """Create the export date-range indexes on existing databases."""
+    with app.app_context():
+        for name, model in EXPORT_INDEXES.items():
+            index = next(index for index in model.__table__.indexes if index.name == name)
+            try:
+                index.create(db.engine, checkfirst=True)
+                print(f"Index '{name}' is in place.")
+            except Exception as e:
+                print(f"Error creating index '{name}': {e}")
+
+if __name__ == "__main__":
+    migrate_export_indexes()
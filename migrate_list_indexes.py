@@ -0,0 +1,25 @@
+"""
+Add the sort-key indexes used by the paginated list pages.
+"""
+from app import app, db
+from models import Employee, Project, Invoice
+
+LIST_INDEXES = {
+    'idx_employee_name': Employee,
+    'idx_project_start_date': Project,
+    'idx_invoice_date': Invoice,
+}
+
+def migrate_list_indexes():
+    """Create the list page sort indexes on existing databases."""
+    with app.app_context():
+        for name, model in LIST_INDEXES.items():
+            index = next(index for index in model.__table__.indexes if index.name == name)
+            try:
+                index.create(db.engine, checkfirst=True)
+                print(f"Index '{name}' is in place.")
+            except Exception as e:
+                print(f"Error creating index '{name}': {e}")
+
+if __name__ == "__main__":
+    migrate_list_indexes()
@@ -0,0 +1,24 @@
+from app import app, db
+from models import ProjectFinancial
+from rollups import refresh_project_financials
+from sqlalchemy import inspect
+
+def migrate_project_financials():
+    """Create the project_financials summary table and populate it for existing projects."""
+    with app.app_context():
+        inspector = inspect(db.engine)
+        
+        if 'project_financials' not in inspector.get_table_names():
+            # Create just the summary table (and its indexes)
+            ProjectFinancial.__table__.create(db.engine)
+            print("Successfully created the 'project_financials' table.")
+        else:
+            print("The 'project_financials' table already exists.")
+        
+        # Full recomputation, same as `flask rebuild-financials`
+        count = refresh_project_financials()
+        db.session.commit()
+        print(f"Populated financial summaries for {count} projects.")
+
+if __name__ == "__main__":
+    migrate_project_financials()
@@ -0,0 +1,26 @@
+"""
+Add the owner_pid and owner_boot_id columns to the report_job table.
+"""
+from app import app, db
+import sqlalchemy as sa
+
+def migrate_report_job_owner():
+    """Add the columns recording which web process owns a report job."""
+    with app.app_context():
+        inspector = sa.inspect(db.engine)
+        columns = [col['name'] for col in inspector.get_columns('report_job')]
+        
+        try:
+            for column, column_type in (('owner_pid', 'INTEGER'), ('owner_boot_id', 'VARCHAR(32)')):
+                if column not in columns:
+                    db.session.execute(sa.text(f'ALTER TABLE report_job ADD COLUMN {column} {column_type}'))
+                    print(f"Successfully added '{column}' column to the report_job table.")
+                else:
+                    print(f"The '{column}' column already exists in the report_job table.")
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"Error migrating report_job owners: {e}")
+
+if __name__ == "__main__":
+    migrate_report_job_owner()
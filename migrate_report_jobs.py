@@ -0,0 +1,17 @@
+"""
+Create the report_job table used by the background report jobs.
+"""
+from app import app, db
+from models import ReportJob
+
+def migrate_report_jobs():
+    """Create the report_job table (and its index) on existing databases."""
+    with app.app_context():
+        try:
+            ReportJob.__table__.create(db.engine, checkfirst=True)
+            print("Table 'report_job' is in place.")
+        except Exception as e:
+            print(f"Error creating table 'report_job': {e}")
+
+if __name__ == "__main__":
+    migrate_report_jobs()
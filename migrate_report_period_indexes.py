@@ -0,0 +1,23 @@
+"""
+Add the date index used by the financial report's period breakdowns.
+"""
+from app import app, db
+from models import Material
+
+REPORT_PERIOD_INDEXES = {
+    'idx_material_purchase_date': Material,
+}
+
+def migrate_report_period_indexes():
+    """Create the report period indexes on existing databases."""
+    with app.app_context():
+        for name, model in REPORT_PERIOD_INDEXES.items():
+            index = next(index for index in model.__table__.indexes if index.name == name)
+            try:
+                index.create(db.engine, checkfirst=True)
+                print(f"Index '{name}' is in place.")
+            except Exception as e:
+                print(f"Error creating index '{name}': {e}")
+
+if __name__ == "__main__":
+    migrate_report_period_indexes()
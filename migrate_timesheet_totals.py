@@ -0,0 +1,31 @@
+"""
+Add the stored worked_hours and pay_amount columns to the timesheet table and backfill them.
+"""
+from app import app, db
+from rollups import refresh_timesheet_totals
+import sqlalchemy as sa
+
+def migrate_timesheet_totals():
+    """Add the worked_hours and pay_amount columns and compute them for existing timesheets."""
+    with app.app_context():
+        inspector = sa.inspect(db.engine)
+        columns = [col['name'] for col in inspector.get_columns('timesheet')]
+        
+        try:
+            for column in ('worked_hours', 'pay_amount'):
+                if column not in columns:
+                    db.session.execute(sa.text(f'ALTER TABLE timesheet ADD COLUMN {column} FLOAT'))
+                    print(f"Successfully added '{column}' column to the timesheet table.")
+                else:
+                    print(f"The '{column}' column already exists in the timesheet table.")
+            
+            # Same rules as Timesheet.calculated_hours / calculated_amount, in one UPDATE
+            count = refresh_timesheet_totals()
+            db.session.commit()
+            print(f"Backfilled hours and pay for {count} timesheets.")
+        except Exception as e:
+            db.session.rollback()
+            print(f"Error migrating timesheet totals: {e}")
+
+if __name__ == "__main__":
+    migrate_timesheet_totals()
@@ -1,10 +1,17 @@
 from datetime import date, datetime, time, timedelta
 from enum import Enum
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.orm import attributes
 from werkzeug.security import generate_password_hash, check_password_hash
 
+from database import ErpSession
+
 # Initialize SQLAlchemy instance
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': ErpSession})
+
+# Premium added to the hourly rate for Saturday work
+SATURDAY_PREMIUM = 5.0
 
 # --- Enums ---
 class ProjectStatus(Enum):
@@ -80,6 +87,11 @@ class Employee(db.Model):
     
     # Relationships defined in the referring classes
     
+    # Index for the employee list ordering
+    __table_args__ = (
+        db.Index('idx_employee_name', 'name'),
+    )
+    
     def validate_status_change(self, new_status):
         """Validate that an employee status change is allowed."""
         return True, ""
@@ -101,6 +113,11 @@ class Project(db.Model):
     
     # Relationships defined in the referring classes
     
+    # Index for the project list ordering
+    __table_args__ = (
+        db.Index('idx_project_start_date', 'start_date'),
+    )
+    
     def validate_dates(self):
         """Validate that end date is on or after start date if both are provided."""
         if self.start_date and self.end_date:
@@ -224,6 +241,10 @@ class Timesheet(db.Model):
     entry_time = db.Column(db.Time, nullable=False)
     exit_time = db.Column(db.Time, nullable=False)
     lunch_duration_minutes = db.Column(db.Integer, default=0)
+    # Stored copies of calculated_hours and calculated_amount, kept up to date
+    # on write (see the mapper events below) so reports can SUM() them
+    worked_hours = db.Column(db.Float)
+    pay_amount = db.Column(db.Float)
     
     # Define relationships with backrefs for better test compatibility
     employee = db.relationship('Employee', foreign_keys=[employee_id], backref=db.backref('timesheets', cascade='all, delete-orphan'))
@@ -233,6 +254,7 @@ class Timesheet(db.Model):
     __table_args__ = (
         db.Index('idx_timesheet_employee_date', 'employee_id', 'date'),
         db.Index('idx_timesheet_project_date', 'project_id', 'date'),
+        db.Index('idx_timesheet_date', 'date'),
     )
     
     @property
@@ -307,7 +329,7 @@ class Timesheet(db.Model):
         
         # Apply Saturday premium of $5/hour
         if self.date.weekday() == 5:  # 5 is Saturday (0 is Monday, 6 is Sunday)
-            return base_rate + 5.0
+            return base_rate + SATURDAY_PREMIUM
             
         return base_rate
     
@@ -316,6 +338,14 @@ class Timesheet(db.Model):
         """Calculate the total pay amount for this timesheet including any premiums."""
         return self.calculated_hours * self.effective_hourly_rate
     
+    def update_totals(self, pay_rate):
+        """Store worked_hours and pay_amount for the given base pay rate."""
+        if self.lunch_duration_minutes is None:
+            self.lunch_duration_minutes = 0
+        self.worked_hours = self.calculated_hours
+        rate = pay_rate + SATURDAY_PREMIUM if self.date and self.date.weekday() == 5 else pay_rate
+        self.pay_amount = self.worked_hours * rate
+    
     @property
     def employee_name(self):
         """Get the employee name for this timesheet."""
@@ -376,6 +406,50 @@ class Timesheet(db.Model):
     def __repr__(self):
         return f'<Timesheet: {self.date}, {self.employee.name if self.employee else "No Employee"}, {self.project.name if self.project else "No Project"}, Hours: {self.calculated_hours:.2f}>'
 
+# Columns that worked_hours and pay_amount are derived from
+TIMESHEET_TOTALS_INPUTS = ('employee_id', 'date', 'entry_time', 'exit_time', 'lunch_duration_minutes')
+
+
+@event.listens_for(Timesheet, 'before_insert')
+@event.listens_for(Timesheet, 'before_update')
+def _store_timesheet_totals(mapper, connection, target):
+    """Recompute the stored totals when the shift, date or employee changes."""
+    state = db.inspect(target)
+    if target.worked_hours is not None and state.persistent and not any(
+            state.attrs[name].history.has_changes() for name in TIMESHEET_TOTALS_INPUTS):
+        return
+    employee = target.__dict__.get('employee')
+    if employee is not None and employee.id == target.employee_id:
+        pay_rate = employee.pay_rate
+    else:
+        pay_rate = connection.scalar(
+            db.select(Employee.pay_rate).where(Employee.id == target.employee_id)
+        )
+    target.update_totals(pay_rate or 0)
+
+
+@event.listens_for(Employee, 'after_update')
+def _reprice_employee_timesheets(mapper, connection, target):
+    """A pay rate change reprices every stored timesheet amount of the employee."""
+    if not db.inspect(target).attrs.pay_rate.history.has_changes():
+        return
+    table = Timesheet.__table__
+    is_saturday = db.func.strftime('%w', table.c.date) == '6'
+    connection.execute(
+        table.update()
+        .where(table.c.employee_id == target.id)
+        .values(pay_amount=table.c.worked_hours * (target.pay_rate + db.case((is_saturday, SATURDAY_PREMIUM), else_=0.0)))
+    )
+    # Keep timesheets already loaded in the session in line with the table
+    session = db.inspect(target).session
+    if session is not None:
+        for obj in list(session.identity_map.values()):
+            if isinstance(obj, Timesheet) and obj.__dict__.get('employee_id') == target.id \
+                    and obj.__dict__.get('worked_hours') is not None:
+                rate = target.pay_rate + (SATURDAY_PREMIUM if obj.date.weekday() == 5 else 0.0)
+                attributes.set_committed_value(obj, 'pay_amount', obj.worked_hours * rate)
+
+
 class Material(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     project_id = db.Column(db.Integer, db.ForeignKey('project.id', ondelete='CASCADE'), nullable=False)
@@ -392,6 +466,7 @@ class Material(db.Model):
     __table_args__ = (
         db.Index('idx_material_project', 'project_id'),
         db.Index('idx_material_category', 'category'),
+        db.Index('idx_material_purchase_date', 'purchase_date'),
     )
 
     def __repr__(self):
@@ -416,6 +491,7 @@ class Expense(db.Model):
     __table_args__ = (
         db.Index('idx_expense_project', 'project_id'),
         db.Index('idx_expense_status', 'payment_status'),
+        db.Index('idx_expense_item_date', 'date'),
     )
 
     def __repr__(self):
@@ -458,6 +534,7 @@ class PayrollPayment(db.Model):
         db.Index('idx_payroll_emp_date', 'employee_id', 'payment_date'),
         db.Index('idx_payroll_method', 'payment_method'),
         db.Index('idx_payroll_period', 'pay_period_start', 'pay_period_end'),
+        db.Index('idx_payroll_payment_date', 'payment_date'),
     )
     
     @property
@@ -506,6 +583,11 @@ class Invoice(db.Model):
     # Define relationship with backref for better test compatibility
     project = db.relationship('Project', foreign_keys=[project_id], backref='invoices')
     
+    # Index for the invoice list ordering
+    __table_args__ = (
+        db.Index('idx_invoice_date', 'invoice_date'),
+    )
+    
     def validate_dates(self):
         """Validate that due date is on or after invoice date."""
         if self.invoice_date and self.due_date:
@@ -521,6 +603,35 @@ class Invoice(db.Model):
     def __repr__(self):
         return f'<Invoice P:{self.project_id} ${self.amount:.2f}>'
 
+class ProjectFinancial(db.Model):
+    """Materialized per-project financial summary.
+    Kept up to date by the session events in rollups.py whenever timesheets,
+    materials, expenses, invoices or projects change; `flask rebuild-financials`
+    recomputes every row from scratch.
+    """
+    __tablename__ = 'project_financials'
+
+    project_id = db.Column(db.Integer, db.ForeignKey('project.id', ondelete='CASCADE'), primary_key=True)
+    labor_hours = db.Column(db.Float, nullable=False, default=0.0)
+    labor_cost = db.Column(db.Float, nullable=False, default=0.0)
+    material_cost = db.Column(db.Float, nullable=False, default=0.0)
+    expense_cost = db.Column(db.Float, nullable=False, default=0.0)
+    total_cost = db.Column(db.Float, nullable=False, default=0.0)
+    invoiced = db.Column(db.Float, nullable=False, default=0.0)
+    collected = db.Column(db.Float, nullable=False, default=0.0)
+    profit = db.Column(db.Float, nullable=False, default=0.0)  # Contract value minus total cost
+    profit_margin = db.Column(db.Float, nullable=False, default=0.0)
+    net_profit = db.Column(db.Float, nullable=False, default=0.0)  # Collected minus total cost
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('idx_financials_profit_margin', 'profit_margin'),
+        db.Index('idx_financials_net_profit', 'net_profit'),
+    )
+
+    def __repr__(self):
+        return f'<ProjectFinancial P:{self.project_id} Profit: ${self.profit:.2f}, Margin: {self.profit_margin:.1f}%>'
+
 # --- Financial Management Models ---
 class AccountsPayable(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -604,6 +715,47 @@ class MonthlyExpense(db.Model):
     def __repr__(self):
         return f'<MonthlyExpense {self.description}: ${self.amount:.2f} on {self.expense_date}'
 
+# Background report jobs (see jobs.py)
+class ReportJob(db.Model):
+    """A PDF or export rendered in the background job pool.
+
+    The finished file lives in the report job directory under the job id;
+    progress while running is tracked beside it (see jobs.job_progress).
+    """
+    __tablename__ = 'report_job'
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    id = db.Column(db.String(32), primary_key=True)  # uuid4 hex, not guessable
+    kind = db.Column(db.String(50), nullable=False)
+    params = db.Column(db.Text, nullable=False, default='{}')  # JSON
+    description = db.Column(db.String(200))
+    status = db.Column(db.String(20), nullable=False, default=QUEUED)
+    error = db.Column(db.Text)
+    result_path = db.Column(db.String(255))
+    download_name = db.Column(db.String(255))
+    mimetype = db.Column(db.String(100))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    # The web process whose pool runs the job (see jobs.current_owner)
+    owner_pid = db.Column(db.Integer)
+    owner_boot_id = db.Column(db.String(32))
+
+    __table_args__ = (
+        db.Index('idx_report_job_created', 'created_at'),
+    )
+
+    @property
+    def is_finished(self):
+        return self.status in (self.DONE, self.FAILED)
+
+    def __repr__(self):
+        return f'<ReportJob {self.id} {self.kind} {self.status}>'
+
 # Future Enhancement Suggestion tracking
 class EnhancementSuggestion(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -0,0 +1,205 @@
+"""Keyset (seek) pagination for the list pages.
+
+OFFSET pagination makes the database step over every skipped row, so page 500
+costs 500 pages of work. Keyset pagination remembers the sort key of the last
+(or first) row shown and asks for the rows after (or before) it instead, which
+an index on the leading sort column answers directly however deep the page is.
+Every ordering ends with the primary key, so the order is total and no row is
+skipped or shown twice when several rows share a date.
+
+Pages are addressed by opaque cursors, ?after=<cursor> for the next page and
+?before=<cursor> for the previous one.
+
+Configuration (app.config):
+    LIST_PAGE_SIZE: Rows per list page (default 50)
+"""
+import base64
+import json
+from datetime import date, datetime
+
+from flask import abort, current_app, request
+from sqlalchemy import and_, false, or_
+from sqlalchemy.sql import Select, operators
+from sqlalchemy.sql.expression import UnaryExpression
+
+from models import db
+
+
+class InvalidCursor(ValueError):
+    """Raised for a cursor that wasn't produced by this ordering."""
+
+
+class KeysetPage:
+    """One page of rows and the cursors of its neighbours.
+
+    Attributes:
+        items: Rows of the page, in list order
+        next_cursor: Cursor of the following page, or None on the last page
+        prev_cursor: Cursor of the preceding page, or None on the first page
+    """
+
+    def __init__(self, items, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __bool__(self):
+        return bool(self.items)
+
+
+def init_pagination(app):
+    """Set the list page defaults on the Flask app."""
+    app.config.setdefault('LIST_PAGE_SIZE', 50)
+
+
+def sort_keys(order_by):
+    """(column, descending) of each ORDER BY term (a column or column.desc())."""
+    keys = []
+    for term in order_by:
+        descending = isinstance(term, UnaryExpression) and term.modifier is operators.desc_op
+        column = term.element if isinstance(term, UnaryExpression) else term
+        keys.append((column.expression if hasattr(column, 'expression') else column, descending))
+    return keys
+
+
+def _encode(value):
+    return value.isoformat() if isinstance(value, (date, datetime)) else value
+
+
+def _decode(column, value):
+    if value is None:
+        return None
+    python_type = column.type.python_type
+    if python_type in (date, datetime):
+        return python_type.fromisoformat(value)
+    if not isinstance(value, python_type):
+        raise InvalidCursor(f'Bad cursor value for {column.key}')
+    return value
+
+
+def encode_cursor(row, keys):
+    """Cursor pointing at `row` in the ordering given by `keys`."""
+    values = [_encode(getattr(row, column.key)) for column, _ in keys]
+    payload = json.dumps(values, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip('=')
+
+
+def decode_cursor(cursor, keys):
+    """Sort key values stored in a cursor."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        if not isinstance(values, list) or len(values) != len(keys):
+            raise InvalidCursor('Cursor does not match the list ordering')
+        return [_decode(column, value) for (column, _), value in zip(keys, values)]
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor(str(e)) from e
+
+
+def _equal(column, value):
+    return column.is_(None) if value is None else column == value
+
+
+def _beyond(column, value, greater):
+    # SQLite sorts NULL before every other value
+    if greater:
+        return column.isnot(None) if value is None else column > value
+    if value is None:
+        return false()
+    return or_(column < value, column.is_(None)) if column.nullable else column < value
+
+
+def seek_condition(keys, values, forward=True):
+    """WHERE clause selecting the rows after (or, with forward=False, before)
+    the row whose sort key is `values`."""
+    alternatives = []
+    for i, ((column, descending), value) in enumerate(zip(keys, values)):
+        ties = [_equal(tied, tied_value) for (tied, _), tied_value in zip(keys[:i], values[:i])]
+        alternatives.append(and_(*ties, _beyond(column, value, greater=descending != forward)))
+    condition = or_(*alternatives)
+
+    # Repeat the bound on the leading column on its own so SQLite can range
+    # scan its index rather than test every row against the OR
+    column, descending = keys[0]
+    if values[0] is not None:
+        if descending != forward:
+            condition = and_(column >= values[0], condition)
+        elif not column.nullable:
+            condition = and_(column <= values[0], condition)
+    return condition
+
+
+def keyset_paginate(query, order_by, after=None, before=None, per_page=None):
+    """One page of `query` in the order `order_by`.
+
+    Args:
+        query: ORM query, or a Core select whose columns include every sort
+            key (its rows are returned as is)
+        order_by: ORDER BY terms; the last one must be unique (the primary key)
+        after: Cursor of the row the page starts after
+        before: Cursor of the row the page ends before (takes precedence)
+        per_page: Page size (defaults to LIST_PAGE_SIZE)
+    Raises:
+        InvalidCursor: The cursor is malformed
+    """
+    per_page = per_page or current_app.config['LIST_PAGE_SIZE']
+    keys = sort_keys(order_by)
+    forward = not before
+    cursor = before or after
+
+    if cursor:
+        query = query.filter(seek_condition(keys, decode_cursor(cursor, keys), forward))
+    if forward:
+        query = query.order_by(*order_by)
+    else:
+        query = query.order_by(*(column.asc() if descending else column.desc() for column, descending in keys))
+    query = query.limit(per_page + 1)
+    rows = db.session.execute(query).all() if isinstance(query, Select) else query.all()
+
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if not forward:
+        rows.reverse()
+    if not rows:
+        return KeysetPage([])
+
+    has_next = more if forward else True
+    has_prev = bool(cursor) if forward else more
+    return KeysetPage(rows,
+                      next_cursor=encode_cursor(rows[-1], keys) if has_next else None,
+                      prev_cursor=encode_cursor(rows[0], keys) if has_prev else None)
+
+
+def paginate_request(query, *order_by):
+    """keyset_paginate() with the cursors of the current request's
+    ?after= / ?before= arguments; a bad cursor is a 400."""
+    try:
+        return keyset_paginate(query, order_by, after=request.args.get('after'),
+                               before=request.args.get('before'))
+    except InvalidCursor:
+        abort(400, 'Invalid page cursor')
+
+
+def group_summary(key, value, *filters):
+    """(key, row count, sum of value) per distinct key over the whole table.
+
+    List pages use this for their summary cards, since a page of rows no
+    longer holds every row.
+    """
+    query = db.select(key, db.func.count(), db.func.coalesce(db.func.sum(value), 0)).group_by(key)
+    if filters:
+        query = query.where(*filters)
+    return [tuple(row) for row in db.session.execute(query)]
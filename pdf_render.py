@@ -0,0 +1,417 @@
+"""Shared PDF rendering.
+
+Every PDF the app produces (table exports, customer invoices) is an ErpPDF.
+With fpdf 1.7 most of the time spent on a small document is font work, not
+drawing: add_font unpickles the DejaVu metrics on every call, and output()
+re-reads each TTF file and builds a subset of the glyphs the document used.
+ErpPDF does that work once per process instead:
+
+- Font metrics are loaded on the first add_font of a font and reused by
+  every later document.
+- Each Unicode font starts with all printable Latin-1 characters in its
+  subset, so documents normally share the same subset, and the subset fonts
+  are built once and kept in a small LRU cache. Text outside that range
+  still works; it just builds (and caches) a new subset.
+
+StaticLayout goes one step further for fixed page designs such as the
+customer invoice: the boilerplate (company header, boxes, labels, contract
+text, signature blocks) is drawn once and stamped onto each page, and only
+the variable fields are drawn per document.
+
+write_table_report renders the tabular export reports in a single pass over
+their rows (see its docstring).
+"""
+import functools
+import itertools
+import logging
+import os
+import types
+import zlib
+
+import fpdf
+from fpdf import FPDF
+from fpdf.ttfonts import TTFontFile
+
+logger = logging.getLogger('erp.pdf')
+
+FONT_DIR = '/usr/share/fonts/truetype/dejavu'
+
+# Style -> candidate font files, first existing one wins
+DEJAVU_FONTS = {
+    '': ('DejaVuSans.ttf',),
+    'B': ('DejaVuSans-Bold.ttf',),
+    # The oblique face ships in fonts-dejavu-extra, which not every host has
+    'I': ('DejaVuSansMono-Oblique.ttf', 'DejaVuSans-Oblique.ttf', 'DejaVuSans.ttf'),
+}
+
+# Characters every Unicode font subset starts with (printable Latin-1)
+PRELOADED_CODES = tuple(range(32, 127)) + tuple(range(160, 256))
+
+# Font metrics loaded so far: (fontkey, file) -> (fonts entry, font_files entries)
+_loaded_fonts = {}
+
+
+def font_path(style):
+    """Path of the DejaVu font file used for a style ('', 'B' or 'I')."""
+    candidates = DEJAVU_FONTS[style]
+    for filename in candidates:
+        path = os.path.join(FONT_DIR, filename)
+        if os.path.exists(path):
+            return path
+    return os.path.join(FONT_DIR, candidates[0])
+
+
+def _font_key(family, style):
+    """The key fpdf files a font under in FPDF.fonts."""
+    family = family.lower()
+    if family == 'arial':
+        family = 'helvetica'
+    style = style.upper()
+    return family + ('BI' if style == 'IB' else style)
+
+
+@functools.lru_cache(maxsize=16)
+def _build_subset(path, codes):
+    ttf = TTFontFile()
+    stream = ttf.makeSubset(path, list(codes))
+    return stream, ttf.codeToGlyph, ttf.maxUni
+
+
+class _SubsetCachingTTFontFile(TTFontFile):
+    """TTFontFile whose makeSubset reuses subsets already built in this process.
+
+    fpdf's _putfonts only reads codeToGlyph and maxUni back after
+    makeSubset, so this drop-in replacement leaves the output byte for byte
+    unchanged.
+    """
+
+    def makeSubset(self, file, subset):
+        stream, code_to_glyph, max_uni = _build_subset(file, tuple(sorted(set(subset))))
+        self.codeToGlyph = dict(code_to_glyph)
+        self.maxUni = max_uni
+        return stream
+
+
+# fpdf release whose _putfonts was checked to only read codeToGlyph and maxUni
+# back from makeSubset; check it again before upgrading
+PUTFONTS_FPDF_VERSION = '1.7.2'
+
+
+def _with_subset_cache(method):
+    """Copy of an FPDF method that builds font subsets with
+    _SubsetCachingTTFontFile. fpdf looks TTFontFile up in its module
+    globals, so the copy gets globals of its own and FPDF documents other
+    than ErpPDF are left alone.
+
+    With any fpdf release other than PUTFONTS_FPDF_VERSION the method is
+    returned unchanged: subsets are built afresh, but stay correct.
+    """
+    if fpdf.FPDF_VERSION != PUTFONTS_FPDF_VERSION:
+        logger.warning('fpdf %s is not %s; PDF font subsets will not be cached',
+                       fpdf.FPDF_VERSION, PUTFONTS_FPDF_VERSION)
+        return method
+    namespace = dict(method.__globals__, TTFontFile=_SubsetCachingTTFontFile)
+    return types.FunctionType(method.__code__, namespace, method.__name__, method.__defaults__, method.__closure__)
+
+
+class ErpPDF(FPDF):
+    """FPDF document whose fonts are loaded and subset once per process.
+
+    Args:
+        orientation, unit, format: As for FPDF
+        fonts: DejaVu styles to register under the 'DejaVu' family
+            (any of '', 'B', 'I'); None registers none
+    """
+
+    def __init__(self, orientation='P', unit='mm', format='A4', fonts=('', 'B')):
+        super().__init__(orientation=orientation, unit=unit, format=format)
+        for style in fonts or ():
+            self.add_font('DejaVu', style, font_path(style), uni=True)
+
+    def add_font(self, family, style='', fname='', uni=False):
+        fontkey = _font_key(family, style)
+        if fontkey in self.fonts:
+            return
+        cache_key = (fontkey, fname, uni)
+        if cache_key not in _loaded_fonts:
+            super().add_font(family, style, fname, uni)
+            entry = self.fonts[fontkey]
+            if uni:
+                entry['subset'].extend(code for code in PRELOADED_CODES if code not in entry['subset'])
+            files = {key: dict(self.font_files[key]) for key in (fontkey, fname) if key in self.font_files}
+            _loaded_fonts[cache_key] = (dict(entry, subset=list(entry['subset'])), files)
+            return
+
+        entry, files = _loaded_fonts[cache_key]
+        # Metrics ('cw') are shared read-only; the subset grows per document
+        self.fonts[fontkey] = dict(entry, i=len(self.fonts) + 1, subset=list(entry['subset']))
+        for key, info in files.items():
+            self.font_files[key] = dict(info)
+
+    _putfonts = _with_subset_cache(FPDF._putfonts)
+
+
+class StaticLayout:
+    """Page boilerplate drawn once per process and stamped onto documents.
+
+    Args:
+        draw: draw(pdf) draws the static elements on the current page of a
+            scratch document and returns a dict of anchors (positions the
+            variable fields are placed at) for the caller.
+        orientation, unit, format, fonts: Must match the documents the
+            layout is stamped on.
+    """
+
+    def __init__(self, draw, orientation='P', unit='mm', format='A4', fonts=('', 'B')):
+        self.draw = draw
+        self.pdf_args = {'orientation': orientation, 'unit': unit, 'format': format, 'fonts': fonts}
+        self._compiled = None
+
+    def compile(self):
+        """Draw the layout on a scratch page and keep its page content."""
+        if self._compiled is None:
+            scratch = ErpPDF(**self.pdf_args)
+            scratch.add_page()
+            start = len(scratch.pages[scratch.page])
+            anchors = self.draw(scratch)
+            content = scratch.pages[scratch.page][start:]
+            fonts = {key: (font['i'], set(font.get('subset', ()))) for key, font in scratch.fonts.items()}
+            self._compiled = (content, fonts, anchors or {})
+        return self._compiled
+
+    def stamp(self, pdf):
+        """Add the layout to the current page of `pdf`.
+
+        Returns:
+            The anchors returned by draw
+        """
+        content, fonts, anchors = self.compile()
+        for key, (index, codes) in fonts.items():
+            font = pdf.fonts.get(key)
+            if font is None or font['i'] != index:
+                raise ValueError(f'Document fonts do not match the layout (font {key})')
+            if 'subset' in font:
+                font['subset'].extend(codes.difference(font['subset']))
+        # Saving and restoring the graphics state around the stamped content
+        # keeps fpdf's idea of the current font and colors accurate
+        pdf._out('q')
+        pdf.pages[pdf.page] += content
+        pdf._out('Q')
+        return anchors
+
+
+# fpdf release TablePDF._putpages was adapted from; check it again before upgrading
+PUTPAGES_FPDF_VERSION = '1.7.2'
+
+# Rows read ahead to size the columns of a table report
+TABLE_SAMPLE_ROWS = 200
+# Landscape A4 width used for table columns, and the content width cap per column
+TABLE_USABLE_WIDTH = 255
+TABLE_MAX_CONTENT_CHARS = 30
+TABLE_ROW_HEIGHT = 10
+
+
+class TablePDF(ErpPDF):
+    """Landscape document for long tables.
+
+    Once start_table() is called the column header row is drawn at the top of
+    every new page. Each page's content is compressed as soon as the page is
+    finished, so a long report holds compressed pages rather than raw page
+    content. Documents using links, per-page orientation or a page count
+    alias are written by fpdf's own _putpages instead, which needs the pages
+    uncompressed again.
+    """
+
+    def __init__(self):
+        super().__init__(orientation='L', unit='mm', format='A4', fonts=('', 'B', 'I'))
+        self.table_columns = None  # [(header text, width)] while a table is open
+
+    def start_table(self, columns):
+        self.table_columns = columns
+        self.draw_table_header()
+
+    def end_table(self):
+        self.table_columns = None
+
+    def draw_table_header(self):
+        self.set_font('DejaVu', 'B', 8)
+        for text, width in self.table_columns:
+            self.cell(width, TABLE_ROW_HEIGHT, text, 1, 0, 'C')
+        self.ln()
+
+    def header(self):
+        if self.table_columns:
+            self.draw_table_header()
+
+    def footer(self):
+        self.set_y(-12)
+        self.set_font('DejaVu', '', 7)
+        self.cell(0, 6, f'Page {self.page}', 0, 0, 'R')
+
+    def _endpage(self):
+        super()._endpage()
+        if self.compress:
+            self.pages[self.page] = zlib.compress(self.pages[self.page].encode('latin1'))
+
+    def _putpages(self):
+        if fpdf.FPDF_VERSION != PUTPAGES_FPDF_VERSION:
+            raise RuntimeError(f'TablePDF._putpages was written for fpdf {PUTPAGES_FPDF_VERSION}, '
+                               f'not {fpdf.FPDF_VERSION}')
+        if self.page_links or self.orientation_changes or hasattr(self, 'str_alias_nb_pages'):
+            if self.compress:
+                for n in range(1, self.page + 1):
+                    self.pages[n] = zlib.decompress(self.pages[n]).decode('latin1')
+            return super()._putpages()
+        # fpdf 1.7.2's _putpages without the branches above, for pages that
+        # are already compressed
+        w_pt, h_pt = (self.fw_pt, self.fh_pt) if self.def_orientation == 'P' else (self.fh_pt, self.fw_pt)
+        stream_filter = '/Filter /FlateDecode ' if self.compress else ''
+        for n in range(1, self.page + 1):
+            self._newobj()
+            self._out('<</Type /Page')
+            self._out('/Parent 1 0 R')
+            self._out('/Resources 2 0 R')
+            if self.pdf_version > '1.3':
+                self._out('/Group <</Type /Group /S /Transparency /CS /DeviceRGB>>')
+            self._out(f'/Contents {self.n + 1} 0 R>>')
+            self._out('endobj')
+            content = self.pages[n]
+            self.pages[n] = ''  # Release the page once it is in the output buffer
+            self._newobj()
+            self._out(f'<<{stream_filter}/Length {len(content)}>>')
+            self._putstream(content)
+            self._out('endobj')
+        self.offsets[1] = len(self.buffer)
+        self._out('1 0 obj')
+        self._out('<</Type /Pages')
+        self._out('/Kids [' + ''.join(f'{3 + 2 * i} 0 R ' for i in range(self.page)) + ']')
+        self._out(f'/Count {self.page}')
+        self._out(f'/MediaBox [0 0 {w_pt:.2f} {h_pt:.2f}]')
+        self._out('>>')
+        self._out('endobj')
+
+
+def _truncate(text, max_chars):
+    return text[:max_chars - 3] + '...' if len(text) > max_chars else text
+
+
+def _parse_number(text):
+    """Numeric value of a (possibly pre-formatted) cell such as 12, 3.5,
+    1,200.00 or $45.10, or None."""
+    if text.replace('.', '', 1).replace(',', '', 1).replace('$', '', 1).replace('-', '', 1).isdigit() or (
+            text.startswith('$') and len(text) > 1 and text[1:].replace('.', '', 1).replace(',', '', 1).isdigit()):
+        try:
+            return float(text.replace('$', '').replace(',', ''))
+        except ValueError:
+            return None
+    return None
+
+
+def _fixed_column_widths(columns, fixed_widths):
+    """Widths from a name -> width mapping; other columns share what is left."""
+    widths = [fixed_widths.get(key) for key in columns]
+    unassigned = widths.count(None)
+    if unassigned:
+        remaining = TABLE_USABLE_WIDTH - sum(width for width in widths if width is not None)
+        default_width = max(18, remaining / unassigned)
+        widths = [default_width if width is None else width for width in widths]
+    return widths
+
+
+def _sampled_column_widths(columns, sample):
+    """Widths proportional to the header and sampled content lengths (15-45mm)."""
+    lengths = {}
+    for key in columns:
+        lengths[key] = len(str(key))
+        for item in sample:
+            value_length = len(str(item.get(key, '')))
+            if value_length > lengths[key]:
+                lengths[key] = min(value_length, TABLE_MAX_CONTENT_CHARS)
+    total_length = sum(lengths.values())
+    widths = []
+    for key in columns:
+        proportion = lengths[key] / total_length if total_length > 0 else 1 / len(columns)
+        widths.append(min(max(15, proportion * TABLE_USABLE_WIDTH), 45))
+    total_width = sum(widths)
+    if total_width > TABLE_USABLE_WIDTH:
+        widths = [width * TABLE_USABLE_WIDTH / total_width for width in widths]
+    return widths
+
+
+def write_table_report(rows, title, path, fixed_widths=None, sample_size=TABLE_SAMPLE_ROWS):
+    """Write row dicts to a multi-page PDF table with totals for numerical fields.
+
+    `rows` is read once: the first `sample_size` rows size the columns (unless
+    `fixed_widths` maps column names to widths), then every row is drawn as it
+    arrives while the column totals and formats are accumulated, so `rows` can
+    be a generator over a query of any size. Columns come from the first
+    row's keys; the header row repeats on every page.
+    """
+    rows = iter(rows)
+    sample = list(itertools.islice(rows, sample_size))
+
+    pdf = TablePDF()
+    pdf.add_page()
+    pdf.set_font('DejaVu', 'B', 16)
+    pdf.cell(0, 10, f'{title} Report', 0, 1, 'C')
+    pdf.ln(5)
+
+    if sample:
+        columns = list(sample[0].keys())
+        if fixed_widths:
+            widths = _fixed_column_widths(columns, fixed_widths)
+        else:
+            widths = _sampled_column_widths(columns, sample)
+        pdf.start_table([(_truncate(str(key), max(10, int(width / 2))), width)
+                         for key, width in zip(columns, widths)])
+
+        totals = dict.fromkeys(columns, 0)
+        currency_columns, percent_columns = set(), set()
+        cell_max_chars = [max(10, int(width / 1.8)) for width in widths]
+        pdf.set_font('DejaVu', '', 8)
+        for item in itertools.chain(sample, rows):
+            for key, width, max_chars in zip(columns, widths, cell_max_chars):
+                value = item.get(key, '')
+                text = str(value)
+                is_currency, is_percent = '$' in text, '%' in text
+                align = 'R' if is_currency or is_percent or isinstance(value, (int, float)) else 'L'
+                pdf.cell(width, TABLE_ROW_HEIGHT, _truncate(text, max_chars), 1, 0, align)
+
+                if is_currency:
+                    currency_columns.add(key)
+                if is_percent:
+                    percent_columns.add(key)
+                number = _parse_number(text)
+                if number is not None:
+                    totals[key] += number
+            pdf.ln()
+        pdf.end_table()
+
+        # Add a separating line
+        pdf.ln(5)
+        pdf.line(10, pdf.get_y(), 285, pdf.get_y())
+        pdf.ln(2)
+
+        # Totals row
+        pdf.set_font('DejaVu', 'B', 8)
+        pdf.set_fill_color(240, 240, 240)
+        for i, (key, width) in enumerate(zip(columns, widths)):
+            if i == 0 or totals[key] == 0:
+                pdf.cell(width, TABLE_ROW_HEIGHT, 'TOTALS' if i == 0 else '', 1, 0, 'L' if i == 0 else 'C', True)
+                continue
+            if key in currency_columns:
+                total = f'${totals[key]:,.2f}'
+            elif 'hours' in key.lower() or 'hrs' in key.lower():
+                total = f'{totals[key]:.2f}'
+            elif key in percent_columns:
+                total = f'{totals[key]:.2f}%'
+            else:
+                total = f'{totals[key]:,.2f}'
+            pdf.cell(width, TABLE_ROW_HEIGHT, _truncate(total, max(10, int(width / 2))), 1, 0, 'R', True)
+        pdf.ln()
+
+        pdf.ln(5)
+        pdf.set_font('DejaVu', 'I', 8)
+        pdf.cell(0, 10, 'Note: Totals are calculated for numerical fields only.', 0, 1, 'L')
+
+    pdf.output(path)
@@ -0,0 +1,237 @@
+"""Per-request SQL profiling.
+
+Hooks SQLAlchemy's before_cursor_execute/after_cursor_execute on every engine
+and records, for each request, how many statements ran, how long they took in
+total, and which were the slowest. The numbers are returned to the browser as
+a Server-Timing header and appended to a JSONL log, one line per request, so
+the heaviest routes can be found from production traffic.
+
+All gunicorn workers append to the same log file. A RotatingFileHandler is not
+safe there: each worker would roll the file over on its own and keep writing
+to files another worker already renamed. The log is written with a
+WatchedFileHandler instead, which reopens the file once it has been moved, and
+rotation is left to logrotate (see DEPLOYMENT_GUIDE.md). Every line is one
+append, so lines from different workers do not mix.
+
+Streamed responses (the CSV exports) run most of their queries while the body
+is sent, after the headers are gone. Their Server-Timing header only counts the
+queries run before the body, and the profile is finished, budget-checked and
+logged (marked "streamed") when the response is closed.
+
+Configuration (app.config):
+    SQL_PROFILE_HEADERS: Add the Server-Timing header (default True)
+    SQL_PROFILE_LOG: Path of the JSONL log, or None to disable logging
+    SQL_PROFILE_SLOWEST: Number of slowest statements kept per request
+"""
+import gzip
+import heapq
+import json
+import logging
+import os
+from collections import defaultdict
+from datetime import datetime
+from functools import partial
+from logging.handlers import WatchedFileHandler
+from time import perf_counter
+
+from flask import g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Statements longer than this are truncated in the log
+MAX_STATEMENT_LENGTH = 500
+
+profile_logger = logging.getLogger('erp.sql_profile')
+profile_logger.propagate = False
+
+
+class RequestProfile:
+    """SQL statistics collected during one request."""
+
+    def __init__(self, keep_slowest=5):
+        self.started = perf_counter()
+        self.query_count = 0
+        self.db_time = 0.0  # seconds
+        self.keep_slowest = keep_slowest
+        self._slowest = []  # min-heap of (duration, sequence, statement)
+        self.streamed = False
+        self.finished = False
+        self._on_finish = []
+
+    def record(self, statement, duration):
+        self.query_count += 1
+        self.db_time += duration
+        entry = (duration, self.query_count, statement)
+        if len(self._slowest) < self.keep_slowest:
+            heapq.heappush(self._slowest, entry)
+        elif duration > self._slowest[0][0]:
+            heapq.heapreplace(self._slowest, entry)
+
+    @property
+    def slowest(self):
+        """Slowest statements, slowest first, as (duration_seconds, statement)."""
+        return [(duration, statement) for duration, _, statement in sorted(self._slowest, reverse=True)]
+
+    @property
+    def elapsed(self):
+        return perf_counter() - self.started
+
+    def call_on_finish(self, callback):
+        """Call `callback(profile)` once every query of the request is counted
+        (right away if that is already the case)."""
+        if self.finished:
+            callback(self)
+        else:
+            self._on_finish.append(callback)
+
+    def finish(self):
+        """Mark the request done and run the call_on_finish callbacks."""
+        if self.finished:
+            return
+        self.finished = True
+        callbacks, self._on_finish = self._on_finish, []
+        for callback in callbacks:
+            callback(self)
+
+    def server_timing(self):
+        """Server-Timing header value (durations in milliseconds)."""
+        label = 'queries before streaming' if self.streamed else 'queries'
+        return (f'db;desc="{self.query_count} {label}";dur={self.db_time * 1000:.2f}, '
+                f'app;dur={self.elapsed * 1000:.2f}')
+
+    def as_dict(self):
+        return {
+            'query_count': self.query_count,
+            'streamed': self.streamed,
+            'db_ms': round(self.db_time * 1000, 3),
+            'slowest': [
+                {'ms': round(duration * 1000, 3), 'sql': ' '.join(statement.split())[:MAX_STATEMENT_LENGTH]}
+                for duration, statement in self.slowest
+            ],
+        }
+
+
+def current_profile():
+    """The RequestProfile of the current request, or None outside a request."""
+    if has_app_context():
+        return g.get('db_profile')
+    return None
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start_time', []).append(perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start_times = conn.info.get('query_start_time')
+    if not start_times:
+        return
+    duration = perf_counter() - start_times.pop()
+    profile = current_profile()
+    if profile is not None:
+        profile.record(statement, duration)
+
+
+def _get_log_handler(path):
+    """Attach (once) a handler writing raw JSON lines to `path`."""
+    for handler in profile_logger.handlers:
+        if getattr(handler, 'baseFilename', None) == os.path.abspath(path):
+            return handler
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    handler = WatchedFileHandler(path)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    profile_logger.addHandler(handler)
+    profile_logger.setLevel(logging.INFO)
+    return handler
+
+
+def init_profiling(app):
+    """Register the per-request profiling hooks on the Flask app."""
+    app.config.setdefault('SQL_PROFILE_HEADERS', True)
+    app.config.setdefault('SQL_PROFILE_LOG', None)
+    app.config.setdefault('SQL_PROFILE_SLOWEST', 5)
+
+    @app.before_request
+    def _start_profile():
+        g.db_profile = RequestProfile(keep_slowest=app.config['SQL_PROFILE_SLOWEST'])
+
+    @app.after_request
+    def _finish_profile(response):
+        profile = current_profile()
+        if profile is None:
+            return response
+
+        # The body of a streamed response is produced after this hook. Files
+        # (send_file) are passed through as is: they run no queries, and
+        # werkzeug never calls their call_on_close callbacks
+        profile.streamed = response.is_streamed and not response.direct_passthrough
+        if app.config['SQL_PROFILE_HEADERS']:
+            response.headers['Server-Timing'] = profile.server_timing()
+
+        log_path = app.config['SQL_PROFILE_LOG']
+        if log_path:
+            _get_log_handler(log_path)
+            entry = {
+                'ts': datetime.now().isoformat(timespec='seconds'),
+                'pid': os.getpid(),
+                'method': request.method,
+                'path': request.path,
+                'endpoint': request.endpoint,
+                'status': response.status_code,
+            }
+            profile.call_on_finish(partial(_log_profile, entry))
+
+        if profile.streamed:
+            response.call_on_close(profile.finish)
+        else:
+            profile.finish()
+        return response
+
+
+def _log_profile(entry, profile):
+    entry['duration_ms'] = round(profile.elapsed * 1000, 3)
+    entry.update(profile.as_dict())
+    profile_logger.info(json.dumps(entry))
+
+
+def summarize_profile_log(path):
+    """Aggregate a JSONL profile log (and the files logrotate moved it to,
+    `path.1`, `path.2.gz`, ...) by endpoint.
+
+    Returns:
+        List of dicts sorted by total DB time, heaviest endpoint first.
+    """
+    paths = [path] + [f'{path}.{i}{suffix}' for i in range(1, 100) for suffix in ('', '.gz')]
+    totals = defaultdict(lambda: {'requests': 0, 'queries': 0, 'db_ms': 0.0, 'duration_ms': 0.0, 'max_queries': 0})
+    for log_file in paths:
+        if not os.path.exists(log_file):
+            continue
+        opener = gzip.open if log_file.endswith('.gz') else open
+        with opener(log_file, 'rt') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                stats = totals[entry.get('endpoint') or entry.get('path')]
+                stats['requests'] += 1
+                stats['queries'] += entry['query_count']
+                stats['db_ms'] += entry['db_ms']
+                stats['duration_ms'] += entry['duration_ms']
+                stats['max_queries'] = max(stats['max_queries'], entry['query_count'])
+
+    summary = []
+    for endpoint, stats in totals.items():
+        requests = stats['requests']
+        summary.append({
+            'endpoint': endpoint,
+            'requests': requests,
+            'avg_queries': stats['queries'] / requests,
+            'max_queries': stats['max_queries'],
+            'avg_db_ms': stats['db_ms'] / requests,
+            'avg_duration_ms': stats['duration_ms'] / requests,
+            'total_db_ms': stats['db_ms'],
+        })
+    return sorted(summary, key=lambda s: s['total_db_ms'], reverse=True)
@@ -0,0 +1,409 @@
+"""SQL-side cost rollups for projects.
+
+The cost properties on Project (total_labor_cost, total_material_cost, ...)
+walk every lazy-loaded child row in Python, once per project. The helpers in
+this module compute the same figures with one grouped aggregate query per
+collection, for any number of projects at once, so list pages and exports
+don't have to touch timesheets, materials, expenses or invoices row by row.
+
+The same rollups also maintain the materialized project_financials table
+(ProjectFinancial): session events recompute the rows of the projects touched
+by each flush, so the dashboard can sort and sum projects with plain indexed
+queries.
+"""
+from datetime import datetime
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.sql import Select
+
+from models import (db, Employee, Project, Timesheet, Material, Expense, Invoice, PaymentStatus, ProjectFinancial,
+                    SATURDAY_PREMIUM)
+
+
+# --- Timesheet SQL expressions ---
+def timesheet_raw_hours_expr():
+    """SQL expression matching Timesheet.raw_hours (overnight shifts wrap to the next day)."""
+    seconds = (
+        db.cast(db.func.strftime('%s', Timesheet.exit_time), db.Integer)
+        - db.cast(db.func.strftime('%s', Timesheet.entry_time), db.Integer)
+    )
+    seconds = db.case((seconds < 0, seconds + 86400), else_=seconds)
+    return seconds / 3600.0
+
+
+def timesheet_hours_expr():
+    """SQL expression matching Timesheet.calculated_hours.
+    - If lunch duration 1-30 minutes, no deduction
+    - If lunch duration 31-60 minutes, deduct fixed 0.5 hours
+    """
+    lunch = db.func.coalesce(Timesheet.lunch_duration_minutes, 0)
+    lunch_deduction = db.case((lunch.between(31, 60), 0.5), else_=0.0)
+    return timesheet_raw_hours_expr() - lunch_deduction
+
+
+def refresh_timesheet_totals(employee_ids=None):
+    """Recompute the stored worked_hours and pay_amount columns in SQL.
+
+    The ORM keeps them current on every write; this is for backfilling and
+    for rows written with Core inserts, which bypass the mapper events.
+
+    Returns:
+        Number of timesheet rows updated
+    """
+    pay_rate = db.select(Employee.pay_rate).where(Employee.id == Timesheet.employee_id).scalar_subquery()
+    is_saturday = db.func.strftime('%w', Timesheet.date) == '6'
+    stmt = db.update(Timesheet.__table__).values(
+        worked_hours=timesheet_hours_expr(),
+        pay_amount=timesheet_hours_expr() * (pay_rate + db.case((is_saturday, SATURDAY_PREMIUM), else_=0.0)),
+    )
+    if employee_ids is not None:
+        stmt = stmt.where(Timesheet.employee_id.in_(list(employee_ids)))
+    # Straight on the connection: the stored totals don't change project figures
+    return db.session.connection().execute(stmt).rowcount
+
+
+# --- Project rollups ---
+class ProjectRollup:
+    """Aggregated cost and revenue figures for one project.
+
+    Mirrors the financial properties on Project so templates and exports can
+    use either interchangeably.
+    """
+
+    def __init__(self, project_id, contract_value=None):
+        self.project_id = project_id
+        self.contract_value = contract_value
+        self.labor_hours = 0.0
+        self.labor_cost = 0.0   # hours * base pay rate, as Project.total_labor_cost
+        self.labor_pay = 0.0    # hours * effective rate (includes Saturday premium)
+        self.material_cost = 0.0
+        self.other_expenses = 0.0
+        self.invoiced = 0.0
+        self.actual_revenue = 0.0
+
+    @property
+    def total_labor_cost(self):
+        return self.labor_cost
+
+    @property
+    def total_material_cost(self):
+        return self.material_cost
+
+    @property
+    def total_other_expenses(self):
+        return self.other_expenses
+
+    @property
+    def total_cost(self):
+        return self.labor_cost + self.material_cost + self.other_expenses
+
+    @property
+    def profit(self):
+        if self.contract_value:
+            return self.contract_value - self.total_cost
+        return -self.total_cost
+
+    @property
+    def profit_margin(self):
+        if self.contract_value and self.contract_value > 0:
+            return (self.profit / self.contract_value) * 100
+        return 0
+
+    @property
+    def actual_net_profit(self):
+        return self.actual_revenue - self.total_cost
+
+    def __repr__(self):
+        return f'<ProjectRollup P:{self.project_id} cost=${self.total_cost:.2f} revenue=${self.actual_revenue:.2f}>'
+
+
+def _restrict(query, column, project_ids):
+    """Restrict a rollup query to the given project ids, if any."""
+    if project_ids is not None:
+        query = query.filter(column.in_(project_ids))
+    return query
+
+
+def labor_rollup_query(project_ids=None):
+    """Per-project labor hours, base-rate cost and premium-inclusive pay."""
+    query = db.session.query(
+        Timesheet.project_id,
+        db.func.sum(Timesheet.worked_hours),
+        db.func.sum(Timesheet.worked_hours * Employee.pay_rate),
+        db.func.sum(Timesheet.pay_amount),
+    ).join(Employee, Timesheet.employee_id == Employee.id)\
+     .group_by(Timesheet.project_id)
+    return _restrict(query, Timesheet.project_id, project_ids)
+
+
+def material_rollup_query(project_ids=None):
+    """Per-project material cost."""
+    query = db.session.query(Material.project_id, db.func.sum(Material.cost))\
+        .group_by(Material.project_id)
+    return _restrict(query, Material.project_id, project_ids)
+
+
+def expense_rollup_query(project_ids=None):
+    """Per-project other expenses."""
+    query = db.session.query(Expense.project_id, db.func.sum(Expense.amount))\
+        .group_by(Expense.project_id)
+    return _restrict(query, Expense.project_id, project_ids)
+
+
+def invoice_rollup_query(project_ids=None):
+    """Per-project invoiced total and revenue collected from paid invoices."""
+    paid_amount = db.case((Invoice.status == PaymentStatus.PAID, Invoice.amount), else_=0.0)
+    query = db.session.query(
+        Invoice.project_id,
+        db.func.sum(Invoice.amount),
+        db.func.sum(paid_amount),
+    ).group_by(Invoice.project_id)
+    return _restrict(query, Invoice.project_id, project_ids)
+
+
+def project_rollups(project_ids=None):
+    """Compute cost and revenue rollups for many projects at once.
+
+    Issues one grouped query per collection (timesheets, materials, expenses,
+    invoices) plus one for the projects themselves, regardless of how many
+    projects are requested.
+
+    Args:
+        project_ids: Optional iterable of project ids, or a SELECT of project
+            ids, to restrict to. All projects are rolled up when omitted.
+
+    Returns:
+        dict mapping project id to ProjectRollup
+    """
+    if project_ids is not None and not isinstance(project_ids, Select):
+        project_ids = list(project_ids)
+        if not project_ids:
+            return {}
+
+    project_query = db.session.query(Project.id, Project.contract_value)
+    if project_ids is not None:
+        project_query = project_query.filter(Project.id.in_(project_ids))
+    rollups = {pid: ProjectRollup(pid, contract_value) for pid, contract_value in project_query}
+
+    for pid, hours, cost, pay in labor_rollup_query(project_ids):
+        if pid in rollups:
+            rollups[pid].labor_hours = hours or 0.0
+            rollups[pid].labor_cost = cost or 0.0
+            rollups[pid].labor_pay = pay or 0.0
+
+    for pid, cost in material_rollup_query(project_ids):
+        if pid in rollups:
+            rollups[pid].material_cost = cost or 0.0
+
+    for pid, amount in expense_rollup_query(project_ids):
+        if pid in rollups:
+            rollups[pid].other_expenses = amount or 0.0
+
+    for pid, invoiced, collected in invoice_rollup_query(project_ids):
+        if pid in rollups:
+            rollups[pid].invoiced = invoiced or 0.0
+            rollups[pid].actual_revenue = collected or 0.0
+
+    return rollups
+
+
+def project_rollup(project_id):
+    """Rollup for a single project (all zeros if the project has no children)."""
+    return project_rollups([project_id]).get(project_id)
+
+
+# --- Employee rollups ---
+def employee_hours_query(start_date, end_date):
+    """Employees with their hours and pay for timesheets dated start_date..end_date.
+
+    Yields (Employee, hours, pay, premium_pay) rows, one per employee, with
+    zero hours for employees who didn't work in the period: pay is hours times
+    the base rate (as the payroll report shows it), premium_pay includes the
+    Saturday premium. Filter on Employee columns to narrow it down.
+    """
+    return db.session.query(
+        Employee,
+        db.func.coalesce(db.func.sum(Timesheet.worked_hours), 0.0),
+        db.func.coalesce(db.func.sum(Timesheet.worked_hours * Employee.pay_rate), 0.0),
+        db.func.coalesce(db.func.sum(Timesheet.pay_amount), 0.0),
+    ).outerjoin(Timesheet, db.and_(
+        Timesheet.employee_id == Employee.id,
+        Timesheet.date >= start_date,
+        Timesheet.date <= end_date,
+    )).group_by(Employee.id)
+
+
+# --- Materialized project_financials maintenance ---
+# Models whose rows feed into a project's financial summary
+FINANCIAL_SOURCES = (Timesheet, Material, Expense, Invoice)
+
+
+def _financial_row(rollup):
+    """Convert a ProjectRollup into a project_financials row."""
+    return {
+        'project_id': rollup.project_id,
+        'labor_hours': rollup.labor_hours,
+        'labor_cost': rollup.labor_cost,
+        'material_cost': rollup.material_cost,
+        'expense_cost': rollup.other_expenses,
+        'total_cost': rollup.total_cost,
+        'invoiced': rollup.invoiced,
+        'collected': rollup.actual_revenue,
+        'profit': rollup.profit,
+        'profit_margin': rollup.profit_margin,
+        'net_profit': rollup.actual_net_profit,
+        'updated_at': datetime.utcnow(),
+    }
+
+
+def refresh_project_financials(project_ids=None):
+    """Recompute project_financials rows from the live tables.
+
+    Args:
+        project_ids: Projects to refresh. When omitted every row is rebuilt
+            and rows of projects that no longer exist are removed.
+
+    Returns:
+        Number of rows written
+    """
+    table = ProjectFinancial.__table__
+    if project_ids is not None:
+        project_ids = {pid for pid in project_ids if pid is not None}
+        if not project_ids:
+            return 0
+
+    rollups = project_rollups(project_ids)
+
+    # Drop summaries of deleted projects
+    if project_ids is None:
+        db.session.execute(table.delete().where(
+            table.c.project_id.notin_(db.select(Project.id).scalar_subquery())
+        ))
+    else:
+        missing = project_ids - set(rollups)
+        if missing:
+            db.session.execute(table.delete().where(table.c.project_id.in_(missing)))
+
+    if rollups:
+        stmt = sqlite_insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.project_id],
+            set_={c.name: stmt.excluded[c.name] for c in table.columns if c.name != 'project_id'}
+        )
+        db.session.execute(stmt, [_financial_row(r) for r in rollups.values()])
+    return len(rollups)
+
+
+def ensure_project_financials():
+    """Create and fill the project_financials table when the database
+    predates it (same as migrate_project_financials.py).
+
+    Returns:
+        True when the table was created
+    """
+    tables = db.inspect(db.engine).get_table_names()
+    if 'project' not in tables or ProjectFinancial.__tablename__ in tables:
+        return False
+    ProjectFinancial.__table__.create(db.engine, checkfirst=True)
+    try:
+        refresh_project_financials()
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        # Don't leave an empty table behind, or the next start would skip it
+        ProjectFinancial.__table__.drop(db.engine, checkfirst=True)
+        raise
+    return True
+
+
+def init_project_financials(app):
+    """Create project_financials on startup, so the flush hooks and the
+    dashboard work on a database that never ran migrate_project_financials.py."""
+    with app.app_context():
+        try:
+            if ensure_project_financials():
+                app.logger.info('Created and filled the project_financials table.')
+        except OperationalError as e:
+            # Typically an older schema that still needs the other migrate_*.py scripts
+            app.logger.warning('Could not create the project_financials table: %s', e)
+
+
+def _previous_project_id(session, obj):
+    """Project id a persistent source row had before this flush."""
+    history = db.inspect(obj).attrs.project_id.history
+    if history.deleted:
+        return history.deleted[0]
+    if history.added:
+        # The old value was expired before the change; read it back from the table
+        model = type(obj)
+        return session.query(model.project_id).filter(model.id == obj.id).scalar()
+    return None
+
+
+def _before_flush(session, flush_context, instances):
+    """Remember the old project of rows moved to another project; the old
+    value is no longer available once the flush has written the change."""
+    previous = session.info.setdefault('financials_previous_project_ids', set())
+    for obj in session.dirty:
+        if isinstance(obj, FINANCIAL_SOURCES):
+            previous.add(_previous_project_id(session, obj))
+
+
+def _affected_project_ids(session):
+    """Collect the ids of every project whose summary is affected by a flush."""
+    project_ids = session.info.pop('financials_previous_project_ids', set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, FINANCIAL_SOURCES):
+            project_ids.add(obj.project_id)
+        elif isinstance(obj, Project):
+            # New projects need a row, contract value changes move profit
+            project_ids.add(obj.id)
+        elif isinstance(obj, Employee) and obj in session.dirty:
+            # A pay rate change reprices every project the employee worked on
+            if db.inspect(obj).attrs.pay_rate.history.has_changes():
+                project_ids.update(
+                    pid for (pid,) in session.query(Timesheet.project_id)
+                    .filter(Timesheet.employee_id == obj.id).distinct()
+                )
+    project_ids.discard(None)
+    return project_ids
+
+
+def _after_flush(session, flush_context):
+    project_ids = _affected_project_ids(session)
+    if project_ids:
+        refresh_project_financials(project_ids)
+
+
+def _on_bulk_write(orm_execute_state):
+    """Keep summaries correct for query-level UPDATE/DELETE on source tables,
+    which bypass the flush (e.g. delete_timesheet)."""
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+        return None
+    mapper = orm_execute_state.bind_mapper
+    if mapper is None or mapper.class_ not in FINANCIAL_SOURCES:
+        return None
+
+    model = mapper.class_
+    ids_query = db.select(model.project_id).distinct()
+    whereclause = orm_execute_state.statement.whereclause
+    if whereclause is not None:
+        ids_query = ids_query.where(whereclause)
+
+    session = orm_execute_state.session
+    project_ids = set(session.execute(ids_query).scalars())
+    result = orm_execute_state.invoke_statement()
+    if orm_execute_state.is_update:
+        # Pick up rows that were moved onto another project
+        project_ids.update(session.execute(ids_query).scalars())
+    refresh_project_financials(project_ids)
+    return result
+
+
+def register_financials_events(session):
+    """Attach the project_financials maintenance hooks to a session (or scoped session)."""
+    if not event.contains(session, 'after_flush', _after_flush):
+        event.listen(session, 'before_flush', _before_flush)
+        event.listen(session, 'after_flush', _after_flush)
+        event.listen(session, 'do_orm_execute', _on_bulk_write)
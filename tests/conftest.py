@@ -1,22 +1,43 @@
+import atexit
 import os
+import shutil
 import sys
+import tempfile
 import pytest
-from datetime import date, timedelta
+from contextlib import contextmanager
+from datetime import date, time, timedelta
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
 
 # Add the parent directory to sys.path so we can import app modules
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from app import app as flask_app
-from models import db, Employee, Project, Timesheet, Material, Expense, PayrollPayment, Invoice, ProjectStatus, PaymentMethod, PaymentStatus
+# The app creates its engines on import from DATABASE_URL (setting
+# SQLALCHEMY_DATABASE_URI afterwards has no effect), so point it at a scratch
+# file before importing it; the tests must never touch instance/erp.db
+_database_dir = tempfile.mkdtemp(prefix='erp-tests-')
+atexit.register(shutil.rmtree, _database_dir, ignore_errors=True)
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_database_dir, 'erp.db')
+
+from app import app as flask_app, get_week_start_end
+from models import (db, User, Employee, Project, Timesheet, Material, Expense, PayrollPayment, PayrollDeduction, Invoice,
+                    AccountsPayable, PaidAccount, MonthlyExpense, ProjectStatus, PaymentMethod, PaymentStatus,
+                    DeductionType, ExpenseCategory)
 
 @pytest.fixture
-def app():
+def app(tmp_path):
     """Create and configure a Flask app for testing."""
     # Set testing configuration
     flask_app.config.update({
         'TESTING': True,
-        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
-        'WTF_CSRF_ENABLED': False
+        'WTF_CSRF_ENABLED': False,
+        'QUERY_BUDGETS_ENFORCED': True,  # Fail any page that exceeds its loading profile budget
+        'SQL_PROFILE_LOG': None,
+        'REPORT_JOBS_INLINE': True,  # Render background jobs inside the request
+        'REPORT_JOB_DIR': str(tmp_path / 'reports'),
+        'INVOICE_PDF_CACHE_DIR': str(tmp_path / 'invoice_pdfs'),
+        'BACKUP_DIR': str(tmp_path / 'backups'),
+        'DASHBOARD_CACHE_TTL': 0  # Tests rebuild the tables between cases; enabled where tested
     })
 
     # Create the database and tables
@@ -99,3 +120,76 @@ def sample_data(app):
         }
         
         return data
+
+@pytest.fixture
+def login(app):
+    """login(client) creates a user and logs the client in (call it inside an app context)."""
+    def login(client):
+        user = User(username="fixtureuser")
+        user.set_password("testpassword")
+        db.session.add(user)
+        db.session.commit()
+        client.post('/login', data={'username': 'fixtureuser', 'password': 'testpassword'})
+    return login
+
+@pytest.fixture
+def seed_batch(app):
+    """seed_batch(n) adds batch n of related rows (see _seed_batch); call it inside an app context."""
+    return _seed_batch
+
+@pytest.fixture
+def count_queries():
+    """count_queries() is a context manager counting the SQL statements run inside it."""
+    @contextmanager
+    def count_queries():
+        counter = {'count': 0}
+
+        def _count(conn, cursor, statement, parameters, context, executemany):
+            counter['count'] += 1
+
+        event.listen(Engine, 'before_cursor_execute', _count)
+        try:
+            yield counter
+        finally:
+            event.remove(Engine, 'before_cursor_execute', _count)
+    return count_queries
+
+def _seed_batch(batch):
+    """Add one batch of related rows so every list page has more to render."""
+    week_start, _ = get_week_start_end()
+    employee = Employee(name=f"Budget Worker {batch}", employee_id_str=f"BW{batch:03d}", pay_rate=20.0 + batch,
+                        is_active=True)
+    project = Project(name=f"Budget Project {batch}", project_id_str=f"BP{batch:03d}", contract_value=5000.0,
+                      start_date=week_start, status=ProjectStatus.IN_PROGRESS)
+    db.session.add_all([employee, project])
+    db.session.flush()
+    for day in range(3):
+        db.session.add(Timesheet(employee_id=employee.id, project_id=project.id, date=week_start + timedelta(days=day),
+                                 entry_time=time(7, 0), exit_time=time(15, 30), lunch_duration_minutes=45))
+    db.session.add(Material(project_id=project.id, description=f"Paint {batch}", cost=100.0,
+                            purchase_date=week_start))
+    db.session.add(Expense(project_id=project.id, description=f"Fuel {batch}", amount=40.0, date=week_start,
+                           payment_method=PaymentMethod.CASH, payment_status=PaymentStatus.PAID))
+    db.session.add(Invoice(project_id=project.id, invoice_number=f"BUD-{batch}", invoice_date=week_start,
+                           amount=2000.0, status=PaymentStatus.PENDING))
+    payable = AccountsPayable(vendor=f"Vendor {batch}", description="Drywall order", amount=300.0,
+                              issue_date=week_start, due_date=week_start + timedelta(days=30),
+                              category=ExpenseCategory.MATERIALS, project_id=project.id)
+    db.session.add(payable)
+    db.session.flush()
+    db.session.add(PaidAccount(vendor=f"Vendor {batch}", amount=300.0, payment_date=week_start,
+                               payment_method=PaymentMethod.CASH, category=ExpenseCategory.MATERIALS,
+                               project_id=project.id, accounts_payable_id=payable.id))
+    db.session.add(MonthlyExpense(description=f"Rent {batch}", amount=900.0, expense_date=week_start,
+                                  category=ExpenseCategory.RENT, payment_method=PaymentMethod.CHECK,
+                                  project_id=project.id))
+    payment = PayrollPayment(employee_id=employee.id, pay_period_start=week_start,
+                             pay_period_end=week_start + timedelta(days=6), gross_amount=500.0, amount=450.0,
+                             payment_date=week_start + timedelta(days=6),
+                             payment_method=PaymentMethod.CASH if batch % 2 else PaymentMethod.CHECK,
+                             check_number=None if batch % 2 else f"{1000 + batch}")
+    db.session.add(payment)
+    db.session.flush()
+    db.session.add(PayrollDeduction(payroll_payment_id=payment.id, description="Advance", amount=50.0,
+                                    deduction_type=DeductionType.ADVANCE))
+    db.session.commit()
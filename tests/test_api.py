@@ -0,0 +1,72 @@
+from models import db, Employee, Invoice
+
+
+def test_api_requires_login(client):
+    response = client.get('/api/v1/employees')
+    assert response.status_code == 401
+    assert response.get_json() == {'error': 'Authentication required'}
+
+
+def test_list_pages_with_cursors_and_fields(app, client, login, seed_batch, count_queries):
+    with app.app_context():
+        login(client)
+        for batch in range(5):
+            seed_batch(batch)
+
+        seen = []
+        url = '/api/v1/invoices?limit=2&fields=invoice_number,amount,status'
+        with count_queries() as counter:
+            body = client.get(url).get_json()
+        assert counter['count'] == 2  # The snapshot's BEGIN and one SELECT of plain columns
+        while True:
+            assert all(set(row) == {'invoice_number', 'amount', 'status'} for row in body['data'])
+            seen += [row['invoice_number'] for row in body['data']]
+            if not body['next_cursor']:
+                break
+            body = client.get(f"{url}&after={body['next_cursor']}").get_json()
+        expected = [invoice.invoice_number
+                    for invoice in Invoice.query.order_by(Invoice.invoice_date.desc(), Invoice.id.desc())]
+        assert seen == expected
+        assert body['data'][0]['status'] == 'Pending'
+
+        previous = client.get(f"{url}&before={body['prev_cursor']}").get_json()
+        assert [row['invoice_number'] for row in previous['data']] == expected[-3:-1]
+
+
+def test_filters_and_errors(app, client, login, seed_batch):
+    with app.app_context():
+        login(client)
+        seed_batch(0)
+        seed_batch(1)
+        employee = Employee.query.filter_by(name='Budget Worker 1').first()
+
+        rows = client.get(f'/api/v1/timesheets?employee_id={employee.id}').get_json()['data']
+        assert len(rows) == 3 and {row['employee_id'] for row in rows} == {employee.id}
+        day = rows[0]['date']
+        rows = client.get(f'/api/v1/timesheets?start_date={day}&end_date={day}').get_json()['data']
+        assert {row['date'] for row in rows} == {day}
+        assert len(client.get('/api/v1/payroll_payments?payment_method=cash').get_json()['data']) == 1
+
+        item = client.get(f'/api/v1/employees/{employee.id}?fields=name,pay_rate').get_json()
+        assert item == {'data': {'name': 'Budget Worker 1', 'pay_rate': 21.0}}
+
+        assert client.get('/api/v1/employees/999999').status_code == 404
+        assert client.get('/api/v1/widgets').status_code == 404
+        assert client.get('/api/v1/employees?fields=salary').get_json() == {'error': 'Unknown field(s): salary'}
+        assert client.get('/api/v1/invoices?status=LOST').status_code == 400
+        assert client.get('/api/v1/invoices?after=not-a-cursor').status_code == 400
+
+
+def test_etag_revalidation(app, client, login, seed_batch):
+    with app.app_context():
+        login(client)
+        seed_batch(0)
+        response = client.get('/api/v1/projects')
+        etag = response.headers['ETag']
+        assert client.get('/api/v1/projects', headers={'If-None-Match': etag}).status_code == 304
+
+        db.session.add(Invoice(project_id=response.get_json()['data'][0]['id'], invoice_number='API-1',
+                               invoice_date=Invoice.query.first().invoice_date, amount=10.0))
+        db.session.commit()
+        assert client.get('/api/v1/projects', headers={'If-None-Match': etag}).status_code == 304
+        assert client.get('/api/v1/invoices', headers={'If-None-Match': etag}).status_code == 200
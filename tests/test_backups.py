@@ -0,0 +1,156 @@
+import gzip
+import io
+import os
+import sqlite3
+from datetime import datetime, timedelta
+import pytest
+from backups import (online_backup, gunzip_to, check_backup, run_scheduled_backup, rebuild_backup_point,
+                     backup_points, BackupError)
+from models import db, ReportJob, Employee
+
+
+def _downloaded_backup(response, tmp_path):
+    assert response.status_code == 200
+    assert response.mimetype == 'application/gzip'
+    path = tmp_path / 'downloaded.db'
+    path.write_bytes(gzip.decompress(response.data))
+    return path
+
+
+def test_backup_download(app, client, tmp_path, login):
+    """The backup is a compressed SQLite copy, taken in memory without touching the disk."""
+    with app.app_context():
+        login(client)
+        response = client.get('/backup_database')
+        path = _downloaded_backup(response, tmp_path)
+        assert os.listdir(app.config['BACKUP_DIR']) == []
+        response.close()
+
+        conn = sqlite3.connect(path)
+        try:
+            assert conn.execute("SELECT value FROM backup_metadata WHERE key = 'backup_version'").fetchone() == ('3.0',)
+            assert conn.execute("SELECT count(*) FROM user WHERE username = 'fixtureuser'").fetchone() == (1,)
+            assert conn.execute('PRAGMA journal_mode').fetchone() == ('delete',)
+        finally:
+            conn.close()
+        assert check_backup(path) == []
+
+
+def test_large_backup_download_spills_to_disk(app, client, tmp_path, login):
+    app.config['BACKUP_IN_MEMORY_MAX_MB'] = 0
+    try:
+        with app.app_context():
+            login(client)
+            response = client.get('/backup_database')
+            path = _downloaded_backup(response, tmp_path)
+            assert len(os.listdir(app.config['BACKUP_DIR'])) == 1
+            response.close()
+            assert check_backup(path) == []
+            assert os.listdir(app.config['BACKUP_DIR']) == []
+    finally:
+        app.config['BACKUP_IN_MEMORY_MAX_MB'] = 64
+
+
+def test_backup_verified_in_background(app, client, tmp_path, login):
+    with app.app_context():
+        login(client)
+        response = client.get('/backup_database?verify=1')
+        _downloaded_backup(response, tmp_path)
+
+        job = ReportJob.query.filter_by(kind='backup_verify').order_by(ReportJob.created_at.desc()).first()
+        assert job.status == ReportJob.DONE
+        assert os.listdir(app.config['BACKUP_DIR']) == []
+
+
+def test_online_backup_steps(app, tmp_path):
+    """The copy is taken a few pages at a time."""
+    app.config['BACKUP_PAGES_PER_STEP'] = 2
+    calls = []
+    with app.app_context():
+        online_backup(str(tmp_path / 'copy.db'), progress=lambda done, total: calls.append((done, total)))
+    assert len(calls) > 1
+    assert calls[-1][0] == calls[-1][1]
+
+
+def test_check_backup_reports_foreign_files(tmp_path):
+    path = tmp_path / 'other.db'
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE employee (id INTEGER)')
+    conn.close()
+    compressed = io.BytesIO(gzip.compress(path.read_bytes()))
+    gunzip_to(compressed, tmp_path / 'restored.db')
+    assert check_backup(tmp_path / 'restored.db') == [
+        "Missing 'project' table", "Missing 'timesheet' table", "Missing 'invoice' table"]
+
+
+def _employee_count(path, name):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute('SELECT count(*) FROM employee WHERE name = ?', (name,)).fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_incremental_backup_points(app, tmp_path):
+    """Later points store only changed pages, and every point can be rebuilt."""
+    with app.app_context():
+        base = run_scheduled_backup()
+        assert base['kind'] == 'full' and base['base_id'] == base['id']
+        assert base['changed_pages'] == base['page_count']
+
+        employee = Employee(name='Backup Point Worker', employee_id_str='BPW001', pay_rate=20.0, is_active=True)
+        db.session.add(employee)
+        db.session.commit()
+        try:
+            point = run_scheduled_backup()
+        finally:
+            db.session.delete(employee)
+            db.session.commit()
+
+        assert point['kind'] == 'incremental' and point['base_id'] == base['id']
+        assert 0 < point['changed_pages'] < point['page_count']
+        assert point['size'] < base['size']
+
+        rebuilt = tmp_path / 'rebuilt.db'
+        rebuild_backup_point(point['id'], str(rebuilt))
+        assert _employee_count(rebuilt, 'Backup Point Worker') == 1
+        rebuild_backup_point(base['id'], str(rebuilt))
+        assert _employee_count(rebuilt, 'Backup Point Worker') == 0
+        assert check_backup(rebuilt) == []
+
+        with pytest.raises(BackupError):
+            rebuild_backup_point(point['id'] + 100, str(rebuilt))
+
+
+def test_new_chain_when_base_is_old(app):
+    with app.app_context():
+        base = run_scheduled_backup(now=datetime.now() - timedelta(days=8))
+        assert run_scheduled_backup()['kind'] == 'full'
+        assert base['kind'] == 'full'
+
+
+def test_backup_retention(app):
+    app.config['BACKUP_KEEP_CHAINS'] = 2
+    with app.app_context():
+        first = run_scheduled_backup(full=True)
+        run_scheduled_backup()
+        run_scheduled_backup(full=True)
+        latest = run_scheduled_backup(full=True)
+
+        points = backup_points()
+        assert [point['base_id'] for point in points] == [latest['id'], latest['id'] - 1]
+        stored = os.listdir(os.path.join(app.config['BACKUP_DIR'], 'points'))
+        assert not any(name.startswith(first['stem']) for name in stored)
+        assert len(stored) == 4  # Pages and manifest of the two kept points
+
+
+def test_backups_page(app, client, login):
+    with app.app_context():
+        login(client)
+        run_scheduled_backup()
+        response = client.get('/backups')
+        assert response.status_code == 200
+        assert b'Restore' in response.data
+
+        response = client.post('/backups/run', follow_redirects=True)
+        assert b'incremental' in response.data
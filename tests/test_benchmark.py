@@ -0,0 +1,53 @@
+import pytest
+from benchmark import generate_dataset, run_benchmarks, compare_results, benchmark_routes
+from models import db, Employee, Project, Timesheet, Invoice, PayrollPayment, ProjectFinancial
+
+
+def test_generate_dataset_sizes(app):
+    """The generator inserts the requested number of rows and builds the summaries."""
+    with app.app_context():
+        before = {model: model.query.count() for model in (Employee, Project, Timesheet, Invoice, PayrollPayment)}
+        inserted = generate_dataset({'employees': 4, 'projects': 6, 'timesheets': 120, 'invoices': 15,
+                                     'payroll_weeks': 2}, seed=7)
+        assert inserted['timesheet'] == 120
+        assert Employee.query.count() - before[Employee] == 4
+        assert Project.query.count() - before[Project] == 6
+        assert Timesheet.query.count() - before[Timesheet] == 120
+        assert Invoice.query.count() - before[Invoice] == 15
+        assert PayrollPayment.query.count() - before[PayrollPayment] == 8
+        assert ProjectFinancial.query.join(Project).filter(Project.project_id_str.like('BENCH-P%')).count() == 6
+        # Every timesheet points at a generated employee and project
+        assert Timesheet.query.filter(Timesheet.employee_id.notin_(db.session.query(Employee.id))).count() == 0
+
+
+def test_run_benchmarks_records_timings(app):
+    """Timed routes report status, timings and query counts."""
+    with app.app_context():
+        generate_dataset({'employees': 3, 'projects': 4, 'timesheets': 50, 'invoices': 5, 'payroll_weeks': 1})
+        # The CSV export is streamed; its queries run while the body is sent
+        routes = [('projects', '/projects'), ('timesheets', '/timesheets'),
+                  ('export_timesheets_csv', '/export/timesheets/csv')]
+        results = run_benchmarks(app, routes, repeat=2, warmup=0)
+
+        for name, _ in routes:
+            assert results[name]['status'] == 200
+            assert results[name]['runs'] == 2
+            assert results[name]['min_ms'] <= results[name]['median_ms'] <= results[name]['max_ms']
+            assert results[name]['queries'] > 0
+
+
+def test_compare_results_flags_regressions():
+    previous = {'results': {'index': {'median_ms': 100.0}, 'projects': {'median_ms': 50.0}}}
+    current = {'results': {'index': {'median_ms': 105.0}, 'projects': {'median_ms': 80.0},
+                           'timesheets': {'median_ms': 10.0}}}
+    rows, regressions = compare_results(previous, current, threshold=0.10)
+    assert [row[0] for row in rows] == ['index', 'projects']
+    assert [row[0] for row in regressions] == ['projects']
+    assert regressions[0][3] == pytest.approx(0.6)
+
+
+def test_benchmark_routes_cover_exports():
+    urls = dict(benchmark_routes())
+    assert urls['payroll_report'] == '/payroll/report'
+    assert urls['export_timesheets_csv'] == '/export/timesheets/csv'
+    assert len(benchmark_routes(include_exports=False)) == 5
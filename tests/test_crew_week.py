@@ -0,0 +1,124 @@
+from datetime import time, timedelta
+import pytest
+from models import db, Employee, Project, ProjectFinancial, Timesheet
+from app import get_week_start_end
+from crew_week import CrewWeek, cell_name
+
+
+def _grid(week):
+    """The form a browser would post for the grid as drawn."""
+    form = {}
+    for employee in week.employees:
+        for day in week.days:
+            for field, value in zip(('entry', 'exit', 'lunch'), week.values(employee.id, day)):
+                form[cell_name(employee.id, day, field)] = value
+            form[cell_name(employee.id, day, 'shown')] = week.shown(employee.id, day)
+    return form
+
+
+def test_save_inserts_updates_and_removes_in_one_batch(app, seed_batch, count_queries):
+    with app.app_context():
+        seed_batch(0)
+        seed_batch(1)
+        project = Project.query.filter_by(project_id_str='BP000').one()
+        worker, helper = (Employee.query.filter_by(employee_id_str=key).one() for key in ('BW000', 'BW001'))
+        week_start, _ = get_week_start_end()
+        week = CrewWeek(project, week_start)
+        first, second, third = week.days[:3]
+        assert week.values(worker.id, first) == ('07:00', '15:30', '45')
+
+        form = _grid(week)
+        form[cell_name(worker.id, second, 'exit')] = '17:30'
+        for field in ('entry', 'exit', 'lunch'):
+            form[cell_name(worker.id, third, field)] = ''
+        form.update({cell_name(helper.id, first, 'entry'): '08:00', cell_name(helper.id, first, 'exit'): '12:00'})
+        with count_queries() as counter:
+            errors, counts = week.save(form)
+        assert errors == {}
+        assert counts == {'added': 1, 'updated': 1, 'removed': 1}
+        # Insert, update and delete are one statement each; the rest is the rollup refresh
+        assert counter['count'] < 10
+
+        entries = {(timesheet.employee_id, timesheet.date): timesheet
+                   for timesheet in Timesheet.query.filter_by(project_id=project.id)}
+        assert set(entries) == {(worker.id, first), (worker.id, second), (helper.id, first)}
+        assert entries[(worker.id, second)].exit_time == time(17, 30)
+        assert entries[(helper.id, first)].pay_amount == pytest.approx(4 * (21 + 5 * (first.weekday() == 5)))
+        for timesheet in entries.values():
+            assert timesheet.worked_hours == pytest.approx(timesheet.calculated_hours)
+        # Base-rate cost, without the Saturday premium
+        labor = sum(timesheet.worked_hours * timesheet.employee.pay_rate for timesheet in entries.values())
+        assert db.session.get(ProjectFinancial, project.id).labor_cost == pytest.approx(labor)
+
+
+def test_unchanged_grid_writes_nothing(app, seed_batch, count_queries):
+    with app.app_context():
+        seed_batch(0)
+        week = CrewWeek(Project.query.filter_by(project_id_str='BP000').one(), get_week_start_end()[0])
+        with count_queries() as counter:
+            assert week.save(_grid(week)) == ({}, {'added': 0, 'updated': 0, 'removed': 0})
+        assert counter['count'] == 0
+
+
+def test_stale_grid_only_touches_rows_it_showed(app, seed_batch):
+    with app.app_context():
+        seed_batch(0)
+        project = Project.query.filter_by(project_id_str='BP000').one()
+        worker = Employee.query.filter_by(employee_id_str='BW000').one()
+        week_start, _ = get_week_start_end()
+        form = _grid(CrewWeek(project, week_start))
+        first, second, fourth = (week_start + timedelta(days=offset) for offset in (0, 1, 3))
+
+        # Someone else saves meanwhile: a new entry on a blank cell and a changed one
+        db.session.add(Timesheet(employee_id=worker.id, project_id=project.id, date=fourth,
+                                 entry_time=time(9), exit_time=time(13)))
+        Timesheet.query.filter_by(employee_id=worker.id, date=first).one().exit_time = time(16)
+        db.session.commit()
+
+        # The blank cell stays blank, the edited cells are both stale
+        form[cell_name(worker.id, first, 'exit')] = '17:00'
+        for field in ('entry', 'exit', 'lunch'):
+            form[cell_name(worker.id, second, field)] = ''
+        week = CrewWeek(project, week_start)
+        errors, counts = week.save(form)
+        assert errors == {(worker.id, first): 'Someone else saved 07:00-16:00, 45 min lunch here after the week '
+                                              'was loaded.'}
+        assert counts == {'added': 0, 'updated': 0, 'removed': 0}
+        assert Timesheet.query.filter_by(employee_id=worker.id).count() == 4
+
+        # Saving the redrawn grid again overwrites the reported cell only
+        form[cell_name(worker.id, first, 'shown')] = week.shown_input(worker.id, first, form)
+        errors, counts = CrewWeek(project, week_start).save(form)
+        assert (errors, counts) == ({}, {'added': 0, 'updated': 1, 'removed': 1})
+        assert Timesheet.query.filter_by(employee_id=worker.id, date=first).one().exit_time == time(17)
+        assert Timesheet.query.filter_by(employee_id=worker.id, date=fourth).count() == 1
+
+
+def test_one_bad_cell_saves_nothing(app, client, login, seed_batch):
+    with app.app_context():
+        login(client)
+        seed_batch(0)
+        project = Project.query.filter_by(project_id_str='BP000').one()
+        worker = Employee.query.filter_by(employee_id_str='BW000').one()
+        week_start, _ = get_week_start_end()
+        week = CrewWeek(project, week_start)
+        form = _grid(week)
+        form[cell_name(worker.id, week.days[0], 'exit')] = '16:00'
+        form[cell_name(worker.id, week.days[4], 'entry')] = '08:00'  # No exit time
+        form.update(project_id=project.id, week=week_start.isoformat())
+
+        response = client.post('/timesheets/week', data=form)
+        assert response.status_code == 200
+        assert b'Nothing was saved: 1 invalid entry.' in response.data
+        assert b'Exit time is missing.' in response.data
+        assert b'value="16:00"' in response.data  # The posted values are kept
+        assert Timesheet.query.filter_by(employee_id=worker.id, exit_time=time(16)).count() == 0
+
+        form[cell_name(worker.id, week.days[4], 'exit')] = '12:00'
+        response = client.post('/timesheets/week', data=form, follow_redirects=True)
+        assert b'Week saved: 1 added, 1 updated, 0 removed.' in response.data
+        assert Timesheet.query.filter_by(employee_id=worker.id).count() == 4
+
+        previous = (week_start - timedelta(days=7)).isoformat()
+        response = client.get(f'/timesheets/week?project_id={project.id}&week={previous}')
+        assert response.status_code == 200 and b'value="07:00"' not in response.data
@@ -0,0 +1,85 @@
+import pytest
+from dashboard import invalidate_dashboard
+from models import db, Expense, Invoice, Material, Project, ProjectFinancial
+
+
+@pytest.fixture(autouse=True)
+def _dashboard_cache(app):
+    app.config['DASHBOARD_CACHE_TTL'] = 60
+    invalidate_dashboard()
+    yield
+    invalidate_dashboard()
+
+
+def _dashboard(client, count_queries):
+    with count_queries() as counter:
+        response = client.get('/')
+    assert response.status_code == 200
+    return response.get_data(as_text=True), counter['count']
+
+
+def test_repeat_dashboard_loads_run_no_queries(app, client, login, seed_batch, count_queries):
+    with app.app_context():
+        login(client)
+        seed_batch(0)
+        first, queries = _dashboard(client, count_queries)
+        assert queries > 0
+        second, queries = _dashboard(client, count_queries)
+        assert queries == 0
+        # Same figures (the first page also carries the login flash message)
+        assert second[second.index('<!-- Recent Expenses'):] == first[first.index('<!-- Recent Expenses'):]
+        assert 'Fuel 0' in second
+
+
+def test_commit_invalidates_dashboard(app, client, login, seed_batch, count_queries):
+    with app.app_context():
+        login(client)
+        seed_batch(0)
+        _dashboard(client, count_queries)
+
+        expense = Expense.query.filter_by(description='Fuel 0').first()
+        expense.description = 'Diesel 0'
+        db.session.commit()
+        page, queries = _dashboard(client, count_queries)
+        assert queries > 0
+        assert 'Diesel 0' in page
+
+
+def test_bulk_delete_invalidates_dashboard(app, client, login, seed_batch, count_queries):
+    with app.app_context():
+        login(client)
+        seed_batch(0)
+        _dashboard(client, count_queries)
+
+        Invoice.query.filter_by(invoice_number='BUD-0').delete()
+        db.session.commit()
+        assert _dashboard(client, count_queries)[1] > 0
+
+
+def test_rolled_back_changes_keep_cache(app, client, login, seed_batch, count_queries):
+    with app.app_context():
+        login(client)
+        seed_batch(0)
+        _dashboard(client, count_queries)
+
+        Expense.query.filter_by(description='Fuel 0').first().amount = 1.0
+        db.session.flush()
+        db.session.rollback()
+        db.session.commit()
+        assert _dashboard(client, count_queries)[1] == 0
+
+
+def test_material_and_summary_upsert_invalidate_dashboard(app, client, login, seed_batch, count_queries):
+    """A new material only changes the dashboard through the project_financials
+    upsert, a Core INSERT ... ON CONFLICT on the table."""
+    with app.app_context():
+        login(client)
+        seed_batch(0)
+        _dashboard(client, count_queries)
+        project = Project.query.filter_by(project_id_str='BP000').one()
+        net_profit = db.session.get(ProjectFinancial, project.id).net_profit
+
+        db.session.add(Material(project_id=project.id, description='Lumber', cost=500.0))
+        db.session.commit()
+        assert _dashboard(client, count_queries)[1] > 0
+        assert db.session.get(ProjectFinancial, project.id).net_profit == pytest.approx(net_profit - 500)
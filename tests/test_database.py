@@ -0,0 +1,78 @@
+import pytest
+from flask import Flask
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+from database import READ_ONLY_BIND, init_database, dispose_engines, read_only_session, _read_only_url
+from models import db, Employee
+
+
+@pytest.fixture
+def file_app(tmp_path):
+    """A separate app set up by init_database() on its own database file."""
+    app = Flask(__name__)
+    app.config.update(SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'erp.db'}",
+                      SQLALCHEMY_TRACK_MODIFICATIONS=False)
+    init_database(app, db)
+    with app.app_context():
+        db.create_all()
+    yield app
+    with app.app_context():
+        db.session.remove()
+        dispose_engines(db)
+
+
+def test_connection_pragmas(file_app):
+    with file_app.app_context():
+        assert db.session.execute(db.text('PRAGMA journal_mode')).scalar() == 'wal'
+        assert db.session.execute(db.text('PRAGMA synchronous')).scalar() == 1  # NORMAL
+        assert db.session.execute(db.text('PRAGMA busy_timeout')).scalar() == file_app.config['SQLITE_BUSY_TIMEOUT_MS']
+
+
+def test_read_only_url():
+    assert str(_read_only_url('sqlite:////srv/erp.db')) == 'sqlite:///file:/srv/erp.db?mode=ro&uri=true'
+    assert _read_only_url('sqlite://') is None
+    assert _read_only_url('postgresql://localhost/erp') is None
+
+
+def test_reads_use_one_snapshot(file_app):
+    """Rows committed meanwhile stay invisible until the read-only block ends."""
+    with file_app.app_context():
+        read_engine = db.engines[READ_ONLY_BIND]
+        with read_only_session() as session:
+            assert session.get_bind(clause=db.select(Employee)) is read_engine
+            count = Employee.query.count()
+
+            with db.engine.begin() as connection:
+                connection.execute(Employee.__table__.insert().values(
+                    name='Snapshot Worker', employee_id_str='SNAP001', pay_rate=20.0, is_active=True))
+            assert Employee.query.count() == count
+
+        assert Employee.query.count() == count + 1
+        assert db.session.get_bind(clause=db.select(Employee)) is db.engine
+
+
+def test_read_only_engine_rejects_writes(file_app):
+    with file_app.app_context():
+        with db.engines[READ_ONLY_BIND].connect() as connection:
+            with pytest.raises(OperationalError):
+                connection.exec_driver_sql("UPDATE employee SET name = name")
+
+
+def test_export_reads_from_read_only_engine(app, client, login, seed_batch):
+    with app.app_context():
+        login(client)
+        seed_batch(0)
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engines[READ_ONLY_BIND], 'before_cursor_execute', record)
+        try:
+            response = client.get('/export/expenses/csv')
+            assert 'Fuel 0' in response.get_data(as_text=True)
+        finally:
+            event.remove(db.engines[READ_ONLY_BIND], 'before_cursor_execute', record)
+        assert any('FROM expense' in statement for statement in statements)
+        # Read-only mode ends with the request
+        assert not db.session.info.get('read_only')
@@ -0,0 +1,138 @@
+import csv
+import io
+import pytest
+
+
+def _read_csv(response):
+    assert response.status_code == 200
+    assert response.mimetype == 'text/csv'
+    assert response.is_streamed
+    rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+    response.close()  # Checks the query budget of the streamed body
+    return rows
+
+
+@pytest.mark.parametrize('entity, header, rows_per_batch', [
+    ('projects', 'Profit Margin', 1),
+    ('timesheets', 'Calculated Hours', 3),
+    ('expenses', 'Payment Status', 1),
+    ('payroll', 'Check Details', 1),
+])
+def test_csv_exports_stream_every_row(app, client, entity, header, rows_per_batch, login, seed_batch):
+    """CSV exports stream one row per record with the usual columns."""
+    with app.app_context():
+        login(client)
+        for batch in range(4):
+            seed_batch(batch)
+
+        response = client.get(f'/export/{entity}/csv')
+        assert response.headers['Content-Disposition'] == f'attachment; filename={entity}_report.csv'
+        rows = _read_csv(response)
+        assert len(rows) >= 4 * rows_per_batch
+        assert header in rows[0]
+
+
+def test_timesheet_csv_values(app, client, login, seed_batch):
+    with app.app_context():
+        login(client)
+        seed_batch(0)
+
+        rows = [row for row in _read_csv(client.get('/export/timesheets/csv'))
+                if row['Employee'] == 'Budget Worker 0']
+        assert len(rows) == 3
+        # 7:00-15:30 with a 45 minute lunch: 8.5h raw, 8h paid at $20/h
+        assert rows[0]['Raw Hours'] == '8.50'
+        assert rows[0]['Calculated Hours'] == '8.00'
+        assert rows[0]['Labor Cost'] == '$160.00'
+        assert rows[0]['Project'] == 'Budget Project 0'
+
+
+def test_csv_export_chunks_large_tables(app, client, monkeypatch, login, seed_batch):
+    """Rows are sent in batches rather than as one body."""
+    import app as app_module
+    monkeypatch.setattr(app_module, 'EXPORT_BATCH_SIZE', 2)
+    with app.app_context():
+        login(client)
+        for batch in range(3):
+            seed_batch(batch)
+
+        response = client.get('/export/timesheets/csv')
+        chunks = [chunk for chunk in response.response if chunk]
+        assert len(chunks) > 2
+        assert chunks[0].startswith(b'Date,Employee,Project')
+
+
+@pytest.mark.parametrize('entity, columns', [
+    ('projects', ['Project ID', 'Name', 'Client', 'Location', 'Start Date', 'End Date', 'Status', 'Contract Value',
+                  'Labor Cost', 'Material Cost', 'Other Expenses', 'Total Cost', 'Profit', 'Profit Margin']),
+    ('timesheets', ['Date', 'Employee', 'Project', 'Entry Time', 'Exit Time', 'Lunch (mins)', 'Raw Hours',
+                    'Calculated Hours', 'Labor Cost']),
+    ('expenses', ['Date', 'Description', 'Category', 'Amount', 'Supplier/Vendor', 'Project', 'Payment Method',
+                  'Payment Status']),
+    ('payroll', ['Employee', 'Pay Period Start', 'Pay Period End', 'Payment Date', 'Amount', 'Payment Method',
+                 'Check Details', 'Notes']),
+])
+def test_excel_exports_keep_column_layout(app, client, entity, columns, login, seed_batch):
+    """Excel exports have the same columns and rows as the CSV exports."""
+    from openpyxl import load_workbook
+    with app.app_context():
+        login(client)
+        for batch in range(2):
+            seed_batch(batch)
+
+        response = client.get(f'/export/{entity}/excel')
+        assert response.status_code == 200
+        assert response.headers['Content-Disposition'].endswith(f'{entity}_report.xlsx')
+        sheet = load_workbook(io.BytesIO(response.get_data()), read_only=True).active
+        rows = list(sheet.iter_rows(values_only=True))
+        assert list(rows[0]) == columns
+
+        csv_rows = _read_csv(client.get(f'/export/{entity}/csv'))
+        assert len(rows) - 1 == len(csv_rows)
+        assert [str(value) if value is not None else '' for value in rows[1]] == list(csv_rows[0].values())
+
+
+def test_export_filters_narrow_rows(app, client, login, seed_batch):
+    """Query-string filters are applied to every export."""
+    from datetime import timedelta
+    from app import get_week_start_end
+    from models import Employee, Project
+    with app.app_context():
+        login(client)
+        for batch in range(3):
+            seed_batch(batch)
+        employee = Employee.query.filter_by(employee_id_str="BW001").one()
+        project = Project.query.filter_by(project_id_str="BP002").one()
+        week_start, _ = get_week_start_end()
+
+        rows = _read_csv(client.get(f'/export/timesheets/csv?employee_id={employee.id}'))
+        assert {row['Employee'] for row in rows} == {'Budget Worker 1'}
+        assert len(rows) == 3
+
+        day = week_start.strftime('%Y-%m-%d')
+        rows = _read_csv(client.get(f'/export/timesheets/csv?start_date={day}&end_date={day}&project_id={project.id}'))
+        assert len(rows) == 1
+        assert rows[0]['Date'] == day
+
+        rows = _read_csv(client.get(f'/export/projects/csv?project_id={project.id}&status=in_progress'))
+        assert [row['Name'] for row in rows] == ['Budget Project 2']
+        assert rows[0]['Labor Cost'] == f"${3 * 8.0 * 22.0:.2f}"
+        assert _read_csv(client.get(f'/export/projects/csv?project_id={project.id}&status=Completed')) == []
+
+        rows = _read_csv(client.get('/export/payroll/csv?payment_method=check'))
+        assert rows and {row['Payment Method'] for row in rows} == {'Check'}
+
+        rows = _read_csv(client.get(f'/export/expenses/csv?project_id={project.id}&status=paid&payment_method=CASH'))
+        assert [row['Description'] for row in rows] == ['Fuel 2']
+        later = (week_start + timedelta(days=1)).strftime('%Y-%m-%d')
+        assert _read_csv(client.get(f'/export/expenses/csv?start_date={later}')) == []
+
+
+def test_invalid_export_filter_redirects(app, client, login):
+    with app.app_context():
+        login(client)
+        response = client.get('/export/timesheets/csv?start_date=04/05/2025')
+        assert response.status_code == 302
+        assert response.headers['Location'].endswith('/timesheets')
+        response = client.get('/export/expenses/excel?payment_method=barter')
+        assert response.status_code == 302
@@ -0,0 +1,56 @@
+from datetime import date
+from app import spending_breakdown, SPENDING_BY_CATEGORY, SPENDING_BY_VENDOR
+from models import (db, AccountsPayable, ExpenseCategory, MonthlyExpense, PaidAccount, PaymentMethod,
+                    PaymentStatus)
+
+
+def _spend(count, year=2001):
+    """Add `count` monthly expenses, paid accounts and payables spread over a year."""
+    for i in range(count):
+        day = date(year, i % 12 + 1, 10)
+        db.session.add(MonthlyExpense(description=f'Rent {i}', amount=100, expense_date=day,
+                                      category=ExpenseCategory.RENT, payment_method=PaymentMethod.CASH))
+        db.session.add(PaidAccount(vendor=' Acme Supply ', amount=50, payment_date=day,
+                                   category=ExpenseCategory.MATERIALS, payment_method=PaymentMethod.CHECK))
+        db.session.add(AccountsPayable(vendor='Acme Supply', description=f'Bill {i}', amount=25, issue_date=day,
+                                       due_date=day, category=ExpenseCategory.MATERIALS,
+                                       status=PaymentStatus.PAID if i % 2 else PaymentStatus.PENDING))
+    db.session.commit()
+
+
+def test_spending_breakdown_merges_sources_for_the_period(app):
+    with app.app_context():
+        _spend(24)
+
+        categories = spending_breakdown(SPENDING_BY_CATEGORY, date(2001, 3, 1), date(2001, 3, 31))
+        assert [(row['label'], row['amounts'], row['total']) for row in categories] == [
+            ('Rent', [200, 0, 0, 0, 0], 200),
+            ('Materials', [0, 100, 50, 0, 0], 150),
+        ]
+
+        vendors = spending_breakdown(SPENDING_BY_VENDOR, date(2001, 1, 1), date(2001, 12, 31), limit=1)
+        assert vendors == [{'label': 'Acme Supply', 'amounts': [1200, 300, 0, 0], 'total': 1500}]
+        assert spending_breakdown(SPENDING_BY_VENDOR, date(2002, 1, 1), date(2002, 12, 31)) == []
+
+
+def test_financial_reports_filter_and_query_count(app, client, login, count_queries):
+    with app.app_context():
+        login(client)
+        _spend(12)
+        client.get('/financial_reports?year=2001')  # Warm up
+        with count_queries() as few:
+            response = client.get('/financial_reports?year=2001&month=3')
+        assert response.status_code == 200
+        html = response.get_data(as_text=True)
+        assert 'Mar 01, 2001 - Mar 31, 2001' in html
+        assert '<option value="3" selected>' in html
+        assert '$100.00' in html
+
+        _spend(120)
+        with count_queries() as many:
+            client.get('/financial_reports?year=2001&month=3')
+        assert many['count'] == few['count']
+
+        # Out-of-range filters fall back to the whole current year
+        html = client.get('/financial_reports?year=1850&month=13').get_data(as_text=True)
+        assert f'Jan 01, {date.today().year} - Dec 31, {date.today().year}' in html
@@ -0,0 +1,141 @@
+import io
+import os
+import tempfile
+import zipfile
+import app as app_module
+from invoice_cache import cached_invoice_pdf, evict_invoice_pdfs, invoice_cache_key
+from models import db, Invoice
+
+
+def _cached_files(app):
+    return sorted(os.listdir(app.config['INVOICE_PDF_CACHE_DIR']))
+
+
+def _seed_invoice(seed_batch):
+    seed_batch(0)
+    invoice = Invoice.query.filter_by(invoice_number='BUD-0').one()
+    invoice.project.client_name = 'Budget Client'
+    db.session.commit()
+    return invoice
+
+
+def test_repeat_prints_are_served_from_cache(app, client, monkeypatch, login, seed_batch):
+    """The PDF is rendered once; later prints send the cached file."""
+    renders = []
+    render = app_module.render_customer_invoice_pdf
+
+    def counting_render(invoice, project):
+        renders.append(invoice.id)
+        return render(invoice, project)
+
+    monkeypatch.setattr(app_module, 'render_customer_invoice_pdf', counting_render)
+    with app.app_context():
+        login(client)
+        invoice = _seed_invoice(seed_batch)
+
+        first = client.get(f'/invoice/print/{invoice.id}')
+        second = client.get(f'/invoice/print/{invoice.id}')
+        assert first.status_code == second.status_code == 200
+        assert first.data.startswith(b'%PDF')
+        assert first.data == second.data
+        assert renders == [invoice.id]
+        assert second.headers['ETag'] == f'"{invoice_cache_key(invoice, invoice.project)}"'
+
+
+def test_editing_printed_fields_invalidates(app, client, login, seed_batch):
+    with app.app_context():
+        login(client)
+        invoice = _seed_invoice(seed_batch)
+        client.get(f'/invoice/print/{invoice.id}')
+        assert len(_cached_files(app)) == 1
+
+        # Fields that aren't printed keep the cached file
+        invoice.invoice_number = 'BUD-0-A'
+        db.session.commit()
+        assert len(_cached_files(app)) == 1
+
+        old_key = invoice_cache_key(invoice, invoice.project)
+        invoice.description = 'Two coats of paint'
+        db.session.commit()
+        assert _cached_files(app) == []
+        assert invoice_cache_key(invoice, invoice.project) != old_key
+
+        client.get(f'/invoice/print/{invoice.id}')
+        invoice.project.location = '1 New Street'
+        db.session.commit()
+        assert _cached_files(app) == []
+
+        client.get(f'/invoice/print/{invoice.id}')
+        db.session.delete(invoice)
+        db.session.commit()
+        assert _cached_files(app) == []
+
+
+def test_lru_eviction(app, seed_batch):
+    with app.app_context():
+        invoice = _seed_invoice(seed_batch)
+        project = invoice.project
+        paths = []
+        for description in ('one', 'two', 'three'):
+            invoice.description = description
+            path, _ = cached_invoice_pdf(invoice, project, lambda invoice, project: b'%PDF' + b'x' * 1000)
+            paths.append(path)
+        # Make the second file the least recently used
+        os.utime(paths[0], (1, 1))
+        os.utime(paths[1], (0, 0))
+        os.utime(paths[2], (2, 2))
+
+        assert evict_invoice_pdfs(max_bytes=2100) == 1
+        assert not os.path.exists(paths[1])
+        assert os.path.exists(paths[0]) and os.path.exists(paths[2])
+        db.session.rollback()
+
+
+def _seed_client_invoices(count, seed_batch):
+    for batch in range(count):
+        seed_batch(batch)
+    invoices = Invoice.query.filter(Invoice.invoice_number.like('BUD-%')).all()
+    for invoice in invoices:
+        invoice.project.client_name = 'Budget Client'
+    db.session.commit()
+    return invoices
+
+
+def test_batch_print_zip(app, client, login, seed_batch):
+    """A batch print zips one PDF per matching invoice, reusing the cache."""
+    with app.app_context():
+        login(client)
+        invoices = _seed_client_invoices(3, seed_batch)
+        client.get(f'/invoice/print/{invoices[0].id}')
+
+        response = client.get('/invoices/print?format=zip&client=budget client&status=pending')
+        assert response.status_code == 200
+        assert response.mimetype == 'application/zip'
+        archive = zipfile.ZipFile(io.BytesIO(response.data))
+        names = archive.namelist()
+        assert len(names) == 3
+        assert all(archive.read(name).startswith(b'%PDF') for name in names)
+        assert len(_cached_files(app)) == 3
+
+        # Nothing matches
+        response = client.get('/invoices/print?client=Nobody')
+        assert response.status_code == 302
+
+
+def test_batch_print_merged_pdf(app, client, monkeypatch, tmp_path, login, seed_batch):
+    monkeypatch.setattr(tempfile, 'tempdir', str(tmp_path / 'tmp'))
+    os.makedirs(tempfile.tempdir)
+    with app.app_context():
+        login(client)
+        _seed_client_invoices(2, seed_batch)
+
+        response = client.get('/invoices/print?format=pdf&client=Budget Client')
+        assert response.status_code == 200
+        assert response.mimetype == 'application/pdf'
+        assert response.data.count(b'/Type /Page\n') == 2
+        # Sent from the file fpdf wrote, which is removed once it has been sent
+        assert len(os.listdir(tempfile.tempdir)) == 1
+        response.close()
+        assert os.listdir(tempfile.tempdir) == []
+
+        assert client.get('/invoices/print?format=pdf&status=bogus').status_code == 302
@@ -0,0 +1,88 @@
+import re
+from datetime import date, timedelta
+import pytest
+from models import db, Expense, Project, ProjectStatus, PaymentMethod, PaymentStatus
+from pagination import keyset_paginate, seek_condition, sort_keys, InvalidCursor
+
+
+def _walk(order_by, query, per_page):
+    """Follow next cursors to the end, then prev cursors back to the start."""
+    pages = [keyset_paginate(query(), order_by, per_page=per_page)]
+    while pages[-1].has_next:
+        pages.append(keyset_paginate(query(), order_by, after=pages[-1].next_cursor, per_page=per_page))
+    back = [pages[-1]]
+    while back[-1].has_prev:
+        back.append(keyset_paginate(query(), order_by, before=back[-1].prev_cursor, per_page=per_page))
+    return [page.items for page in pages], [page.items for page in reversed(back)]
+
+
+def test_pages_cover_every_row_once_in_both_directions(app, seed_batch):
+    with app.app_context():
+        seed_batch(0)
+        project = Project.query.filter_by(name='Budget Project 0').first()
+        for i in range(11):
+            # Several rows share each date, so the id breaks the ties
+            db.session.add(Expense(project_id=project.id, description=f'Page expense {i}', amount=i,
+                                   date=date(2024, 1, 1) + timedelta(days=i // 3),
+                                   payment_method=PaymentMethod.CASH, payment_status=PaymentStatus.PAID))
+        db.session.commit()
+
+        order_by = (Expense.date.desc(), Expense.id.desc())
+        expected = Expense.query.order_by(*order_by).all()
+        forward, backward = _walk(order_by, lambda: Expense.query, per_page=4)
+        assert [len(items) for items in forward] == [4, 4, 4]
+        assert sum(forward, []) == expected
+        assert backward == forward
+
+
+def test_nullable_sort_key(app):
+    with app.app_context():
+        for i in range(7):
+            db.session.add(Project(name=f'Undated {i}', status=ProjectStatus.PENDING,
+                                   start_date=None if i % 2 else date(2024, 1, i + 1)))
+        db.session.commit()
+
+        for order_by in [(Project.start_date.desc(), Project.id.desc()), (Project.start_date, Project.id)]:
+            expected = Project.query.order_by(*order_by).all()
+            forward, backward = _walk(order_by, lambda: Project.query, per_page=2)
+            assert sum(forward, []) == expected
+            assert backward == forward
+
+
+def test_list_pages_follow_cursors(app, client, login, seed_batch):
+    with app.app_context():
+        login(client)
+        for batch in range(5):
+            seed_batch(batch)
+        app.config['LIST_PAGE_SIZE'] = 2
+        try:
+            html = client.get('/invoices').get_data(as_text=True)
+            invoices = re.findall(r'BUD-\d', html)
+            next_url = re.search(r'href="(/invoices\?after=[^"]+)"', html).group(1)
+            html = client.get(next_url).get_data(as_text=True)
+            assert not set(re.findall(r'BUD-\d', html)) & set(invoices)
+            # Totals still cover every invoice, not just the page
+            assert '$10000.00' in html
+
+            assert client.get('/expenses?after=not-a-cursor').status_code == 400
+            for url in ['/employees', '/projects', '/timesheets', '/materials', '/expenses',
+                        '/accounts_payable', '/paid_accounts', '/monthly_expenses']:
+                response = client.get(url)
+                assert response.status_code == 200, url
+                assert '?after=' in response.get_data(as_text=True), url
+        finally:
+            app.config['LIST_PAGE_SIZE'] = 50
+
+
+def test_deep_pages_seek_through_the_index(app):
+    with app.app_context():
+        keys = sort_keys((Expense.date.desc(), Expense.id.desc()))
+        query = Expense.query.filter(seek_condition(keys, [date(2024, 1, 1), 100])) \
+            .order_by(Expense.date.desc(), Expense.id.desc()).limit(51)
+        sql = str(query.statement.compile(compile_kwargs={'literal_binds': True}))
+        plan = ' '.join(row[-1] for row in db.session.execute(db.text('EXPLAIN QUERY PLAN ' + sql)))
+        assert 'idx_expense_item_date' in plan
+        assert 'TEMP B-TREE' not in plan  # No sort of the whole table
+
+        with pytest.raises(InvalidCursor):
+            keyset_paginate(Expense.query, (Expense.date.desc(), Expense.id.desc()), after='W10')
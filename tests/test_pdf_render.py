@@ -0,0 +1,156 @@
+import re
+import zlib
+
+import fpdf
+import pytest
+import pdf_render
+from pdf_render import ErpPDF, StaticLayout, PRELOADED_CODES
+from app import render_customer_invoice_pdf
+from models import Invoice
+
+
+def test_fonts_are_loaded_once():
+    """Documents share the font metrics but each gets its own subset."""
+    first, second = ErpPDF(), ErpPDF()
+    assert first.fonts['dejavu']['cw'] is second.fonts['dejavu']['cw']
+    assert first.fonts['dejavu']['subset'] is not second.fonts['dejavu']['subset']
+    assert set(PRELOADED_CODES) <= set(first.fonts['dejavuB']['subset'])
+    assert [font['i'] for font in ErpPDF(fonts=('', 'B', 'I')).fonts.values()] == [1, 2, 3]
+
+
+def test_font_subsets_are_reused(app, seed_batch):
+    with app.app_context():
+        seed_batch(0)
+        invoice = Invoice.query.filter_by(invoice_number='BUD-0').one()
+        render_customer_invoice_pdf(invoice, invoice.project)
+        hits = pdf_render._build_subset.cache_info().hits
+
+        pdf = render_customer_invoice_pdf(invoice, invoice.project)
+        assert pdf.startswith(b'%PDF')
+        # Regular and bold subsets both come from the cache
+        assert pdf_render._build_subset.cache_info().hits == hits + 2
+
+
+def _draw_box(pdf):
+    pdf.set_font('DejaVu', 'B', 12)
+    pdf.set_text_color(200, 0, 0)
+    pdf.set_xy(20, 30)
+    pdf.cell(40, 10, 'STATIC', 1, 0)
+    return {'value': (60, 30)}
+
+
+def test_subset_cache_is_limited_to_erp_documents():
+    """Plain FPDF documents keep fpdf's own subsetting."""
+    assert fpdf.fpdf.TTFontFile is pdf_render.TTFontFile
+    pdf = fpdf.FPDF()
+    pdf.add_font('DejaVu', '', pdf_render.font_path(''), uni=True)
+    pdf.add_page()
+    pdf.set_font('DejaVu', '', 10)
+    pdf.cell(0, 10, 'Plain document')
+    calls = pdf_render._build_subset.cache_info()
+    assert pdf.output(dest='S').startswith('%PDF')
+    assert pdf_render._build_subset.cache_info() == calls
+
+
+def test_static_layout_is_stamped():
+    layout = StaticLayout(_draw_box)
+    content, _, anchors = layout.compile()
+    assert anchors == {'value': (60, 30)}
+    assert layout.compile()[0] is content  # Drawn once
+
+    pdf = ErpPDF()
+    pdf.add_page()
+    pdf.set_font('DejaVu', '', 9)
+    assert layout.stamp(pdf) == anchors
+    assert pdf.pages[1].endswith('q\n' + content + 'Q\n')
+    # The stamped content doesn't change the document's tracked state
+    assert (pdf.font_family, pdf.font_style, pdf.font_size_pt) == ('dejavu', '', 9)
+
+
+def test_static_layout_needs_matching_fonts():
+    pdf = ErpPDF(fonts=('B', ''))
+    pdf.add_page()
+    with pytest.raises(ValueError):
+        StaticLayout(_draw_box).stamp(pdf)
+
+
+def test_pdf_export(app, client, login, seed_batch):
+    """Table exports render with the shared fonts."""
+    with app.app_context():
+        login(client)
+        seed_batch(0)
+        response = client.get('/export/expenses/pdf')
+        assert response.status_code == 200
+        assert response.mimetype == 'application/pdf'
+        assert response.data.startswith(b'%PDF')
+
+
+def _report_rows(count):
+    for i in range(count):
+        yield {'Name': f'Row {i}', 'Hours': 2, 'Cost': f'${i}.50'}
+
+
+def test_table_report_is_streamed(tmp_path):
+    """A generator of rows becomes a multi-page table with totals."""
+    path = tmp_path / 'report.pdf'
+    pdf_render.write_table_report(_report_rows(100), 'Streamed', str(path), sample_size=10)
+    data = path.read_bytes()
+    assert data.startswith(b'%PDF')
+    assert int(re.search(rb'/Count (\d+)', data).group(1)) > 1
+
+
+def test_table_pages_are_compressed_when_finished():
+    pdf = pdf_render.TablePDF()
+    pdf.add_page()
+    pdf.start_table([('Name', 40), ('Hours', 20)])
+    pdf.set_font('DejaVu', '', 8)
+    for i in range(30):
+        pdf.cell(40, 10, f'Row {i}', 1, 0)
+        pdf.cell(20, 10, '1', 1, 1)
+    pdf.add_page()
+    assert pdf.page == 3
+    assert isinstance(pdf.pages[1], bytes)
+    # The header row is repeated at the top of the next page
+    hours = 'Hours'.encode('utf-16-be')
+    assert hours in zlib.decompress(pdf.pages[1])
+    assert hours in zlib.decompress(pdf.pages[2])
+
+
+def test_parse_number():
+    assert pdf_render._parse_number('1,200.50') == 1200.5
+    assert pdf_render._parse_number('$45.10') == 45.1
+    assert pdf_render._parse_number('-3') == -3
+    assert pdf_render._parse_number('12%') is None
+    assert pdf_render._parse_number('Row 1') is None
+
+
+def test_column_widths_come_from_the_sample():
+    sample = [{'Name': 'x' * 40, 'Code': 'ab'}]
+    widths = pdf_render._sampled_column_widths(['Name', 'Code'], sample)
+    assert widths[0] > widths[1]
+    assert pdf_render._fixed_column_widths(['Name', 'Code'], {'Name': 55}) == [55, 200]
+
+
+def test_table_putpages_matches_the_fpdf_release():
+    """TablePDF._putpages is adapted from fpdf's; re-check it when fpdf changes."""
+    assert fpdf.FPDF_VERSION == pdf_render.PUTPAGES_FPDF_VERSION
+
+
+def test_subset_cache_is_pinned_to_the_fpdf_release(monkeypatch):
+    """ErpPDF._putfonts runs fpdf's own code; another release keeps fpdf's method."""
+    assert fpdf.FPDF_VERSION == pdf_render.PUTFONTS_FPDF_VERSION
+    assert ErpPDF._putfonts is not fpdf.FPDF._putfonts
+    monkeypatch.setattr(fpdf, 'FPDF_VERSION', '1.7.3')
+    assert pdf_render._with_subset_cache(fpdf.FPDF._putfonts) is fpdf.FPDF._putfonts
+
+
+def test_table_links_fall_back_to_fpdf_putpages():
+    pdf = pdf_render.TablePDF()
+    pdf.alias_nb_pages()
+    pdf.add_page()
+    pdf.set_font('DejaVu', '', 8)
+    pdf.cell(40, 10, 'Page 1 of {nb}', 0, 1, link='https://example.com')
+    pdf.add_page()
+    data = pdf.output(dest='S').encode('latin1')
+    assert b'/URI (https://example.com)' in data
+    assert int(re.search(rb'/Count (\d+)', data).group(1)) == 2
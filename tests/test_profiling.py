@@ -0,0 +1,103 @@
+import json
+import os
+import pytest
+from models import db, Employee, PaymentMethod
+from profiling import RequestProfile, summarize_profile_log
+
+
+def test_server_timing_header(app, client, login):
+    """Responses carry the request's query count and DB time."""
+    with app.app_context():
+        login(client)
+        db.session.add(Employee(name="Timed Employee", pay_rate=20.0, payment_method_preference=PaymentMethod.CASH))
+        db.session.commit()
+
+        response = client.get('/employees')
+        assert response.status_code == 200
+        timing = response.headers['Server-Timing']
+        assert timing.startswith('db;desc="1 queries";dur=')
+        assert 'app;dur=' in timing
+
+
+def test_profile_log_is_written_and_summarized(app, client, tmp_path, login):
+    """Each request appends one JSON line; the summary aggregates by endpoint."""
+    log_path = str(tmp_path / 'sql_profile.jsonl')
+    app.config['SQL_PROFILE_LOG'] = log_path
+    try:
+        with app.app_context():
+            login(client)
+            client.get('/employees')
+            client.get('/employees')
+            client.get('/projects')
+    finally:
+        app.config['SQL_PROFILE_LOG'] = None
+
+    with open(log_path) as f:
+        entries = [json.loads(line) for line in f]
+    employees = [e for e in entries if e['endpoint'] == 'employees']
+    assert len(employees) == 2
+    assert employees[0]['status'] == 200
+    assert employees[0]['query_count'] == 1
+    assert employees[0]['slowest'][0]['sql'].startswith('SELECT')
+
+    summary = {row['endpoint']: row for row in summarize_profile_log(log_path)}
+    assert summary['employees']['requests'] == 2
+    assert summary['projects']['avg_queries'] >= 1
+
+
+def test_profile_log_follows_external_rotation(app, client, tmp_path, login):
+    """After logrotate moves the log away, new lines go to a fresh file and both are summarized."""
+    log_path = str(tmp_path / 'sql_profile.jsonl')
+    app.config['SQL_PROFILE_LOG'] = log_path
+    try:
+        with app.app_context():
+            login(client)
+            client.get('/employees')
+            os.rename(log_path, log_path + '.1')
+            client.get('/employees')
+    finally:
+        app.config['SQL_PROFILE_LOG'] = None
+
+    for path in (log_path, log_path + '.1'):
+        with open(path) as f:
+            assert [json.loads(line)['endpoint'] for line in f][-1] == 'employees'
+    summary = {row['endpoint']: row for row in summarize_profile_log(log_path)}
+    assert summary['employees']['requests'] == 2
+
+
+def test_streamed_export_is_profiled_on_close(app, client, tmp_path, login):
+    """A streamed CSV export is logged with the queries its body ran."""
+    log_path = str(tmp_path / 'sql_profile.jsonl')
+    app.config['SQL_PROFILE_LOG'] = log_path
+    try:
+        with app.app_context():
+            login(client)
+            response = client.get('/export/timesheets/csv')
+            assert response.headers['Server-Timing'].startswith('db;desc="0 queries before streaming"')
+            response.get_data()
+            response.close()
+            # A file download is profiled as soon as it is returned
+            response = client.get('/export/timesheets/pdf')
+            assert response.headers['Server-Timing'].startswith('db;desc="')
+            assert 'before streaming' not in response.headers['Server-Timing']
+    finally:
+        app.config['SQL_PROFILE_LOG'] = None
+
+    with open(log_path) as f:
+        entries = [json.loads(line) for line in f]
+    export = [e for e in entries if e['endpoint'] == 'export_timesheets']
+    assert len(export) == 2
+    assert export[1]['streamed'] is False
+    assert export[0]['streamed'] is True
+    assert export[0]['query_count'] >= 1
+    assert export[0]['slowest'][0]['sql'].startswith('SELECT')
+
+
+def test_request_profile_keeps_slowest():
+    """Only the slowest statements are kept, slowest first."""
+    profile = RequestProfile(keep_slowest=2)
+    for i, duration in enumerate([0.01, 0.5, 0.02, 0.3]):
+        profile.record(f'SELECT {i}', duration)
+    assert profile.query_count == 4
+    assert profile.db_time == pytest.approx(0.83)
+    assert profile.slowest == [(0.5, 'SELECT 1'), (0.3, 'SELECT 3')]
@@ -0,0 +1,153 @@
+import pytest
+from datetime import date, time
+from models import db, Employee, Project, Timesheet, Material, Expense, Invoice, ProjectFinancial, ProjectStatus, PaymentMethod, PaymentStatus, User
+from rollups import project_rollup, refresh_project_financials, ensure_project_financials
+
+
+def _financial(project_id):
+    db.session.expire_all()
+    return db.session.get(ProjectFinancial, project_id)
+
+
+def _assert_matches_rollup(project_id):
+    """The stored summary matches a fresh rollup of the live tables."""
+    financial = _financial(project_id)
+    rollup = project_rollup(project_id)
+    assert financial is not None
+    assert financial.labor_cost == pytest.approx(rollup.labor_cost)
+    assert financial.material_cost == pytest.approx(rollup.material_cost)
+    assert financial.expense_cost == pytest.approx(rollup.other_expenses)
+    assert financial.invoiced == pytest.approx(rollup.invoiced)
+    assert financial.collected == pytest.approx(rollup.actual_revenue)
+    assert financial.profit == pytest.approx(rollup.profit)
+    assert financial.profit_margin == pytest.approx(rollup.profit_margin)
+    assert financial.net_profit == pytest.approx(rollup.actual_net_profit)
+
+
+def test_financials_follow_inserts_updates_and_deletes(app):
+    """The summary row is maintained incrementally as child rows change."""
+    with app.app_context():
+        employee = Employee(name="Summary Worker", employee_id_str="SW001", pay_rate=20.0, is_active=True)
+        project = Project(name="Summary Project", project_id_str="SP001", contract_value=5000.0,
+                          status=ProjectStatus.IN_PROGRESS)
+        db.session.add_all([employee, project])
+        db.session.commit()
+
+        # A new project gets an empty summary straight away
+        assert _financial(project.id).total_cost == 0
+        assert _financial(project.id).profit_margin == 100.0
+
+        timesheet = Timesheet(employee_id=employee.id, project_id=project.id, date=date(2025, 4, 3),
+                              entry_time=time(7, 0), exit_time=time(15, 0), lunch_duration_minutes=45)
+        material = Material(project_id=project.id, description="Primer", cost=120.0)
+        expense = Expense(project_id=project.id, description="Dumpster", amount=80.0, date=date(2025, 4, 3),
+                          payment_method=PaymentMethod.CASH, payment_status=PaymentStatus.PAID)
+        invoice = Invoice(project_id=project.id, invoice_number="SUM-1", invoice_date=date(2025, 4, 4),
+                          amount=3000.0, status=PaymentStatus.PENDING)
+        db.session.add_all([timesheet, material, expense, invoice])
+        db.session.commit()
+        assert _financial(project.id).labor_cost == pytest.approx(150.0)
+        assert _financial(project.id).collected == 0
+        _assert_matches_rollup(project.id)
+
+        invoice.status = PaymentStatus.PAID
+        material.cost = 200.0
+        db.session.commit()
+        assert _financial(project.id).collected == pytest.approx(3000.0)
+        _assert_matches_rollup(project.id)
+
+        # A pay rate change reprices the project's labor
+        employee.pay_rate = 30.0
+        db.session.commit()
+        assert _financial(project.id).labor_cost == pytest.approx(225.0)
+
+        db.session.delete(expense)
+        db.session.commit()
+        assert _financial(project.id).expense_cost == 0
+        _assert_matches_rollup(project.id)
+
+        # Query-level deletes (as used by delete_timesheet) are tracked too
+        db.session.execute(db.delete(Timesheet).where(Timesheet.id == timesheet.id))
+        db.session.commit()
+        assert _financial(project.id).labor_cost == 0
+        _assert_matches_rollup(project.id)
+
+
+def test_moving_rows_between_projects(app):
+    """Reassigning a row updates both the old and the new project."""
+    with app.app_context():
+        first = Project(name="First", project_id_str="MV001", contract_value=1000.0, status=ProjectStatus.PENDING)
+        second = Project(name="Second", project_id_str="MV002", contract_value=1000.0, status=ProjectStatus.PENDING)
+        db.session.add_all([first, second])
+        db.session.flush()
+        material = Material(project_id=first.id, description="Tape", cost=50.0)
+        db.session.add(material)
+        db.session.commit()
+        assert _financial(first.id).material_cost == pytest.approx(50.0)
+
+        material.project_id = second.id
+        db.session.commit()
+        assert _financial(first.id).material_cost == 0
+        assert _financial(second.id).material_cost == pytest.approx(50.0)
+
+
+def test_rebuild_financials_command(app, runner):
+    """`flask rebuild-financials` recomputes every summary row."""
+    with app.app_context():
+        project = Project(name="Rebuild Project", project_id_str="RB001", contract_value=2000.0,
+                          status=ProjectStatus.PENDING)
+        db.session.add(project)
+        db.session.flush()
+        db.session.add(Material(project_id=project.id, description="Mud", cost=400.0))
+        db.session.commit()
+
+        # Simulate a stale table
+        db.session.execute(ProjectFinancial.__table__.delete())
+        db.session.commit()
+        assert _financial(project.id) is None
+
+        result = runner.invoke(args=['rebuild-financials'])
+        assert 'Rebuilt financial summaries' in result.output
+        assert _financial(project.id).material_cost == pytest.approx(400.0)
+        _assert_matches_rollup(project.id)
+
+
+def test_missing_table_is_created_and_filled(app, client):
+    """A database from before project_financials gets the table on startup."""
+    with app.app_context():
+        project = Project(name="Old Project", project_id_str="OP001", contract_value=1000.0,
+                          status=ProjectStatus.IN_PROGRESS)
+        db.session.add(project)
+        db.session.flush()
+        db.session.add(Material(project_id=project.id, description="Tape", cost=150.0))
+        db.session.commit()
+        ProjectFinancial.__table__.drop(db.engine)
+
+        assert ensure_project_financials()
+        assert not ensure_project_financials()
+        _assert_matches_rollup(project.id)
+
+        # The flush hooks work again
+        db.session.add(Material(project_id=project.id, description="Screws", cost=50.0))
+        db.session.commit()
+        assert _financial(project.id).material_cost == pytest.approx(200.0)
+
+
+def test_dashboard_top_projects_by_margin(app, client):
+    """The dashboard lists projects ordered by profit margin from the summary table."""
+    with app.app_context():
+        user = User(username="marginuser")
+        user.set_password("testpassword")
+        db.session.add(user)
+        low = Project(name="Low Margin Job", project_id_str="LM001", contract_value=1000.0, status=ProjectStatus.PENDING)
+        high = Project(name="High Margin Job", project_id_str="HM001", contract_value=1000.0, status=ProjectStatus.PENDING)
+        db.session.add_all([low, high])
+        db.session.flush()
+        db.session.add(Material(project_id=low.id, description="Lots of paint", cost=900.0))
+        db.session.commit()
+
+        client.post('/login', data={'username': 'marginuser', 'password': 'testpassword'})
+        response = client.get('/')
+        assert response.status_code == 200
+        html = response.data.decode()
+        assert html.index('High Margin Job') < html.index('Low Margin Job')
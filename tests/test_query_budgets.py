@@ -0,0 +1,65 @@
+import pytest
+from loading import LOADING_PROFILES, QueryBudgetExceeded
+
+LIST_PAGES = {
+    'projects': '/projects',
+    'timesheets': '/timesheets',
+    'invoices': '/invoices',
+    'materials': '/materials',
+    'expenses': '/expenses',
+    'payroll_report': '/payroll/report',
+    'accounts_payable': '/accounts_payable',
+    'paid_accounts': '/paid_accounts',
+    'monthly_expenses': '/monthly_expenses',
+}
+
+
+def _page_query_counts(client, count_queries):
+    counts = {}
+    for view, url in LIST_PAGES.items():
+        with count_queries() as counter:
+            response = client.get(url)
+        assert response.status_code == 200, view
+        counts[view] = counter['count']
+    return counts
+
+
+def test_list_pages_stay_within_budget(app, client, login, seed_batch, count_queries):
+    """Every list page renders within its declared query budget, whatever the row count."""
+    with app.app_context():
+        login(client)
+        for batch in range(3):
+            seed_batch(batch)
+        small = _page_query_counts(client, count_queries)
+
+        for batch in range(3, 9):
+            seed_batch(batch)
+        large = _page_query_counts(client, count_queries)
+
+        for view, count in large.items():
+            assert count <= LOADING_PROFILES[view].query_budget, view
+            # No per-row lazy loads: tripling the rows doesn't add queries
+            assert count == small[view], view
+
+
+def test_budget_overrun_fails(app, client, monkeypatch, login, seed_batch):
+    """A page that goes over its budget raises in test mode."""
+    with app.app_context():
+        login(client)
+        seed_batch(0)
+        monkeypatch.setattr(LOADING_PROFILES['materials'], 'query_budget', 0)
+        with pytest.raises(QueryBudgetExceeded):
+            client.get('/materials')
+
+
+def test_streamed_export_budget_is_checked_on_close(app, client, monkeypatch, login, seed_batch):
+    """Queries a streamed export runs while sending its body count against its budget."""
+    with app.app_context():
+        login(client)
+        seed_batch(0)
+        monkeypatch.setattr(LOADING_PROFILES['export_timesheets'], 'query_budget', 0)
+        response = client.get('/export/timesheets/csv')
+        assert response.status_code == 200
+        response.get_data()
+        with pytest.raises(QueryBudgetExceeded):
+            response.close()
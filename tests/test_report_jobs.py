@@ -0,0 +1,212 @@
+import csv
+import fcntl
+import io
+import json
+import os
+import pytest
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from openpyxl import load_workbook
+from jobs import (JOB_RENDERERS, report_job, submit_job, job_progress, purge_old_jobs, fail_orphaned_jobs,
+                  current_owner, _ProgressWriter, _job_finished, _owner_lock_path, ORPHANED_JOB_ERROR,
+                  CRASHED_JOB_ERROR)
+from models import db, ReportJob, Employee, Invoice
+
+
+@pytest.fixture(autouse=True)
+def _no_query_budgets(app):
+    """Inline jobs render inside the request, so their queries would count
+    against the export pages' budgets."""
+    app.config['QUERY_BUDGETS_ENFORCED'] = False
+
+
+def _finished_job(client, url):
+    """Request a background job and return it once the redirect lands on its page."""
+    response = client.get(url)
+    assert response.status_code == 302
+    job_id = response.headers['Location'].rstrip('/').split('/')[-1]
+    job = db.session.get(ReportJob, job_id)
+    assert job is not None
+    return job
+
+
+def test_background_csv_export(app, client, login, seed_batch):
+    """A background export renders the same rows and can be downloaded when done."""
+    with app.app_context():
+        login(client)
+        for batch in range(3):
+            seed_batch(batch)
+
+        employee_id = Employee.query.filter_by(employee_id_str='BW000').one().id
+
+        job = _finished_job(client, f'/export/timesheets/csv?background=1&employee_id={employee_id}')
+        assert job.status == ReportJob.DONE
+        assert json.loads(job.params) == {'entity': 'timesheets', 'format': 'csv',
+                                          'args': {'employee_id': str(employee_id)}}
+
+        status = client.get(f'/jobs/{job.id}/status').get_json()
+        assert status['status'] == 'done'
+        assert status['progress'] == 100
+        assert status['download_url'] == f'/jobs/{job.id}/download'
+
+        response = client.get(status['download_url'])
+        assert response.status_code == 200
+        assert response.headers['Content-Disposition'] == 'attachment; filename=timesheets_report.csv'
+        rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+        assert len(rows) == 3
+        assert {row['Employee'] for row in rows} == {'Budget Worker 0'}
+
+
+def test_background_excel_export(app, client, login, seed_batch):
+    with app.app_context():
+        login(client)
+        seed_batch(0)
+
+        job = _finished_job(client, '/export/projects/excel?background=1')
+        assert job.status == ReportJob.DONE
+        response = client.get(f'/jobs/{job.id}/download')
+        sheet = load_workbook(io.BytesIO(response.data)).active
+        assert sheet.cell(row=2, column=2).value == 'Budget Project 0'
+
+
+def test_background_invoice_pdf(app, client, login, seed_batch):
+    with app.app_context():
+        login(client)
+        seed_batch(0)
+        invoice = Invoice.query.filter_by(invoice_number='BUD-0').one()
+        invoice.project.client_name = 'Budget Client'
+        db.session.commit()
+
+        job = _finished_job(client, f'/invoice/print/{invoice.id}?background=1')
+        assert job.status == ReportJob.DONE
+        response = client.get(f'/jobs/{job.id}/download')
+        assert response.status_code == 200
+        assert response.data.startswith(b'%PDF')
+
+        page = client.get(f'/jobs/{job.id}')
+        assert page.status_code == 200
+        assert b'Download' in page.data
+        assert client.get('/jobs').status_code == 200
+
+
+def test_failed_job_reports_error(app, client, login):
+    """A renderer that raises marks the job failed, and nothing can be downloaded."""
+    @report_job('test_failure')
+    def _fail(params, output_path, progress):
+        with open(output_path, 'w') as f:
+            f.write('partial')
+        raise RuntimeError('printer on fire')
+
+    try:
+        with app.app_context():
+            login(client)
+            job = submit_job('test_failure')
+            assert job.status == ReportJob.FAILED
+            assert job.error == 'printer on fire'
+            assert not os.listdir(app.config['REPORT_JOB_DIR'])
+
+            status = client.get(f'/jobs/{job.id}/status').get_json()
+            assert status['status'] == 'failed'
+            assert 'download_url' not in status
+            assert client.get(f'/jobs/{job.id}/download').status_code == 302
+    finally:
+        JOB_RENDERERS.pop('test_failure')
+
+
+def test_progress_file(app, tmp_path):
+    with app.app_context():
+        job = ReportJob(id='a' * 32, kind='export', params='{}', status=ReportJob.RUNNING)
+        db.session.add(job)
+        db.session.commit()
+        assert job_progress(job) == 0
+
+        progress = _ProgressWriter(os.path.join(app.config['REPORT_JOB_DIR'], f'{job.id}.progress'))
+        os.makedirs(app.config['REPORT_JOB_DIR'], exist_ok=True)
+        progress(25, 200)
+        assert job_progress(job) == 12
+        progress.clear()
+        job.status = ReportJob.DONE
+        assert job_progress(job) == 100
+
+
+def test_purge_old_jobs(app):
+    with app.app_context():
+        os.makedirs(app.config['REPORT_JOB_DIR'], exist_ok=True)
+        old_path = os.path.join(app.config['REPORT_JOB_DIR'], 'old')
+        open(old_path, 'w').close()
+        db.session.add_all([
+            ReportJob(id='old', kind='export', params='{}', status=ReportJob.DONE, result_path=old_path,
+                      finished_at=datetime.utcnow() - timedelta(days=3)),
+            ReportJob(id='new', kind='export', params='{}', status=ReportJob.DONE,
+                      finished_at=datetime.utcnow()),
+        ])
+        db.session.commit()
+
+        assert purge_old_jobs() == 1
+        assert db.session.get(ReportJob, 'old') is None
+        assert db.session.get(ReportJob, 'new') is not None
+        assert not os.path.exists(old_path)
+
+
+def test_jobs_of_a_gone_owner_are_marked_failed(app, client, runner, login):
+    """Jobs left behind by a web worker that went away don't stay pending forever,
+    while old jobs of a live (busy) owner keep their place."""
+    with app.app_context():
+        login(client)
+        long_ago = datetime.utcnow() - timedelta(hours=2)
+        # Another live web process: it holds its owner lock
+        busy_lock = open(_owner_lock_path(4242, 'busy'), 'w')
+        fcntl.flock(busy_lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        # A web process that exited: its lock file is left, unlocked
+        open(_owner_lock_path(4343, 'gone'), 'w').close()
+        pid, boot_id = current_owner()
+        db.session.add_all([
+            ReportJob(id='busy_queued', kind='export', params='{}', created_at=long_ago,
+                      owner_pid=4242, owner_boot_id='busy'),
+            ReportJob(id='own_queued', kind='export', params='{}', created_at=long_ago,
+                      owner_pid=pid, owner_boot_id=boot_id),
+            ReportJob(id='lost_queued', kind='export', params='{}', owner_pid=4343, owner_boot_id='gone'),
+            ReportJob(id='lost_running', kind='export', params='{}', status=ReportJob.RUNNING,
+                      started_at=long_ago, owner_pid=4343, owner_boot_id='gone'),
+            # Same pid, earlier process
+            ReportJob(id='reused_pid', kind='export', params='{}', owner_pid=pid, owner_boot_id='earlier'),
+            ReportJob(id='unowned', kind='export', params='{}'),
+        ])
+        db.session.commit()
+        partial_path = os.path.join(app.config['REPORT_JOB_DIR'], 'lost_running')
+        open(partial_path, 'w').close()
+
+        # Polling doesn't sweep
+        assert client.get('/jobs/lost_queued/status').get_json()['status'] == ReportJob.QUEUED
+
+        result = runner.invoke(args=['fail-orphaned-jobs'])
+        assert '4 orphaned report jobs marked failed.' in result.output
+        db.session.expire_all()
+        statuses = {job.id: (job.status, job.error) for job in ReportJob.query}
+        assert statuses['busy_queued'] == (ReportJob.QUEUED, None)
+        assert statuses['own_queued'] == (ReportJob.QUEUED, None)
+        for job_id in ('lost_queued', 'lost_running', 'reused_pid', 'unowned'):
+            assert statuses[job_id] == (ReportJob.FAILED, ORPHANED_JOB_ERROR)
+        assert not os.path.exists(partial_path)
+        assert not os.path.exists(_owner_lock_path(4343, 'gone'))
+
+        # Once the busy owner exits its jobs go on the next submit
+        busy_lock.close()
+        assert submit_job('export', {'entity': 'projects', 'format': 'csv', 'args': {}}).status == ReportJob.DONE
+        assert db.session.get(ReportJob, 'busy_queued').status == ReportJob.FAILED
+        assert fail_orphaned_jobs() == 0
+
+
+def test_job_of_crashed_pool_is_marked_failed(app):
+    with app.app_context():
+        db.session.add(ReportJob(id='crashed', kind='export', params='{}', status=ReportJob.RUNNING,
+                                 started_at=datetime.utcnow()))
+        db.session.commit()
+        future = Future()
+        future.set_exception(BrokenProcessPool('A process in the process pool was terminated abruptly'))
+        _job_finished(app, 'crashed', future)
+
+        db.session.expire_all()
+        job = db.session.get(ReportJob, 'crashed')
+        assert (job.status, job.error) == (ReportJob.FAILED, CRASHED_JOB_ERROR)
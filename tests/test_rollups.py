@@ -0,0 +1,105 @@
+import pytest
+from datetime import date, time, timedelta
+from models import db, Employee, Project, Timesheet, Material, Expense, Invoice, ProjectStatus, PaymentMethod, PaymentStatus
+from rollups import project_rollups, project_rollup, employee_hours_query, timesheet_hours_expr
+
+
+def _make_project_with_children(name, id_str, contract_value=8000.0):
+    """Create a project with a mix of timesheets, materials, expenses and invoices."""
+    employee = Employee(name=f"{name} Worker", employee_id_str=f"{id_str}-E", pay_rate=22.0, is_active=True)
+    project = Project(name=name, project_id_str=id_str, contract_value=contract_value,
+                      status=ProjectStatus.IN_PROGRESS)
+    db.session.add_all([employee, project])
+    db.session.flush()
+
+    saturday = date(2025, 4, 5)  # A Saturday
+    db.session.add_all([
+        # Regular day with a 45 minute lunch (0.5h deduction)
+        Timesheet(employee_id=employee.id, project_id=project.id, date=saturday - timedelta(days=2),
+                  entry_time=time(7, 0), exit_time=time(15, 30), lunch_duration_minutes=45),
+        # Saturday shift with a short lunch (no deduction, +$5/h premium)
+        Timesheet(employee_id=employee.id, project_id=project.id, date=saturday,
+                  entry_time=time(8, 15), exit_time=time(12, 45), lunch_duration_minutes=20),
+        # Overnight shift
+        Timesheet(employee_id=employee.id, project_id=project.id, date=saturday + timedelta(days=3),
+                  entry_time=time(22, 0), exit_time=time(6, 0), lunch_duration_minutes=60),
+        Material(project_id=project.id, description="Drywall", cost=1250.5, purchase_date=saturday),
+        Material(project_id=project.id, description="Paint", cost=310.25, purchase_date=saturday),
+        Expense(project_id=project.id, description="Permit", amount=150.0, date=saturday,
+                payment_method=PaymentMethod.CHECK, payment_status=PaymentStatus.PAID),
+        Invoice(project_id=project.id, invoice_number=f"{id_str}-1", invoice_date=saturday,
+                amount=4000.0, status=PaymentStatus.PAID, payment_received_date=saturday),
+        Invoice(project_id=project.id, invoice_number=f"{id_str}-2", invoice_date=saturday,
+                amount=2500.0, status=PaymentStatus.PENDING),
+    ])
+    db.session.commit()
+    return project
+
+
+def test_rollups_match_project_properties(app):
+    """Rollup figures match the Project cost properties."""
+    with app.app_context():
+        project = _make_project_with_children("Rollup Match", "RM001")
+        other = _make_project_with_children("Rollup Other", "RM002", contract_value=None)
+
+        rollups = project_rollups()
+        for p in (project, other):
+            rollup = rollups[p.id]
+            assert rollup.total_labor_cost == pytest.approx(p.total_labor_cost)
+            assert rollup.total_material_cost == pytest.approx(p.total_material_cost)
+            assert rollup.total_other_expenses == pytest.approx(p.total_other_expenses)
+            assert rollup.total_cost == pytest.approx(p.total_cost)
+            assert rollup.profit == pytest.approx(p.profit)
+            assert rollup.profit_margin == pytest.approx(p.profit_margin)
+            assert rollup.actual_revenue == pytest.approx(p.actual_revenue)
+            assert rollup.actual_net_profit == pytest.approx(p.actual_net_profit)
+            assert rollup.invoiced == pytest.approx(6500.0)
+            assert rollup.labor_hours == pytest.approx(sum(ts.calculated_hours for ts in p.timesheets))
+            assert rollup.labor_pay == pytest.approx(sum(ts.calculated_amount for ts in p.timesheets))
+
+
+def test_timesheet_hours_expression(app):
+    """The SQL hours expression matches Timesheet.calculated_hours row by row."""
+    with app.app_context():
+        _make_project_with_children("Hours Expr", "HE001")
+        rows = db.session.query(Timesheet, timesheet_hours_expr()).all()
+        assert len(rows) == 3
+        for timesheet, hours in rows:
+            assert hours == pytest.approx(timesheet.calculated_hours)
+
+
+def test_rollup_for_project_without_children(app):
+    """Projects with no children roll up to zero."""
+    with app.app_context():
+        project = Project(name="Empty Rollup", project_id_str="ER001", contract_value=1000.0,
+                          status=ProjectStatus.PENDING)
+        db.session.add(project)
+        db.session.commit()
+
+        rollup = project_rollup(project.id)
+        assert rollup.total_cost == 0
+        assert rollup.profit == 1000.0
+        assert rollup.profit_margin == 100.0
+        assert project_rollups([]) == {}
+
+
+def test_employee_hours_query_matches_week(app):
+    """Weekly employee hours follow the Friday-Thursday week and the lunch rules."""
+    with app.app_context():
+        project = _make_project_with_children("Weekly Hours", "WH001")
+        employee = Employee.query.filter_by(employee_id_str="WH001-E").one()
+        idle = Employee(name="Idle Worker", employee_id_str="WH001-I", pay_rate=18.0, is_active=True)
+        db.session.add(idle)
+        db.session.commit()
+
+        # Friday 2025-04-04 to Thursday 2025-04-10 holds the first three timesheets' week
+        week_start, week_end = date(2025, 4, 4), date(2025, 4, 10)
+        in_week = [ts for ts in project.timesheets if week_start <= ts.date <= week_end]
+        rows = {emp.id: (hours, pay, premium_pay) for emp, hours, pay, premium_pay
+                in employee_hours_query(week_start, week_end).filter(Employee.id.in_([employee.id, idle.id]))}
+
+        hours, pay, premium_pay = rows[employee.id]
+        assert hours == pytest.approx(sum(ts.calculated_hours for ts in in_week))
+        assert pay == pytest.approx(hours * employee.pay_rate)
+        assert premium_pay == pytest.approx(sum(ts.calculated_amount for ts in in_week))
+        assert rows[idle.id] == (0.0, 0.0, 0.0)
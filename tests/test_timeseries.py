@@ -0,0 +1,46 @@
+from datetime import date
+import pytest
+from models import db, Expense, Project, PaymentMethod, PaymentStatus
+from timeseries import bucket_start, bucket_starts, last_buckets, time_series
+
+
+def test_buckets_follow_the_calendar():
+    assert last_buckets(5, 'month', date(2025, 3, 31)) == (date(2024, 11, 1), date(2025, 3, 31))
+    assert bucket_starts(date(2024, 1, 31), date(2024, 3, 1), 'month') == [
+        date(2024, 1, 1), date(2024, 2, 1), date(2024, 3, 1)]
+    assert bucket_start(date(2025, 1, 8), 'week', week_start=4) == date(2025, 1, 3)  # Work weeks start on Friday
+    assert last_buckets(2, 'year', date(2025, 6, 1)) == (date(2024, 1, 1), date(2025, 12, 31))
+    with pytest.raises(ValueError):
+        bucket_start(date(2025, 1, 1), 'fortnight')
+
+
+def _expense(project, day, amount):
+    db.session.add(Expense(project_id=project.id, description='Trend expense', amount=amount, date=day,
+                           payment_method=PaymentMethod.CASH, payment_status=PaymentStatus.PAID))
+
+
+@pytest.mark.parametrize('bucket, week_start', [('day', 0), ('week', 0), ('week', 4), ('month', 0), ('year', 0)])
+def test_time_series_matches_python_buckets(app, bucket, week_start, seed_batch):
+    days = [date(2023, 12, 29), date(2024, 1, 2), date(2024, 1, 5), date(2024, 1, 31), date(2024, 3, 3)]
+    with app.app_context():
+        seed_batch(0)
+        project = Project.query.filter_by(name='Budget Project 0').first()
+        for amount, day in enumerate(days, 1):
+            _expense(project, day, amount)
+        db.session.commit()
+        try:
+            start, end = date(2023, 12, 25), date(2024, 3, 10)
+            series = time_series(Expense.date, start, end, bucket, value=Expense.amount,
+                                 filters=[Expense.description == 'Trend expense'], week_start=week_start)
+
+            expected = dict.fromkeys(bucket_starts(start, end, bucket, week_start), 0)
+            for amount, day in enumerate(days, 1):
+                expected[bucket_start(day, bucket, week_start)] += amount
+            assert series == list(expected.items())
+
+            counts = time_series(Expense.date, start, end, bucket, filters=[Expense.description == 'Trend expense'],
+                                 week_start=week_start)
+            assert sum(count for _, count in counts) == len(days)
+        finally:
+            Expense.query.filter_by(description='Trend expense').delete()
+            db.session.commit()
@@ -0,0 +1,86 @@
+import io
+from datetime import date, time
+import pandas as pd
+import pytest
+from models import db, Employee, Project, ProjectStatus, ProjectFinancial, Timesheet
+from timesheet_import import import_timesheets, ImportFileError
+
+PUNCHES = """Employee,Project,Date,In,Out,Lunch
+BW000,BP000,2025-01-04,07:00,15:30,45
+BW000,,01/06/2025,10:00 PM,6:00 AM,30
+BW001,BP000,2025-01-06,07:00,15:30,45
+BW000,BP001,2025-01-06,07:00,15:30,45
+BW000,BP000,2025-01-06,07:00,07:10,
+BW000,BP000,2025-01-06,07:00,15:00,75
+BW000,BP000,2025-01-06,07:00,07:20,20
+BW999,BP000,2025-01-06,07:00,15:30,45
+BW000,BP000,notadate,07:00,15:30,45
+"""
+
+
+def _setup(seed_batch):
+    seed_batch(0)
+    seed_batch(1)
+    Employee.query.filter_by(employee_id_str='BW001').one().is_active = False
+    Project.query.filter_by(project_id_str='BP001').one().status = ProjectStatus.COMPLETED
+    db.session.commit()
+
+
+def test_rows_get_the_is_valid_messages(app, count_queries, seed_batch):
+    with app.app_context():
+        _setup(seed_batch)
+        with count_queries() as counter:
+            result = import_timesheets(io.BytesIO(PUNCHES.encode()), 'punches.csv', dry_run=True)
+        assert counter['count'] == 2  # One lookup of the employees, one of the projects
+        assert (result.total, result.valid, result.inserted) == (9, 2, 0)
+        assert result.errors == [
+            (4, 'Cannot create timesheet for inactive employee.'),
+            (5, 'Cannot add timesheet to a project with status Completed.'),
+            (6, 'Shift must be at least 15 minutes long.'),
+            (7, 'Lunch break exceeds 60 minutes. Employee must speak to the manager for approval.'),
+            (8, 'Lunch break cannot be longer than the total shift.'),
+            (9, 'Unknown employee BW999.'),
+            (10, 'Invalid date notadate.'),
+        ]
+        assert Timesheet.query.filter(Timesheet.date < date(2025, 2, 1)).count() == 0
+
+
+def test_valid_rows_are_inserted_with_totals(app, seed_batch):
+    with app.app_context():
+        _setup(seed_batch)
+        project = Project.query.filter_by(project_id_str='BP000').one()
+        labor_before = db.session.get(ProjectFinancial, project.id).labor_cost
+
+        result = import_timesheets(io.BytesIO(PUNCHES.encode()), 'punches.csv')
+        assert result.inserted == 2
+
+        saturday, overnight = Timesheet.query.filter(Timesheet.date < date(2025, 2, 1)).order_by(Timesheet.date)
+        assert (saturday.project_id, saturday.entry_time, saturday.exit_time) == (project.id, time(7), time(15, 30))
+        assert overnight.project_id is None and overnight.exit_time == time(6)
+        for timesheet in (saturday, overnight):
+            # Same figures the ORM would have stored
+            assert timesheet.worked_hours == pytest.approx(timesheet.calculated_hours)
+            assert timesheet.pay_amount == pytest.approx(timesheet.calculated_amount)
+        db.session.expire_all()
+        assert db.session.get(ProjectFinancial, project.id).labor_cost == pytest.approx(labor_before + 8 * 20)
+
+
+def test_excel_upload_and_bad_files(app, client, login, seed_batch):
+    with app.app_context():
+        login(client)
+        _setup(seed_batch)
+        excel = io.BytesIO()
+        pd.DataFrame({'employee_id': ['BW000'], 'project_id': ['BP000'], 'date': [date(2025, 1, 7)],
+                      'entry_time': [time(8)], 'exit_time': [time(12)]}).to_excel(excel, index=False)
+        excel.seek(0)
+        response = client.post('/timesheets/import', data={'timesheet_file': (excel, 'punches.xlsx')},
+                               content_type='multipart/form-data')
+        assert response.status_code == 200
+        assert b'1 timesheet entries imported.' in response.data
+        assert Timesheet.query.filter_by(date=date(2025, 1, 7)).one().worked_hours == 4
+
+        with pytest.raises(ImportFileError, match='Missing column'):
+            import_timesheets(io.BytesIO(b'employee,date\nBW000,2025-01-07\n'), 'punches.csv')
+        response = client.post('/timesheets/import', data={'timesheet_file': (io.BytesIO(b'x'), 'punches.pdf')},
+                               content_type='multipart/form-data', follow_redirects=True)
+        assert b'Only .csv, .xlsx and .xls files can be imported.' in response.data
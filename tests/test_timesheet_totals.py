@@ -0,0 +1,69 @@
+import pytest
+from datetime import date, time
+from models import db, Employee, Project, Timesheet, ProjectStatus
+from rollups import refresh_timesheet_totals
+
+SATURDAY = date(2025, 4, 5)
+FRIDAY = date(2025, 4, 4)
+
+
+def _make_timesheet(entry=time(7, 0), exit=time(15, 30), lunch=45, day=FRIDAY):
+    employee = Employee(name="Totals Worker", employee_id_str="TT-E1", pay_rate=20.0, is_active=True)
+    project = Project(name="Totals Project", project_id_str="TT-P1", contract_value=1000.0,
+                      status=ProjectStatus.IN_PROGRESS)
+    db.session.add_all([employee, project])
+    db.session.flush()
+    timesheet = Timesheet(employee_id=employee.id, project_id=project.id, date=day,
+                          entry_time=entry, exit_time=exit, lunch_duration_minutes=lunch)
+    db.session.add(timesheet)
+    db.session.commit()
+    return timesheet
+
+
+def test_totals_stored_on_insert(app):
+    with app.app_context():
+        timesheet = _make_timesheet()
+        assert timesheet.worked_hours == pytest.approx(8.0)  # 8.5h minus the 0.5h lunch deduction
+        assert timesheet.pay_amount == pytest.approx(160.0)
+        assert timesheet.worked_hours == pytest.approx(timesheet.calculated_hours)
+        assert timesheet.pay_amount == pytest.approx(timesheet.calculated_amount)
+
+
+def test_totals_follow_shift_changes(app):
+    with app.app_context():
+        timesheet = _make_timesheet()
+        timesheet.exit_time = time(12, 0)
+        timesheet.lunch_duration_minutes = 20
+        timesheet.date = SATURDAY
+        db.session.commit()
+
+        timesheet = db.session.get(Timesheet, timesheet.id)
+        assert timesheet.worked_hours == pytest.approx(5.0)
+        assert timesheet.pay_amount == pytest.approx(5.0 * 25.0)  # Saturday premium
+
+
+def test_pay_rate_change_reprices_timesheets(app):
+    with app.app_context():
+        timesheet = _make_timesheet(day=SATURDAY)
+        timesheet_id = timesheet.id
+        employee = timesheet.employee
+        employee.pay_rate = 30.0
+        db.session.commit()
+
+        # The loaded object and the table agree on the new amount
+        assert timesheet.pay_amount == pytest.approx(8.0 * 35.0)
+        stored = db.session.query(Timesheet.pay_amount).filter(Timesheet.id == timesheet_id).scalar()
+        assert stored == pytest.approx(8.0 * 35.0)
+
+
+def test_refresh_timesheet_totals_backfills(app):
+    with app.app_context():
+        timesheet = _make_timesheet(entry=time(22, 0), exit=time(6, 0), lunch=60, day=SATURDAY)
+        db.session.execute(db.update(Timesheet).values(worked_hours=None, pay_amount=None))
+        db.session.commit()
+
+        assert refresh_timesheet_totals() >= 1
+        db.session.commit()
+        timesheet = db.session.get(Timesheet, timesheet.id)
+        assert timesheet.worked_hours == pytest.approx(7.5)
+        assert timesheet.pay_amount == pytest.approx(timesheet.calculated_amount)
@@ -0,0 +1,128 @@
+"""Time-bucketed aggregates for trend charts.
+
+time_series() answers "sum (or count) of a column per day, week, month or
+year over a date range" with a single GROUP BY query. Buckets are real
+calendar periods, named by their first day, and every bucket in the range
+is returned, with 0 where there were no rows, so a chart gets one value per
+label without further work. totals_by() is the same kind of query grouped
+by a category or vendor column instead of by date.
+"""
+from datetime import date, timedelta
+
+from models import db
+
+BUCKETS = ('day', 'week', 'month', 'year')
+
+
+def bucket_start(day, bucket, week_start=0):
+    """First day of the bucket containing `day`.
+
+    Args:
+        week_start: Weekday weeks start on (Monday=0, like date.weekday());
+            the work week starts on Friday (4)
+    """
+    if bucket == 'day':
+        return day
+    if bucket == 'week':
+        return day - timedelta(days=(day.weekday() - week_start) % 7)
+    if bucket == 'month':
+        return day.replace(day=1)
+    if bucket == 'year':
+        return day.replace(month=1, day=1)
+    raise ValueError(f'Unknown time bucket: {bucket}')
+
+
+def next_bucket(start, bucket):
+    """First day of the bucket after the one starting on `start`."""
+    if bucket == 'day':
+        return start + timedelta(days=1)
+    if bucket == 'week':
+        return start + timedelta(days=7)
+    if bucket == 'month':
+        return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+    if bucket == 'year':
+        return start.replace(year=start.year + 1)
+    raise ValueError(f'Unknown time bucket: {bucket}')
+
+
+def bucket_starts(start, end, bucket, week_start=0):
+    """First days of every bucket overlapping start..end (inclusive), in order."""
+    starts = []
+    current = bucket_start(start, bucket, week_start)
+    while current <= end:
+        starts.append(current)
+        current = next_bucket(current, bucket)
+    return starts
+
+
+def last_buckets(count, bucket, today=None, week_start=0):
+    """(start, end) date range of the `count` buckets ending with the current one."""
+    today = today or date.today()
+    start = bucket_start(today, bucket, week_start)
+    for _ in range(count - 1):
+        start = bucket_start(start - timedelta(days=1), bucket, week_start)
+    end = next_bucket(bucket_start(today, bucket, week_start), bucket) - timedelta(days=1)
+    return start, end
+
+
+def bucket_expr(column, bucket, week_start=0):
+    """SQL expression giving the ISO date of the bucket a date column falls in."""
+    if bucket == 'day':
+        return db.func.date(column)
+    if bucket == 'week':
+        # SQLite's %w counts from Sunday = 0
+        sqlite_week_start = (week_start + 1) % 7
+        days_back = (db.cast(db.func.strftime('%w', column), db.Integer) - sqlite_week_start + 7) % 7
+        return db.func.date(column, '-' + db.cast(days_back, db.String) + ' days')
+    if bucket == 'month':
+        return db.func.strftime('%Y-%m-01', column)
+    if bucket == 'year':
+        return db.func.strftime('%Y-01-01', column)
+    raise ValueError(f'Unknown time bucket: {bucket}')
+
+
+def time_series(date_column, start, end, bucket='month', value=None, filters=(), week_start=0):
+    """Sum of `value` (or the row count when value is None) per bucket over
+    start..end, in one query.
+
+    Args:
+        date_column: Column the rows are bucketed by
+        value: Column or expression to sum
+        filters: Extra WHERE criteria
+    Returns:
+        List of (bucket start date, total) for every bucket overlapping the
+        range, in order, with 0 for empty buckets
+    """
+    bucket_key = bucket_expr(date_column, bucket, week_start).label('bucket')
+    total = db.func.count() if value is None else db.func.sum(value)
+    query = (
+        db.select(bucket_key, total.label('total'))
+        .where(date_column >= start, date_column < end + timedelta(days=1), *filters)
+        .group_by(bucket_key)
+    )
+    totals = {row.bucket: row.total or 0 for row in db.session.execute(query)}
+    return [(day, totals.get(day.isoformat(), 0)) for day in bucket_starts(start, end, bucket, week_start)]
+
+
+def period_range(year, month=None):
+    """(start, end) dates of a calendar year, or of one month of it."""
+    if month is None:
+        return date(year, 1, 1), date(year, 12, 31)
+    start = date(year, month, 1)
+    return start, next_bucket(start, 'month') - timedelta(days=1)
+
+
+def totals_by(key, date_column, start, end, value=None, filters=()):
+    """Sum of `value` (or the row count when value is None) per distinct
+    `key` over start..end, in one query.
+
+    Returns:
+        Dict of key value -> total, for the keys that have rows
+    """
+    total = db.func.count() if value is None else db.func.sum(value)
+    query = (
+        db.select(key.label('key'), total.label('total'))
+        .where(date_column >= start, date_column < end + timedelta(days=1), *filters)
+        .group_by(key)
+    )
+    return {row.key: row.total or 0 for row in db.session.execute(query)}
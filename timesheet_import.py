@@ -0,0 +1,232 @@
+"""Bulk timesheet import from CSV or Excel files.
+
+A file holds one punch per row:
+
+    employee, project, date, entry_time, exit_time, lunch_duration_minutes
+
+`employee` and `project` are the employee/project ID strings (BW001) or
+database ids; `project` and the lunch column may be left empty. Header names
+are matched case-insensitively, with a few aliases (employee_id, in, out,
+lunch, ...).
+
+The whole file is loaded into a pandas frame and checked against the rules of
+Timesheet.is_valid() column-wise, with one query for all the employees and one
+for all the projects it mentions, instead of two lookups per row. Rows that
+pass are inserted with a single executemany in one transaction; the others
+are reported back with their row number and the same message is_valid() would
+have given.
+"""
+import os
+
+import pandas as pd
+
+from models import db, Employee, Project, ProjectStatus, Timesheet, SATURDAY_PREMIUM
+from rollups import refresh_project_financials
+
+IMPORT_EXTENSIONS = ('.csv', '.xlsx', '.xls')
+
+# Accepted header spellings of each column
+COLUMN_ALIASES = {
+    'employee': ('employee', 'employee_id', 'employee id', 'employee_id_str'),
+    'project': ('project', 'project_id', 'project id', 'project_id_str'),
+    'date': ('date', 'work_date'),
+    'entry_time': ('entry_time', 'entry', 'in', 'time_in'),
+    'exit_time': ('exit_time', 'exit', 'out', 'time_out'),
+    'lunch_duration_minutes': ('lunch_duration_minutes', 'lunch', 'lunch_minutes'),
+}
+REQUIRED_COLUMNS = ('employee', 'date', 'entry_time', 'exit_time')
+
+# Same limits as Timesheet.is_valid()
+MIN_SHIFT_MINUTES = 15
+MAX_LUNCH_MINUTES = 60
+OPEN_PROJECT_STATUSES = (ProjectStatus.PENDING, ProjectStatus.IN_PROGRESS)
+
+
+class ImportFileError(ValueError):
+    """The file can't be read as a timesheet import at all."""
+
+
+class ImportResult:
+    """Outcome of an import.
+
+    Attributes:
+        total: Data rows in the file
+        inserted: Rows written (0 for a dry run)
+        valid: Rows that passed validation
+        errors: List of (row number, message), row 2 being the first data row
+    """
+
+    def __init__(self, total, valid, inserted, errors):
+        self.total = total
+        self.valid = valid
+        self.inserted = inserted
+        self.errors = errors
+
+
+def read_punches(file, filename):
+    """Load an uploaded CSV or Excel file into a frame with the canonical
+    column names, everything as text."""
+    extension = os.path.splitext(filename.lower())[1]
+    if extension not in IMPORT_EXTENSIONS:
+        raise ImportFileError('Only .csv, .xlsx and .xls files can be imported.')
+    try:
+        if extension == '.csv':
+            frame = pd.read_csv(file, dtype=str, keep_default_na=False)
+        else:
+            frame = pd.read_excel(file, dtype=str, keep_default_na=False)
+    except (ValueError, OSError) as e:
+        raise ImportFileError(f'Could not read {filename}: {e}')
+
+    headers = {str(column).strip().lower(): column for column in frame.columns}
+    renames = {}
+    for name, aliases in COLUMN_ALIASES.items():
+        found = next((headers[alias] for alias in aliases if alias in headers), None)
+        if found is not None:
+            renames[found] = name
+    missing = [name for name in REQUIRED_COLUMNS if name not in renames.values()]
+    if missing:
+        raise ImportFileError(f"Missing column(s): {', '.join(missing)}")
+
+    frame = frame[list(renames)].rename(columns=renames)
+    for name in COLUMN_ALIASES:
+        if name not in frame:
+            frame[name] = ''
+    frame = frame.apply(lambda column: column.astype(str).str.strip())
+    # Row numbers as seen in a spreadsheet, under the header row
+    frame.index = pd.RangeIndex(2, len(frame) + 2, name='row')
+    return frame
+
+
+def lookup_frame(rows, columns, keys=('id',)):
+    """Frame of already loaded employee or project rows for
+    validate_punches(), indexed by the string form of each of `keys`."""
+    found = pd.DataFrame([tuple(row) for row in rows], columns=columns)
+    # Later keys win (ID strings over database ids that happen to look the same)
+    frames = [found.assign(key=found[key].astype(str)) for key in keys]
+    return pd.concat(frames).drop_duplicates('key', keep='last').set_index('key')
+
+
+def _lookup(id_column, string_column, keys, *columns):
+    """Lookup frame of the rows matching any of `keys` by database id or by
+    ID string, in one query."""
+    keys = {key for key in keys if key}
+    numeric = {int(key) for key in keys if key.isdigit()}
+    columns = [id_column, string_column, *columns]
+    rows = db.session.execute(
+        db.select(*columns).where(db.or_(string_column.in_(keys), id_column.in_(numeric)))
+    ).all() if keys else []
+    return lookup_frame(rows, [column.key for column in columns], keys=('id', string_column.key))
+
+
+def _parse_times(column):
+    """Times of day from text such as 07:00, 7:00 AM or 15:30:00."""
+    parsed = pd.to_datetime(column, format='mixed', errors='coerce')
+    return parsed.dt.hour * 60 + parsed.dt.minute + parsed.dt.second / 60
+
+
+def validate_punches(frame, employees=None, projects=None):
+    """Apply the Timesheet.is_valid() rules to every row of `frame`.
+
+    Args:
+        employees, projects: Lookup frames indexed by the keys used in the
+            frame (see lookup_frame), for callers that already loaded them;
+            queried when omitted
+    Returns:
+        (rows, errors): `rows` are the valid rows as Timesheet table values
+        (stored totals included), `errors` a Series of the first error
+        message of each invalid row, indexed by row number
+    """
+    errors = pd.Series(pd.NA, index=frame.index, dtype=object)
+
+    def fail(mask, message):
+        # Only the first failing rule of a row is reported, as in is_valid()
+        mask = mask & errors.isna()
+        errors[mask] = message if isinstance(message, str) else message[mask]
+
+    if employees is None:
+        employees = _lookup(Employee.id, Employee.employee_id_str, frame['employee'],
+                            Employee.is_active, Employee.pay_rate)
+    if projects is None:
+        projects = _lookup(Project.id, Project.project_id_str, frame['project'], Project.status)
+    employee = employees.reindex(frame['employee']).set_axis(frame.index)
+    project = projects.reindex(frame['project']).set_axis(frame.index)
+
+    dates = pd.to_datetime(frame['date'], format='mixed', errors='coerce')
+    entry = _parse_times(frame['entry_time'])
+    exit_ = _parse_times(frame['exit_time'])
+    lunch = pd.to_numeric(frame['lunch_duration_minutes'].replace('', '0'), errors='coerce')
+
+    fail(frame['employee'] == '', 'Employee is missing.')
+    fail(employee['id'].isna(), 'Unknown employee ' + frame['employee'] + '.')
+    fail((frame['project'] != '') & project['id'].isna(), 'Unknown project ' + frame['project'] + '.')
+    fail(frame['date'] == '', 'Date is missing.')
+    fail(dates.isna(), 'Invalid date ' + frame['date'] + '.')
+    fail(frame['entry_time'] == '', 'Entry time is missing.')
+    fail(entry.isna(), 'Invalid entry time ' + frame['entry_time'] + '.')
+    fail(frame['exit_time'] == '', 'Exit time is missing.')
+    fail(exit_.isna(), 'Invalid exit time ' + frame['exit_time'] + '.')
+    fail(lunch.isna() | (lunch < 0) | (lunch % 1 != 0),
+         'Invalid lunch duration ' + frame['lunch_duration_minutes'] + '.')
+
+    fail(employee['is_active'].eq(False), 'Cannot create timesheet for inactive employee.')
+    # Exit at or before entry is an overnight shift
+    shift_minutes = exit_ - entry
+    shift_minutes = shift_minutes.where(shift_minutes > 0, shift_minutes + 24 * 60)
+    fail(shift_minutes < MIN_SHIFT_MINUTES, f'Shift must be at least {MIN_SHIFT_MINUTES} minutes long.')
+    fail(lunch > MAX_LUNCH_MINUTES,
+         f'Lunch break exceeds {MAX_LUNCH_MINUTES} minutes. Employee must speak to the manager for approval.')
+    fail(lunch >= shift_minutes, 'Lunch break cannot be longer than the total shift.')
+    status = project['status']
+    closed = status.notna() & ~status.isin(OPEN_PROJECT_STATUSES)
+    fail(closed, 'Cannot add timesheet to a project with status '
+         + status.map(lambda value: getattr(value, 'value', '')) + '.')
+
+    valid = errors.isna()
+    # Stored totals, as Timesheet.update_totals() computes them
+    raw_minutes = (exit_ - entry).where(exit_ >= entry, exit_ - entry + 24 * 60)
+    worked_hours = raw_minutes / 60 - lunch.between(31, MAX_LUNCH_MINUTES) * 0.5
+    rate = employee['pay_rate'] + (dates.dt.weekday == 5) * SATURDAY_PREMIUM
+
+    def to_time(minutes):
+        return pd.to_datetime((minutes * 60).round(), unit='s').dt.time
+
+    rows = pd.DataFrame({
+        'employee_id': employee['id'],
+        'project_id': project['id'],
+        'date': dates.dt.date,
+        'entry_time': to_time(entry.where(valid, 0)),
+        'exit_time': to_time(exit_.where(valid, 0)),
+        'lunch_duration_minutes': lunch,
+        'worked_hours': worked_hours,
+        'pay_amount': worked_hours * rate,
+    })[valid]
+    rows = rows.astype({'employee_id': int, 'lunch_duration_minutes': int})
+    rows['project_id'] = [None if pd.isna(value) else int(value) for value in rows['project_id']]
+    return rows, errors[~valid]
+
+
+def import_timesheets(file, filename, dry_run=False):
+    """Validate an uploaded punch file and insert its valid rows.
+
+    Args:
+        dry_run: Only validate; nothing is written
+    Raises:
+        ImportFileError: The file can't be read or lacks required columns
+    """
+    frame = read_punches(file, filename)
+    rows, errors = validate_punches(frame)
+    error_list = list(errors.items())
+    if dry_run or rows.empty:
+        return ImportResult(len(frame), len(rows), 0, error_list)
+
+    records = rows.to_dict('records')
+    try:
+        # Core executemany: no ORM objects, and the stored totals are already
+        # computed, so the before_insert hook isn't needed
+        db.session.execute(Timesheet.__table__.insert(), records)
+        refresh_project_financials(rows['project_id'].dropna().unique().tolist())
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return ImportResult(len(frame), len(rows), len(records), error_list)